@@ -0,0 +1,110 @@
+"""Microbenchmarks of the feed parser and the site builder at several archive sizes.
+
+Measures parse_feed (whole feed and newest 3), _extract_image_from_entry over
+every entry, load_episodes (cold: no catalogue yet; warm) and publish_site
+(cold: empty site; warm: nothing changed) for each scale.
+
+Usage: python -m benchmarks.bench_micro [--scales 10,1000,10000] [--repeat 3] [--baseline]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import feedparser
+
+from src.feed_watcher import _extract_image_from_entry, parse_feed
+from src.publisher import load_episodes, publish_site
+from src.utils import write_json
+
+from .bench_parse_feed import synthetic_feed
+from .fakes import REFERENCES, WORDS
+from .results import add_arguments, best_of, record
+
+
+def write_episodes(episodes_dir: str, n: int, seed: int = 1):
+    """`n` episode directories with meta, summary and a short transcript, as the pipeline writes them."""
+    rnd = random.Random(seed)
+    for i in range(n):
+        ep_id = "sermon-%05d" % i
+        ep_dir = os.path.join(episodes_dir, ep_id)
+        ts = 1262304000 + rnd.randrange(0, 15 * 365 * 86400)
+        write_json(os.path.join(ep_dir, "meta.json"), {
+            "id": ep_id, "guid": "urn:sermon:%d" % i, "title": "Sermon %d on %s" % (i, rnd.choice(WORDS)),
+            "link": "https://example.org/sermons/%d" % i,
+            "published": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(ts)), "published_ts": ts,
+            "feed_audio_url": "https://example.org/audio/%d.mp3" % i, "image_url": "https://example.org/%d.jpg" % i,
+        })
+        write_json(os.path.join(ep_dir, "summary.json"), {
+            "overall_theme": " ".join(rnd.choice(WORDS) for _ in range(30)),
+            "quotes": [" ".join(rnd.choice(WORDS) for _ in range(12)) for _ in range(4)],
+            "bible_passages": rnd.sample(REFERENCES, 2),
+            "follow_on_questions": ["What does %s mean today?" % rnd.choice(WORDS)],
+            "further_bible_passages": [{"ref": rnd.choice(REFERENCES), "rationale": "Same theme."}],
+        })
+        text = " ".join(rnd.choice(WORDS) for _ in range(400))
+        write_json(os.path.join(ep_dir, "transcript.json"), {"text": text, "chunks": [{"start": 0, "text": text}]})
+
+
+def bench_scale(n: int, repeat: int, work_dir: str) -> dict:
+    out = {}
+    body = synthetic_feed(n)
+    out["parse_feed.full[%d]" % n] = best_of(lambda: parse_feed(body), repeat)
+    out["parse_feed.newest3[%d]" % n] = best_of(lambda: parse_feed(body, limit=3), repeat)
+    entries = feedparser.parse(body).entries
+    out["extract_image_from_entry[%d]" % n] = best_of(lambda: [_extract_image_from_entry(e) for e in entries], repeat)
+
+    episodes_dir = os.path.join(work_dir, "episodes-%d" % n)
+    write_episodes(episodes_dir, n)
+    catalogue = os.path.join(episodes_dir, "catalogue.json")
+
+    def drop_catalogue():
+        if os.path.exists(catalogue):
+            os.remove(catalogue)
+
+    out["load_episodes.cold[%d]" % n] = best_of(lambda: load_episodes(episodes_dir), repeat, setup=drop_catalogue)
+    load_episodes(episodes_dir)
+    out["load_episodes.warm[%d]" % n] = best_of(lambda: load_episodes(episodes_dir), repeat)
+
+    site_dir = os.path.join(work_dir, "site-%d" % n)
+    cache_dir = os.path.join(work_dir, "cache-%d" % n)
+
+    def publish():
+        publish_site(site_dir, load_episodes(episodes_dir), "Bench", "Benchmark site",
+                     search_cache_dir=os.path.join(cache_dir, "search"),
+                     bible_index_path=os.path.join(cache_dir, "bible_index.json"))
+
+    def clear_site():
+        shutil.rmtree(site_dir, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    out["publish_site.cold[%d]" % n] = best_of(publish, repeat, setup=clear_site)
+    out["publish_site.warm[%d]" % n] = best_of(publish, repeat)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="10,1000,10000", help="comma-separated episode counts")
+    ap.add_argument("--repeat", type=int, default=3)
+    add_arguments(ap)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    measurements = {}
+    work_dir = tempfile.mkdtemp(prefix="bench-micro-")
+    try:
+        for n in scales:
+            print("Scale %d..." % n, flush=True)
+            measurements.update(bench_scale(n, args.repeat, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    raise SystemExit(record("micro", measurements, {"scales": scales, "repeat": args.repeat}, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare full vs streaming newest-N parsing on a synthetic archive feed.
+
+Usage: python -m benchmarks.bench_parse_feed [--items 10000] [--limit 3]
+"""
+import argparse
+import random
+import time
+
+from src.feed_watcher import parse_feed
+
+
+def synthetic_feed(n_items: int, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n_items):
+        # Shuffled publish dates so the newest items are not simply first
+        ts = time.gmtime(1262304000 + rnd.randrange(0, 15 * 365 * 86400))
+        pub = time.strftime("%a, %d %b %Y %H:%M:%S GMT", ts)
+        items.append(
+            f"<item><title>Sermon {i}</title><guid>urn:sermon:{i}</guid>"
+            f"<link>https://example.org/sermons/{i}</link><pubDate>{pub}</pubDate>"
+            f"<description>&lt;p&gt;Notes for sermon {i}&lt;/p&gt;&lt;img src=\"https://example.org/{i}.jpg\"&gt;</description>"
+            f"<itunes:duration>00:42:10</itunes:duration>"
+            f"<enclosure url=\"https://example.org/audio/{i}.mp3\" type=\"audio/mpeg\" length=\"40000000\"/></item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"><channel>'
+        '<title>Archive</title><itunes:image href="https://example.org/feed.png"/>'
+        + "".join(items)
+        + "</channel></rss>"
+    ).encode("utf-8")
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--items", type=int, default=10000)
+    ap.add_argument("--limit", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    body = synthetic_feed(args.items)
+
+    def full():
+        eps = parse_feed(body)
+        eps.sort(key=lambda e: e.get("published_ts", 0), reverse=True)
+        return eps[:args.limit]
+
+    def streaming():
+        return parse_feed(body, limit=args.limit)
+
+    assert [e["guid"] for e in full()] == [e["guid"] for e in streaming()]
+    t_full = best_of(full, args.repeat)
+    t_stream = best_of(streaming, args.repeat)
+    print(f"feed: {args.items} items, {len(body) / 1024:.0f} KiB, newest {args.limit}")
+    print(f"full parse + sort : {t_full * 1000:9.1f} ms")
+    print(f"streaming top-N   : {t_stream * 1000:9.1f} ms  ({t_full / t_stream:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""End-to-end pipeline benchmark against local fakes: no network, no API key, no cost.
+
+Generates audio with ffmpeg, serves it from synthetic RSS feeds on a local
+HTTP server, points the OpenAI client at `fakes.FakeOpenAI` and runs
+`src.main.main` in a scratch directory twice: a first run that processes
+every episode, then a second run with nothing new (conditional feed GETs
+and an incremental publish). Stage timings come from the run reports
+written by `src.metrics`.
+
+Usage: python -m benchmarks.bench_pipeline [--feeds 2] [--episodes 3] [--audio-seconds 300]
+                                           [--latency 0.2] [--error-rate 0.02] [--throttle-rate 0.05]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+from .fakes import FakeOpenAI, StaticServer, make_audio, rss
+from .results import add_arguments, record
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_feeds(server: StaticServer, work_dir: str, feeds: int, episodes: int, audio_seconds: float) -> list:
+    urls = []
+    now = int(time.time())
+    for f in range(feeds):
+        items = []
+        for e in range(episodes):
+            path = os.path.join(work_dir, "audio-%d-%d.mp3" % (f, e))
+            # A different tone per episode so no two files share a chunk-cache key
+            make_audio(path, audio_seconds, frequency=220 + 20 * (f * episodes + e))
+            with open(path, "rb") as fh:
+                audio = fh.read()
+            items.append({
+                "title": "Feed %d sermon %d" % (f, e), "guid": "urn:bench:%d:%d" % (f, e),
+                "link": "%s/sermons/%d/%d" % (server.url, f, e), "pub_ts": now - (f * episodes + e) * 86400,
+                "audio_url": server.add("/audio/%d/%d.mp3" % (f, e), audio, "audio/mpeg"),
+                "audio_length": len(audio),
+            })
+        urls.append(server.add("/feeds/%d.xml" % f, rss("Bench feed %d" % f, items,
+                                                         image_url=server.url + "/feed.png"),
+                               "application/rss+xml"))
+    return urls
+
+
+def write_config(work_dir: str, feed_urls: list, api: FakeOpenAI, args: argparse.Namespace):
+    with open(os.path.join(REPO_ROOT, "config.example.yml"), "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg["feeds"] = feed_urls
+    cfg["openai"]["base_url"] = api.base_url
+    cfg["pipeline"]["per_feed_limit"] = args.episodes
+    cfg["cache"] = {"dir": "data/cache", "transcripts_max_mb": 0, "summaries_max_mb": 0}
+    cfg["metrics"] = {"runs_dir": "logs/runs", "keep_runs": 0}
+    with open(os.path.join(work_dir, "config.yml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f)
+    shutil.copyfile(os.path.join(REPO_ROOT, "prompt.example.txt"), os.path.join(work_dir, "prompt.txt"))
+    shutil.copytree(os.path.join(REPO_ROOT, "templates"), os.path.join(work_dir, "templates"))
+
+
+def run_pipeline(work_dir: str) -> dict:
+    """Run `src.main.main` in `work_dir`; returns its metrics report plus the wall-clock time."""
+    from src import main as pipeline_main
+
+    before = set(glob.glob(os.path.join(work_dir, "logs", "runs", "*.json")))
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        start = time.perf_counter()
+        pipeline_main.main()
+        wall = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    (path,) = set(glob.glob(os.path.join(work_dir, "logs", "runs", "*.json"))) - before
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    report["wall_seconds"] = wall
+    return report
+
+
+def measurements_from(prefix: str, report: dict) -> dict:
+    out = {prefix + ".wall": report["wall_seconds"]}
+    for name, span in report["spans"].items():
+        out["%s.%s" % (prefix, name)] = span["seconds"]
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--feeds", type=int, default=2)
+    ap.add_argument("--episodes", type=int, default=3, help="episodes per feed")
+    ap.add_argument("--audio-seconds", type=float, default=300)
+    ap.add_argument("--latency", type=float, default=0.2, help="fake API seconds per request")
+    ap.add_argument("--seconds-per-mb", type=float, default=0.5, help="extra fake API seconds per MB uploaded")
+    ap.add_argument("--error-rate", type=float, default=0.02, help="share of API requests answered 500")
+    ap.add_argument("--throttle-rate", type=float, default=0.05, help="share of API requests answered 429")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory and print its path")
+    ap.add_argument("--verbose", action="store_true", help="show the pipeline's log output")
+    add_arguments(ap)
+    args = ap.parse_args()
+    # Configured before src.main so its setup_logging() leaves this level alone
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    work_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    params = {k: getattr(args, k) for k in ("feeds", "episodes", "audio_seconds", "latency", "seconds_per_mb",
+                                            "error_rate", "throttle_rate", "seed")}
+    try:
+        with StaticServer() as host, FakeOpenAI(latency=args.latency, error_rate=args.error_rate,
+                                                throttle_rate=args.throttle_rate,
+                                                seconds_per_mb=args.seconds_per_mb, seed=args.seed) as api:
+            feed_urls = build_feeds(host, work_dir, args.feeds, args.episodes, args.audio_seconds)
+            write_config(work_dir, feed_urls, api, args)
+            first = run_pipeline(work_dir)
+            second = run_pipeline(work_dir)
+        processed = first["counters"].get("episodes_processed", 0)
+        print("First run: %d/%d episodes processed; fake API saw %s" % (
+            processed, args.feeds * args.episodes, json.dumps(api.stats)))
+        if processed != args.feeds * args.episodes:
+            print("WARNING: not every episode was processed; see the run report in %s" % work_dir)
+        measurements = measurements_from("first_run", first)
+        measurements.update(measurements_from("second_run", second))
+    finally:
+        if args.keep:
+            print("Scratch directory: %s" % work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    raise SystemExit(record("pipeline", measurements, params, args))
+
+
+if __name__ == "__main__":
+    main()
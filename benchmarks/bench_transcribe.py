@@ -0,0 +1,136 @@
+"""Transcription throughput per backend, as a real-time factor (wall seconds per second of audio; lower is better).
+
+Cuts one recording into chunks with the pipeline's own segmenter and
+transcribes them through each backend the way an episode would be
+(`transcriber.transcribe_chunks`, `--max-in-flight` at a time):
+
+  openai          the API path; against `fakes.FakeOpenAI` (latency plus
+                  upload time per MB) unless --real-api is given, which sends
+                  real, billed requests to OpenAI
+  faster-whisper  the local CPU engine (`src.local_whisper`); skipped if
+                  faster-whisper is not installed. The first repeat includes
+                  loading the model in each worker process.
+
+Generated test audio is tones and pauses, which Whisper's voice activity
+filter mostly skips, so pass --audio with a real sermon for numbers that mean
+anything for the local engine.
+
+Usage: python -m benchmarks.bench_transcribe [--audio sermon.mp3] [--audio-seconds 600]
+                                             [--backends openai,faster-whisper] [--workers 0] [--batch-size 8]
+"""
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from .fakes import FakeOpenAI, make_audio
+from .results import add_arguments, best_of, record
+
+
+def audio_seconds(path: str) -> float:
+    from src.transcriber import detect_silences
+
+    _, seconds = detect_silences(path)
+    return seconds
+
+
+def bench_openai(chunks: list, seconds: float, args: argparse.Namespace) -> dict:
+    from src import openai_pool
+    from src.transcriber import OpenAIBackend
+
+    if args.real_api:
+        openai_pool.configure({})
+        return run(OpenAIBackend(args.model), "openai", chunks, seconds, args)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    with FakeOpenAI(latency=args.latency, seconds_per_mb=args.seconds_per_mb) as api:
+        openai_pool.configure({"base_url": api.base_url})
+        return run(OpenAIBackend(args.model), "openai", chunks, seconds, args)
+
+
+def bench_faster_whisper(chunks: list, seconds: float, args: argparse.Namespace) -> dict:
+    from src import local_whisper
+
+    if local_whisper.faster_whisper is None:
+        print("faster-whisper is not installed; skipping the local backend (pip install faster-whisper)")
+        return {}
+    backend = local_whisper.FasterWhisperBackend({
+        "model": args.fw_model, "compute_type": args.compute_type, "workers": args.workers,
+        "cpu_threads": args.cpu_threads, "batch_size": args.batch_size,
+    })
+    try:
+        return run(backend, "faster_whisper", chunks, seconds, args)
+    finally:
+        backend.close()
+
+
+def run(backend, prefix: str, chunks: list, seconds: float, args: argparse.Namespace) -> dict:
+    from src.transcriber import transcribe_chunks
+
+    texts = []
+    wall = best_of(lambda: texts.append(transcribe_chunks(backend, args.model, chunks, args.language,
+                                                          max_in_flight=args.max_in_flight)), args.repeat)
+    words = len(" ".join(texts[-1]).split())
+    print("%-16s %6.1fs for %.0fs of audio: RTF %.3f, %d words" % (backend.name, wall, seconds, wall / seconds, words))
+    return {prefix + ".seconds": wall, prefix + ".rtf": wall / seconds}
+
+
+BENCHES = {"openai": bench_openai, "faster-whisper": bench_faster_whisper}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--audio", help="recording to transcribe (default: generated)")
+    ap.add_argument("--audio-seconds", type=float, default=600, help="length of the generated recording")
+    ap.add_argument("--segment-seconds", type=int, default=120)
+    ap.add_argument("--backends", default="openai,faster-whisper")
+    ap.add_argument("--max-in-flight", type=int, default=4, help="chunks transcribed concurrently")
+    ap.add_argument("--language", default="en")
+    ap.add_argument("--repeat", type=int, default=2)
+    ap.add_argument("--model", default="whisper-1", help="API transcription model")
+    ap.add_argument("--real-api", action="store_true", help="call the real OpenAI API (billed) instead of the fake")
+    ap.add_argument("--latency", type=float, default=0.3, help="fake API seconds per request")
+    ap.add_argument("--seconds-per-mb", type=float, default=0.5, help="extra fake API seconds per MB uploaded")
+    ap.add_argument("--fw-model", default="small.en", help="faster-whisper model")
+    ap.add_argument("--compute-type", default="int8")
+    ap.add_argument("--workers", type=int, default=0, help="faster-whisper processes (0 = cores / cpu-threads)")
+    ap.add_argument("--cpu-threads", type=int, default=4)
+    ap.add_argument("--batch-size", type=int, default=8)
+    add_arguments(ap)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = set(backends) - set(BENCHES)
+    if unknown:
+        raise SystemExit("Unknown backend(s): %s" % ", ".join(sorted(unknown)))
+
+    from src.transcriber import segment_audio
+
+    work_dir = tempfile.mkdtemp(prefix="bench-transcribe-")
+    try:
+        audio = args.audio
+        if not audio:
+            audio = os.path.join(work_dir, "audio.mp3")
+            make_audio(audio, args.audio_seconds)
+        try:
+            chunks = segment_audio(audio, os.path.join(work_dir, "chunks"), args.segment_seconds)
+        except subprocess.CalledProcessError as e:
+            raise SystemExit("Could not segment %s: %s" % (audio, e))
+        seconds = audio_seconds(audio)
+        measurements = {}
+        for name in backends:
+            measurements.update(BENCHES[name](chunks, seconds, args))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    params = {k: getattr(args, k) for k in ("audio", "segment_seconds", "max_in_flight", "language", "repeat",
+                                            "model", "real_api", "latency", "seconds_per_mb", "fw_model",
+                                            "compute_type", "workers", "cpu_threads", "batch_size")}
+    params["audio_seconds"] = round(seconds, 1)
+    params["audio"] = os.path.basename(args.audio) if args.audio else None
+    raise SystemExit(record("transcribe", measurements, params, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Local stand-ins for the OpenAI API and for podcast hosts, for offline benchmarks.
+
+`FakeOpenAI` answers chat completions and audio transcriptions after a
+configurable latency, failing a configurable share of requests with 500s or
+with 429s carrying `retry-after-ms`. `StaticServer` serves synthetic feeds and
+audio with ETag/304 and Range support, like a real podcast host.
+"""
+import hashlib
+import json
+import random
+import re
+import shutil
+import subprocess
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+WORDS = ("grace mercy kingdom faith hope love prayer covenant shepherd light bread water vine resurrection "
+         "forgiveness wilderness promise justice peace spirit disciple parable harvest temple exile").split()
+REFERENCES = ["John 3:16", "Psalm 23:1-6", "Romans 8:28-39", "Isaiah 40:31", "Matthew 5:1-12", "Genesis 12:1-3"]
+
+
+class _Server:
+    """A ThreadingHTTPServer on 127.0.0.1 (random port) run on a daemon thread; usable as a context manager."""
+
+    handler = BaseHTTPRequestHandler
+
+    def __init__(self):
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> "_Server":
+        owner = self
+
+        class Handler(self.handler):
+            server_owner = owner
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_owner = None
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: List[Tuple[str, str]] = (),
+                  head: bool = False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _OpenAIHandler(_Handler):
+    def reply(self, status: int, body, headers: List[Tuple[str, str]] = ()):
+        self.send_body(status, json.dumps(body).encode("utf-8"), "application/json", headers)
+
+    def do_POST(self):
+        api = self.server_owner
+        upload = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        outcome, n = api._admit()
+        try:
+            if outcome == "throttle":
+                self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                           [("retry-after-ms", str(api.retry_after_ms))])
+                return
+            time.sleep(api.latency + api.seconds_per_mb * len(upload) / (1024 * 1024))
+            if outcome == "error":
+                self.reply(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+            elif self.path.endswith("/audio/transcriptions"):
+                self.reply(200, {"text": api.transcript_text(n)})
+            elif self.path.endswith("/chat/completions"):
+                content = json.dumps(api.summary(n))
+                prompt_tokens = max(1, len(upload) // 4)
+                self.reply(200, {
+                    "id": "chatcmpl-%d" % n, "object": "chat.completion", "created": int(time.time()),
+                    "model": "fake",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                              "total_tokens": prompt_tokens + len(content) // 4},
+                })
+            else:
+                self.reply(404, {"error": {"message": "Unknown path %s" % self.path}})
+        finally:
+            api._release()
+
+
+class FakeOpenAI(_Server):
+    """
+    Fake OpenAI endpoint (`base_url` is `<url>/v1`). Each request sleeps
+    `latency` seconds plus `seconds_per_mb` per MB uploaded; `throttle_rate`
+    of requests are answered 429 with `retry-after-ms` and `error_rate` with
+    500, drawn from a seeded RNG so runs are repeatable. `stats` counts
+    requests by outcome and the peak number in flight.
+    """
+
+    handler = _OpenAIHandler
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after_ms: int = 200, seconds_per_mb: float = 0.0, seed: int = 0):
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after_ms = retry_after_ms
+        self.seconds_per_mb = seconds_per_mb
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "max_in_flight": 0}
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "/v1"
+
+    def _admit(self) -> Tuple[str, int]:
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            if roll < self.throttle_rate:
+                outcome = "throttle"
+            elif roll < self.throttle_rate + self.error_rate:
+                outcome = "error"
+            else:
+                outcome = "ok"
+            self.stats[{"throttle": "throttled", "error": "errors", "ok": "ok"}[outcome]] += 1
+            self._in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+            return outcome, self.stats["requests"]
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def transcript_text(self, n: int, sentences: int = 40) -> str:
+        rng = random.Random(n)
+        out = []
+        for i in range(sentences):
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+            if i % 10 == 0:
+                words += ", as it says in " + rng.choice(REFERENCES)
+            out.append(words.capitalize() + ".")
+        return " ".join(out)
+
+    def summary(self, n: int) -> Dict:
+        rng = random.Random(n)
+        return {
+            "overall_theme": " ".join(rng.choice(WORDS) for _ in range(30)).capitalize() + ".",
+            "quotes": [" ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "." for _ in range(4)],
+            "bible_passages": rng.sample(REFERENCES, 2),
+            "follow_on_questions": ["What does %s mean for us today?" % rng.choice(WORDS) for _ in range(3)],
+            "further_bible_passages": [{"ref": rng.choice(REFERENCES), "rationale": "Develops the same theme."}],
+        }
+
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class _StaticHandler(_Handler):
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False):
+        site = self.server_owner
+        with site._lock:
+            site.hits[self.path] = site.hits.get(self.path, 0) + 1
+        entry = site.files.get(self.path.split("?")[0])
+        if entry is None:
+            self.send_body(404, b"not found", "text/plain", head=head)
+            return
+        body, content_type, etag = entry
+        headers = [("ETag", etag), ("Last-Modified", site.modified), ("Accept-Ranges", "bytes")]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        m = _RANGE_RE.match(self.headers.get("Range", ""))
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = int(m.group(2)) if m.group(2) else len(body) - 1
+            else:
+                start, end = max(0, len(body) - int(m.group(2))), len(body) - 1
+            end = min(end, len(body) - 1)
+            if start > end:
+                self.send_body(416, b"", content_type, [("Content-Range", "bytes */%d" % len(body))], head=head)
+                return
+            self.send_body(206, body[start:end + 1], content_type,
+                           headers + [("Content-Range", "bytes %d-%d/%d" % (start, end, len(body)))], head=head)
+            return
+        self.send_body(200, body, content_type, headers, head=head)
+
+
+class StaticServer(_Server):
+    """Serves `add()`-ed files by path, with ETag/If-None-Match, HEAD and single byte ranges."""
+
+    handler = _StaticHandler
+
+    def __init__(self):
+        super().__init__()
+        self.files: Dict[str, Tuple[bytes, str, str]] = {}
+        self.hits: Dict[str, int] = {}
+        self.modified = formatdate(usegmt=True)
+        self._lock = threading.Lock()
+
+    def add(self, path: str, body: bytes, content_type: str) -> str:
+        """Serve `body` at `path`; returns its absolute URL (the server must be started)."""
+        self.files[path] = (body, content_type, '"%s"' % hashlib.sha1(body).hexdigest()[:16])
+        return self.url + path
+
+
+def make_audio(path: str, seconds: float, frequency: int = 440, bitrate: str = "64k"):
+    """
+    Write a mono MP3 of `seconds`: a tone for 6s, silence for 2s, repeated,
+    so silence-aware segmentation finds pauses to cut in.
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to generate benchmark audio")
+    expr = "0.3*sin(%d*2*PI*t)*lt(mod(t\\,8)\\,6)" % frequency
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", "aevalsrc=%s:s=16000:d=%s" % (expr, seconds),
+                    "-ac", "1", "-c:a", "libmp3lame", "-b:a", bitrate, path], check=True)
+
+
+def rss(title: str, items: List[Dict[str, str]], image_url: Optional[str] = None) -> bytes:
+    """A minimal podcast RSS document; items need title, guid, link, pub_ts and audio_url (audio_length, duration optional)."""
+    parts = []
+    for item in items:
+        parts.append(
+            "<item><title>%s</title><guid>%s</guid><link>%s</link><pubDate>%s</pubDate>"
+            "<description>&lt;p&gt;Notes&lt;/p&gt;</description>"
+            '<enclosure url="%s" type="audio/mpeg" length="%s"/>%s</item>'
+            % (item["title"], item["guid"], item["link"], formatdate(item["pub_ts"], usegmt=True),
+               item["audio_url"], item.get("audio_length", 0),
+               "<itunes:duration>%s</itunes:duration>" % item["duration"] if item.get("duration") else "")
+        )
+    image = '<itunes:image href="%s"/>' % image_url if image_url else ""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"><channel>'
+        "<title>%s</title>%s%s</channel></rss>" % (title, image, "".join(parts))
+    ).encode("utf-8")
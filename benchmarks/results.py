@@ -0,0 +1,178 @@
+"""Store benchmark results and flag regressions against a baseline or the previous comparable run.
+
+Results live in `benchmarks/results/<suite>/<UTC timestamp>.json`. A run is
+compared with `<suite>/baseline.json` if its parameters match, otherwise with
+the newest earlier run that used the same parameters. Every measurement is
+in seconds (lower is better).
+
+Usage: python -m benchmarks.results <suite>            # compare the latest run
+       python -m benchmarks.results <suite> --baseline  # make the latest run the baseline
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE_NAME = "baseline.json"
+
+# Slower by more than this fraction counts as a regression...
+DEFAULT_THRESHOLD = 0.2
+# ...unless the difference is below timer noise
+MIN_DELTA_SECONDS = 0.005
+
+
+def best_of(fn, repeat: int, setup=None) -> float:
+    """Fastest of `repeat` timed calls of `fn` (`setup`, if given, runs untimed before each)."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "system": platform.system(), "cpus": os.cpu_count()}
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(suite: str, measurements: Dict[str, float], params: Dict[str, Any],
+         results_dir: str = RESULTS_DIR) -> str:
+    os.makedirs(os.path.join(results_dir, suite), exist_ok=True)
+    while True:
+        # Millisecond stamps keep file names unique and in run order
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + "%03dZ" % (now % 1 * 1000)
+        path = os.path.join(results_dir, suite, stamp + ".json")
+        if not os.path.exists(path):
+            break
+        time.sleep(0.001)
+    result = {"suite": suite, "timestamp": stamp, "params": params, "environment": environment(),
+              "measurements": {k: round(v, 6) for k, v in sorted(measurements.items())}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def runs(suite: str, results_dir: str = RESULTS_DIR) -> List[str]:
+    """Saved runs of `suite`, oldest first (the baseline file is not included)."""
+    return sorted(p for p in glob.glob(os.path.join(results_dir, suite, "*.json"))
+                  if os.path.basename(p) != BASELINE_NAME)
+
+
+def reference(suite: str, current_path: str, results_dir: str = RESULTS_DIR) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """The result `current_path` should be compared with: a matching baseline, else the previous matching run."""
+    current = _load(current_path)
+    baseline = os.path.join(results_dir, suite, BASELINE_NAME)
+    if os.path.exists(baseline):
+        data = _load(baseline)
+        if data["params"] == current["params"]:
+            return baseline, data
+    earlier = [p for p in runs(suite, results_dir) if os.path.basename(p) < os.path.basename(current_path)]
+    for path in reversed(earlier):
+        data = _load(path)
+        if data["params"] == current["params"]:
+            return path, data
+    return None
+
+
+def compare(current: Dict[str, float], previous: Dict[str, float], threshold: float = DEFAULT_THRESHOLD,
+            min_delta: float = MIN_DELTA_SECONDS) -> List[Dict[str, Any]]:
+    """One row per measurement present in both runs, with `regression` set where it got slower than allowed."""
+    rows = []
+    for name in sorted(set(current) & set(previous)):
+        old, new = previous[name], current[name]
+        ratio = new / old if old else float("inf") if new else 1.0
+        rows.append({"name": name, "old": old, "new": new, "ratio": ratio,
+                     "regression": ratio > 1 + threshold and new - old > min_delta})
+    return rows
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    width = max([len(r["name"]) for r in rows] + [11])
+    lines = ["%-*s %12s %12s %8s" % (width, "measurement", "before (s)", "after (s)", "change")]
+    for r in rows:
+        change = "%+.0f%%" % ((r["ratio"] - 1) * 100) if r["ratio"] != float("inf") else "new"
+        lines.append("%-*s %12.4f %12.4f %8s%s" % (width, r["name"], r["old"], r["new"], change,
+                                                  "  REGRESSION" if r["regression"] else ""))
+    return "\n".join(lines)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="where results are stored")
+    parser.add_argument("--no-save", action="store_true", help="print the measurements without storing them")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fractional slowdown reported as a regression (default 0.2 = 20%%)")
+    parser.add_argument("--baseline", action="store_true", help="store this run as the suite's baseline")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+
+
+def record(suite: str, measurements: Dict[str, float], params: Dict[str, Any], args: argparse.Namespace) -> int:
+    """Print, store and compare one run (per `add_arguments` options). Returns the process exit status."""
+    for name, seconds in sorted(measurements.items()):
+        print("%-48s %10.4f s" % (name, seconds))
+    if args.no_save:
+        return 0
+    path = save(suite, measurements, params, args.results_dir)
+    print("Saved %s" % path)
+    status = report(suite, path, args.results_dir, args.threshold)
+    if args.baseline:
+        shutil.copyfile(path, os.path.join(args.results_dir, suite, BASELINE_NAME))
+        print("Stored as the %s baseline" % suite)
+    return 1 if status and args.fail_on_regression else 0
+
+
+def report(suite: str, path: str, results_dir: str = RESULTS_DIR, threshold: float = DEFAULT_THRESHOLD) -> int:
+    """Print the comparison for the run at `path`; returns the number of regressions."""
+    ref = reference(suite, path, results_dir)
+    if ref is None:
+        print("No earlier %s run with the same parameters to compare with" % suite)
+        return 0
+    ref_path, ref_data = ref
+    rows = compare(_load(path)["measurements"], ref_data["measurements"], threshold)
+    print("Compared with %s (commit %s):" % (os.path.basename(ref_path), ref_data["environment"].get("commit")))
+    print(format_table(rows))
+    regressions = [r["name"] for r in rows if r["regression"]]
+    if regressions:
+        print("%d regression(s) over %.0f%%: %s" % (len(regressions), threshold * 100, ", ".join(regressions)))
+    return len(regressions)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("suite", help="e.g. micro or pipeline")
+    ap.add_argument("--results-dir", default=RESULTS_DIR)
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    ap.add_argument("--baseline", action="store_true", help="make the latest run the baseline")
+    args = ap.parse_args()
+
+    saved = runs(args.suite, args.results_dir)
+    if not saved:
+        raise SystemExit("No %s runs in %s" % (args.suite, args.results_dir))
+    if args.baseline:
+        shutil.copyfile(saved[-1], os.path.join(args.results_dir, args.suite, BASELINE_NAME))
+        print("Baseline is now %s" % os.path.basename(saved[-1]))
+        return
+    raise SystemExit(1 if report(args.suite, saved[-1], args.results_dir, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
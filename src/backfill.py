@@ -0,0 +1,303 @@
+"""
+Work through feed archives in bounded slices.
+
+The regular run only looks at the newest `pipeline.per_feed_limit` items of
+each feed. Backfill fetches every feed in full, adds each episode that has
+not been processed to a queue kept in the state store, and drains that queue
+in priority order through the same staged pipeline as `src.main`. Each
+invocation stops admitting episodes once any of its caps (audio minutes,
+tokens, estimated cost, wall-clock time) would be exceeded, so nightly runs
+chip away at the archive without surprises on the bill. What is left stays
+queued for the next invocation.
+
+    python -m src.backfill                          # discover, process one budgeted slice, publish
+    python -m src.backfill --dry-run                # show what the slice would contain
+    python -m src.backfill --max-cost-usd 1 --order weight
+"""
+import argparse
+import heapq
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import metrics, openai_pool
+from .feed_watcher import format_feed_report, poll_feeds
+from .pipeline import process_episodes, runnable
+from .state import StateStore, open_state
+from .summarizer import RESPONSE_TOKENS, SYSTEM_PROMPT, count_tokens
+from .utils import ensure_dir, setup_logging
+
+log = logging.getLogger("backfill")
+
+ORDERS = ("newest", "oldest", "weight")
+
+# Bitrate assumed when only the enclosure size is known
+ASSUMED_KBPS = 128
+
+# Meta keys: conditional-GET validators for full-feed fetches, and totals across invocations
+FEEDS_META = "backfill_feeds"
+TOTALS_META = "backfill_totals"
+
+class Usage(NamedTuple):
+    audio_minutes: float = 0.0
+    prompt_tokens: float = 0.0
+    completion_tokens: float = 0.0
+
+    @property
+    def tokens(self) -> float:
+        return self.prompt_tokens + self.completion_tokens
+
+    def __add__(self, other):
+        return Usage(*(a + b for a, b in zip(self, other)))
+
+    def __sub__(self, other):
+        return Usage(*(a - b for a, b in zip(self, other)))
+
+class Prices(NamedTuple):
+    """USD, for the cost estimate."""
+    transcription_per_minute: float = 0.006
+    prompt_per_million_tokens: float = 0.15
+    completion_per_million_tokens: float = 0.6
+
+    def cost(self, usage: Usage) -> float:
+        return (usage.audio_minutes * self.transcription_per_minute
+                + usage.prompt_tokens * self.prompt_per_million_tokens / 1e6
+                + usage.completion_tokens * self.completion_per_million_tokens / 1e6)
+
+class Budget:
+    """
+    Hard caps for one invocation (0 = no cap). An episode is admitted only if
+    its estimated usage fits in what is left after the usage already spent
+    and the estimates of episodes still in flight; when it finishes, its
+    estimate is replaced by what it actually used. The wall-clock cap stops
+    admissions once an episode admitted now would not be expected to finish
+    in time (based on how long finished episodes took). Safe to share
+    between threads.
+    """
+
+    def __init__(self, max_audio_minutes: float = 0, max_tokens: float = 0, max_cost_usd: float = 0,
+                 max_seconds: float = 0, prices: Prices = Prices()):
+        self.max_audio_minutes = max_audio_minutes
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+        self.max_seconds = max_seconds
+        self.prices = prices
+        self.spent = Usage()
+        self.stopped: Optional[str] = None
+        self._reserved: Dict[str, Tuple[Usage, float]] = {}
+        self._latencies: List[float] = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, bcfg: Dict[str, Any]) -> "Budget":
+        return cls(
+            max_audio_minutes=float(bcfg.get("max_audio_minutes", 0) or 0),
+            max_tokens=float(bcfg.get("max_tokens", 0) or 0),
+            max_cost_usd=float(bcfg.get("max_cost_usd", 0) or 0),
+            max_seconds=float(bcfg.get("max_wall_minutes", 0) or 0) * 60,
+            prices=Prices(**(bcfg.get("prices") or {})),
+        )
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def _exceeded(self, committed: Usage) -> Optional[str]:
+        if self.max_audio_minutes and committed.audio_minutes > self.max_audio_minutes:
+            return "audio minutes cap (%g)" % self.max_audio_minutes
+        if self.max_tokens and committed.tokens > self.max_tokens:
+            return "token cap (%g)" % self.max_tokens
+        if self.max_cost_usd and self.prices.cost(committed) > self.max_cost_usd:
+            return "cost cap ($%.2f)" % self.max_cost_usd
+        if self.max_seconds and self._latencies:
+            expected = sum(self._latencies) / len(self._latencies)
+            if self.elapsed() + expected > self.max_seconds:
+                return "wall-clock cap (%g min)" % (self.max_seconds / 60)
+        elif self.max_seconds and self.elapsed() >= self.max_seconds:
+            return "wall-clock cap (%g min)" % (self.max_seconds / 60)
+        return None
+
+    def admit(self, ep_id: str, estimate: Usage) -> bool:
+        """Reserve `estimate` for `ep_id` if it fits; once one episode does not fit, nothing more is admitted."""
+        with self._lock:
+            if self.stopped:
+                return False
+            committed = sum((u for u, _ in self._reserved.values()), self.spent) + estimate
+            reason = self._exceeded(committed)
+            if reason:
+                self.stopped = reason
+                return False
+            self._reserved[ep_id] = (estimate, time.monotonic())
+            return True
+
+    def settle(self, ep_id: str, actual: Usage):
+        """Swap `ep_id`'s reservation for its actual usage."""
+        with self._lock:
+            _, admitted = self._reserved.pop(ep_id, (None, None))
+            self.spent = self.spent + actual
+            if admitted is not None:
+                self._latencies.append(time.monotonic() - admitted)
+
+def estimate_minutes(ep: Dict[str, Any], default_minutes: float = 45) -> float:
+    """Audio minutes from the feed's itunes:duration, else the enclosure size at `ASSUMED_KBPS`, else the default."""
+    if ep.get("duration_seconds"):
+        return ep["duration_seconds"] / 60
+    if ep.get("audio_bytes"):
+        return ep["audio_bytes"] * 8 / (ASSUMED_KBPS * 1000) / 60
+    return default_minutes
+
+def estimate_usage(ep: Dict[str, Any], bcfg: Dict[str, Any], prompt_tokens: int = 0) -> Usage:
+    """What processing `ep` is expected to cost: its audio, plus one summary of its transcript."""
+    minutes = estimate_minutes(ep, float(bcfg.get("default_episode_minutes", 45)))
+    transcript_tokens = minutes * float(bcfg.get("tokens_per_audio_minute", 200))
+    return Usage(minutes, transcript_tokens + prompt_tokens, RESPONSE_TOKENS)
+
+def priority(ep: Dict[str, Any], order: str = "newest", weights: Optional[Dict[str, float]] = None) -> tuple:
+    """Sort key, smallest first: newest/oldest by publish time, or by feed weight (unlisted feeds weigh 1), newest first within a weight."""
+    ts = int(ep.get("published_ts") or 0)
+    if order == "oldest":
+        return (ts,)
+    if order == "weight":
+        return (-float((weights or {}).get(ep.get("feed_url"), 1)), -ts)
+    return (-ts,)
+
+def discover(cfg: Dict[str, Any], store: StateStore, refresh: bool = False) -> int:
+    """
+    Fetch every feed in full and queue the episodes with audio that have not
+    been processed. Validators from the last full fetch are reused (unless
+    `refresh`), so an unchanged feed is not downloaded or parsed again.
+    Returns how many episodes were newly queued.
+    """
+    pcfg = cfg["pipeline"]
+    validators = {} if refresh else json.loads(store.get_meta(FEEDS_META) or "{}")
+    start = time.monotonic()
+    results = poll_feeds(cfg["feeds"], validators, per_feed_limit=None,
+                         max_workers=int(pcfg.get("feed_workers", 4)), timeout=int(pcfg.get("feed_timeout", 30)))
+    log.info("Fetched %d feeds in full in %.2fs:\n%s", len(results), time.monotonic() - start,
+             format_feed_report(results))
+    # The queue holds the episodes; only the validators are worth keeping here
+    store.set_meta(FEEDS_META, json.dumps({url: {"etag": v["etag"], "modified": v["modified"], "limit": None}
+                                           for url, v in validators.items()}))
+    eps = [ep for res in results for ep in res["episodes"] if ep["audio_url"] and ep["id"] not in store]
+    queued = store.queue_backfill(eps)
+    log.info("Queued %d archive episodes for backfill", queued)
+    return queued
+
+def _admissions(heap: List[tuple], budget: Budget, bcfg: Dict[str, Any], prompt_tokens: int) -> Iterator[Dict[str, Any]]:
+    while heap:
+        ep = heap[0][-1]
+        if not budget.admit(ep["id"], estimate_usage(ep, bcfg, prompt_tokens)):
+            log.info("Stopping admissions: %s reached", budget.stopped)
+            return
+        heapq.heappop(heap)
+        yield ep
+
+def _actual_usage(ep: Dict[str, Any], ok: bool, estimate: Usage) -> Usage:
+    counters = metrics.current().episode_counters(ep["id"])
+    # Audio is only billed if something was sent for transcription (the estimate stands in for its length)
+    sent = ok or counters.get("chunks_transcribed", 0) > 0
+    return Usage(estimate.audio_minutes if sent else 0.0,
+                 counters.get("prompt_tokens", 0), counters.get("completion_tokens", 0))
+
+def backfill(cfg: Dict[str, Any], store: StateStore, user_prompt: str, budget: Budget,
+             order: str = "newest", dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Process queued archive episodes in `order` until the queue is empty or
+    `budget` stops admitting. Episodes are fed to the pipeline as it has
+    room, so several are in flight at once. Returns a summary of the slice.
+    """
+    bcfg = cfg.get("backfill") or {}
+    max_attempts = int(cfg["pipeline"].get("max_attempts", 3))
+    weights = bcfg.get("feed_weights") or {}
+    heap = [priority(ep, order, weights) + (i, ep)
+            for i, ep in enumerate(runnable(store.backfill_queue(), store, max_attempts))]
+    heapq.heapify(heap)
+    queued = len(heap)
+    prompt_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(user_prompt)
+    estimates: Dict[str, Usage] = {}
+    counts = {"processed": 0, "failed": 0}
+
+    def admitted() -> Iterator[Dict[str, Any]]:
+        for ep in _admissions(heap, budget, bcfg, prompt_tokens):
+            estimates[ep["id"]] = estimate_usage(ep, bcfg, prompt_tokens)
+            yield ep
+
+    def on_finished(ep: Dict[str, Any], ok: bool):
+        budget.settle(ep["id"], _actual_usage(ep, ok, estimates[ep["id"]]))
+
+    if dry_run:
+        # Nothing runs, so every estimate stays reserved: the slice is what fits on estimates alone
+        eps = list(admitted())
+        for ep in eps:
+            log.info("Would process %s (%s, %.0f min)", ep["id"], ep.get("published") or "undated",
+                     estimates[ep["id"]].audio_minutes)
+        spent = sum(estimates.values(), Usage())
+        counts["would_process"] = len(eps)
+    else:
+        counts = process_episodes(admitted(), cfg, store, user_prompt, on_finished=on_finished)
+        spent = budget.spent
+    return dict(counts, queued=queued, remaining=len(heap), stopped=budget.stopped,
+                audio_minutes=round(spent.audio_minutes, 1), tokens=int(spent.tokens),
+                cost_usd=round(budget.prices.cost(spent), 4), wall_seconds=round(budget.elapsed(), 1))
+
+def _add_totals(store: StateStore, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Accumulate this slice into the running totals kept across invocations."""
+    totals = json.loads(store.get_meta(TOTALS_META) or "{}")
+    totals["invocations"] = totals.get("invocations", 0) + 1
+    for key in ("processed", "failed", "audio_minutes", "tokens", "cost_usd"):
+        totals[key] = round(totals.get(key, 0) + result.get(key, 0), 4)
+    totals["remaining"] = result["remaining"]
+    totals["last_run"] = int(time.time())
+    store.set_meta(TOTALS_META, json.dumps(totals, sort_keys=True))
+    return totals
+
+def main(argv: Optional[List[str]] = None):
+    from .main import load_config, load_prompt, publish
+    from .publisher import load_episodes
+
+    parser = argparse.ArgumentParser(description="Process archive episodes in priority order within budget caps.")
+    parser.add_argument("--order", choices=ORDERS, help="queue order (default: backfill.order)")
+    parser.add_argument("--max-audio-minutes", type=float, help="cap on audio transcribed (0 = no cap)")
+    parser.add_argument("--max-tokens", type=float, help="cap on summarisation tokens (0 = no cap)")
+    parser.add_argument("--max-cost-usd", type=float, help="cap on estimated cost (0 = no cap)")
+    parser.add_argument("--max-wall-minutes", type=float, help="stop admitting episodes after this long (0 = no cap)")
+    parser.add_argument("--refresh", action="store_true", help="refetch every feed even if unchanged")
+    parser.add_argument("--no-discover", action="store_true", help="only drain what is already queued")
+    parser.add_argument("--dry-run", action="store_true", help="show what this slice would process")
+    parser.add_argument("--no-publish", action="store_true", help="do not rebuild the site afterwards")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    cfg = load_config()
+    openai_pool.configure(cfg.get("openai"))
+    ensure_dir(cfg["storage"]["data_dir"])
+    ensure_dir(cfg["storage"]["episodes_dir"])
+    bcfg = dict(cfg.get("backfill") or {})
+    for key in ("max_audio_minutes", "max_tokens", "max_cost_usd", "max_wall_minutes"):
+        if getattr(args, key) is not None:
+            bcfg[key] = getattr(args, key)
+
+    metrics.start_run("backfill")
+    with open_state(cfg["storage"]) as store:
+        if not args.no_discover:
+            with metrics.span("discover"):
+                discover(cfg, store, refresh=args.refresh)
+        result = backfill(cfg, store, load_prompt(), Budget.from_config(bcfg),
+                          order=args.order or bcfg.get("order", "newest"), dry_run=args.dry_run)
+        if args.dry_run:
+            log.info("Dry run: %s", result)
+            return
+        if result["processed"] and not args.no_publish:
+            episodes = load_episodes(cfg["storage"]["episodes_dir"])
+            episodes.sort(key=lambda e: (e.get("published_ts") or 0, e.get("published") or ""), reverse=True)
+            publish(cfg, episodes)
+            store.mark_published()
+        totals = _add_totals(store, result)
+    log.info("Backfill slice: %s", result)
+    log.info("Backfill so far: %s", totals)
+    metrics.write_report(cfg.get("metrics"))
+
+if __name__ == "__main__":
+    main()
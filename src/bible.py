@@ -0,0 +1,287 @@
+import bisect
+import logging
+import re
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .utils import read_json, write_json
+
+log = logging.getLogger("bible")
+
+BOOKS = [
+    "Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy", "Joshua", "Judges", "Ruth", "1 Samuel",
+    "2 Samuel", "1 Kings", "2 Kings", "1 Chronicles", "2 Chronicles", "Ezra", "Nehemiah", "Esther", "Job",
+    "Psalms", "Proverbs", "Ecclesiastes", "Song of Songs", "Isaiah", "Jeremiah", "Lamentations", "Ezekiel",
+    "Daniel", "Hosea", "Joel", "Amos", "Obadiah", "Jonah", "Micah", "Nahum", "Habakkuk", "Zephaniah", "Haggai",
+    "Zechariah", "Malachi",
+    "Matthew", "Mark", "Luke", "John", "Acts", "Romans", "1 Corinthians", "2 Corinthians", "Galatians",
+    "Ephesians", "Philippians", "Colossians", "1 Thessalonians", "2 Thessalonians", "1 Timothy", "2 Timothy",
+    "Titus", "Philemon", "Hebrews", "James", "1 Peter", "2 Peter", "1 John", "2 John", "3 John", "Jude",
+    "Revelation",
+]
+SINGLE_CHAPTER = {"Obadiah", "Philemon", "2 John", "3 John", "Jude"}
+
+# Abbreviations and alternative names that are not simply a unique prefix of the book name
+_EXTRA_ALIASES = {
+    "gn": "Genesis", "ex": "Exodus", "lv": "Leviticus", "nm": "Numbers", "dt": "Deuteronomy",
+    "jos": "Joshua", "jdg": "Judges", "judg": "Judges", "jg": "Judges", "sam": "1 Samuel",
+    "ps": "Psalms", "psa": "Psalms", "psalm": "Psalms", "pss": "Psalms", "prv": "Proverbs", "qoheleth": "Ecclesiastes",
+    "songofsolomon": "Song of Songs", "song": "Song of Songs", "sos": "Song of Songs", "canticles": "Song of Songs",
+    "ezk": "Ezekiel", "jl": "Joel", "jon": "Jonah", "jnh": "Jonah", "hab": "Habakkuk", "zeph": "Zephaniah",
+    "mt": "Matthew", "mk": "Mark", "mrk": "Mark", "lk": "Luke", "jn": "John", "jhn": "John",
+    "rm": "Romans", "php": "Philippians", "phil": "Philippians", "phm": "Philemon", "philem": "Philemon",
+    "jas": "James", "jm": "James", "jude": "Jude", "rev": "Revelation", "revelations": "Revelation",
+    "1jn": "1 John", "2jn": "2 John", "3jn": "3 John", "1pt": "1 Peter", "2pt": "2 Peter",
+    "1sm": "1 Samuel", "2sm": "2 Samuel", "1kgs": "1 Kings", "2kgs": "2 Kings", "1chr": "1 Chronicles",
+    "2chr": "2 Chronicles", "1thess": "1 Thessalonians", "2thess": "2 Thessalonians",
+}
+
+_ORDINALS = {"i": "1", "ii": "2", "iii": "3", "first": "1", "second": "2", "third": "3",
+             "1st": "1", "2nd": "2", "3rd": "3"}
+
+# Verses are encoded as chapter * VERSE_BASE + verse, so a passage is a closed integer interval
+VERSE_BASE = 1000
+MAX_VERSE = VERSE_BASE - 1
+# A bare book name ("Revelation") covers chapter 0 verse 0 onwards, so it is the only kind of entry starting at 0
+_WHOLE_BOOK_START = 0
+
+def _key(name: str) -> str:
+    words = re.sub(r"[.\s]+", " ", name.lower()).strip().split(" ")
+    if len(words) > 1 and words[0] in _ORDINALS:
+        words[0] = _ORDINALS[words[0]]
+    return "".join(words)
+
+def _build_aliases() -> Dict[str, str]:
+    aliases: Dict[str, str] = {}
+    ambiguous = set()
+    for book in BOOKS:
+        full = _key(book)
+        digits = full[0] if full[0].isdigit() else ""
+        name = full[len(digits):]
+        for n in range(min(3, len(name)), len(name) + 1):
+            prefix = digits + name[:n]
+            if prefix in aliases and aliases[prefix] != book:
+                ambiguous.add(prefix)
+            aliases[prefix] = book
+    for prefix in ambiguous:
+        del aliases[prefix]
+    for book in BOOKS:
+        aliases[_key(book)] = book
+    aliases.update(_EXTRA_ALIASES)
+    return aliases
+
+_ALIASES = _build_aliases()
+
+def lookup_book(name: str) -> Optional[str]:
+    """Canonical book name for a spelling or abbreviation ("Rom", "1 Jn", "II Kings"), or None."""
+    return _ALIASES.get(_key(name))
+
+class Ref(NamedTuple):
+    """A passage as a closed interval of encoded verse positions within one book."""
+    book: str
+    start: int
+    end: int
+
+    def __str__(self) -> str:
+        return format_ref(self)
+
+def _pos(chapter: int, verse: int) -> int:
+    return chapter * VERSE_BASE + verse
+
+def format_ref(ref: Ref) -> str:
+    """Canonical text for a reference, e.g. "Romans 8", "Romans 8:28-39", "Genesis 1:1-2:3"."""
+    c1, v1 = divmod(ref.start, VERSE_BASE)
+    c2, v2 = divmod(ref.end, VERSE_BASE)
+    if c1 == 0:
+        return ref.book
+    if v1 == 1 and v2 == MAX_VERSE and ref.book not in SINGLE_CHAPTER:
+        return f"{ref.book} {c1}" if c1 == c2 else f"{ref.book} {c1}-{c2}"
+    if (c1, v1) == (c2, v2):
+        return f"{ref.book} {c1}:{v1}"
+    if c1 == c2:
+        return f"{ref.book} {c1}:{v1}-{v2}"
+    return f"{ref.book} {c1}:{v1}-{c2}:{v2}"
+
+_BOOK_RE = re.compile(r"^\s*((?:[1-3]|i{1,3})?\s*[^\d]+?)\s*(\d.*)?$", re.IGNORECASE)
+_PART_RE = re.compile(r"(\d+)(?::(\d+))?(?:-(\d+)(?::(\d+))?)?")
+
+def parse_reference(text: str) -> List[Ref]:
+    """
+    Parse a free-text reference into canonical passages.
+
+    Handles single verses ("John 3:16"), verse and chapter ranges ("Psalm
+    23:1-6", "Romans 8-9", "Genesis 1:1-2:3"), whole chapters or books, lists
+    continuing the same book ("John 3:16, 18; 4:1") or switching books
+    ("Isaiah 53:5; 1 Peter 2:24"), abbreviations and roman numerals ("1 Cor
+    13", "II Kings 5"), verse suffixes like "16a" or "5ff", and trailing
+    descriptions ("Luke 15:11-32 – The Prodigal Son"). Unrecognised text
+    yields an empty list rather than an error.
+    """
+    if not isinstance(text, str):
+        return []
+    text = re.sub(r"[‐-―]", "-", text)
+    refs: List[Ref] = []
+    book: Optional[str] = None
+    single = False
+    chapter: Optional[int] = None
+    verse_context = False
+    for sep, part in re.findall(r"(^|[;,])\s*([^;,]*)", text):
+        # A part naming a book switches to it: "Isaiah 53:5; 1 Peter 2:24"
+        m = _BOOK_RE.match(part)
+        named = lookup_book(m.group(1).strip().rstrip(".")) if m else None
+        if named is not None:
+            book, single, chapter, verse_context = named, named in SINGLE_CHAPTER, None, False
+            part = m.group(2) or ""
+            if not part:
+                refs.append(Ref(book, _WHOLE_BOOK_START, _pos(MAX_VERSE, MAX_VERSE)))
+                continue
+        elif book is None:
+            return []
+        part = re.sub(r"(?<=\d)(?:ff|f|[a-c])\b", "", part.strip().lower().replace(" ", ""))
+        part = re.sub(r"^(?:v|vv|vs|verses?)\.?", "", part)
+        # The reference is the leading run of numbers; anything after it ("- The Prodigal Son") is ignored
+        pm = _PART_RE.match(part)
+        if not pm:
+            continue
+        a, b, c, d = (int(g) if g else None for g in pm.groups())
+        if sep == ";":
+            verse_context = False
+        if b is not None:
+            # c:v, c:v-v2 or c:v-c2:v2
+            chapter = a
+            start = _pos(a, b)
+            end = _pos(c, d) if d is not None else _pos(a, c if c is not None else b)
+            verse_context = True
+        elif single or (verse_context and chapter is not None):
+            # Bare verses: a single-chapter book, or continuing "John 3:16, 18"
+            ch = 1 if single else chapter
+            start, end = _pos(ch, a), _pos(ch, c if c is not None else a)
+            if c is not None and d is not None:
+                end = _pos(c, d)
+        else:
+            # Whole chapters: "Romans 8" or "Romans 8-9"
+            chapter = a
+            start, end = _pos(a, 1), _pos(c if c is not None else a, MAX_VERSE)
+        if end < start:
+            start, end = end, start
+        refs.append(Ref(book, start, end))
+    return refs
+
+def episode_refs(summary: Dict[str, Any]) -> List[Tuple[Ref, str]]:
+    """Parsed passages from a summary, tagged "m" (mentioned) or "f" (further reading)."""
+    out: List[Tuple[Ref, str]] = []
+    for text in summary.get("bible_passages") or []:
+        out += [(r, "m") for r in parse_reference(text)]
+    for item in summary.get("further_bible_passages") or []:
+        text = item.get("ref") if isinstance(item, dict) else item
+        out += [(r, "f") for r in parse_reference(text)]
+    return out
+
+class BibleIndex:
+    """
+    Interval index of which episodes touch which passages.
+
+    For every book, entries `[start, end, episode_id, kind]` are kept sorted
+    by start, with a running maximum of `end`, so an overlap query is a
+    binary search plus a scan that stops as soon as no earlier passage can
+    reach the query. Whole-book entries sort first, are always returned and
+    stay out of the running maximum. `update` re-parses only episodes whose digest changed
+    and inserts their passages in place, so keeping the index current costs
+    time proportional to the changed episodes. Persisted as JSON at `path`
+    (or kept in memory when `path` is None).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        data = read_json(path, {}) if path else {}
+        if data.get("version") != 1:
+            data = {}
+        self.episodes: Dict[str, Dict[str, Any]] = data.get("episodes", {})
+        self.books: Dict[str, List[List[Any]]] = data.get("books", {})
+        self._max_end: Dict[str, List[int]] = {}
+
+    def save(self):
+        if self.path:
+            write_json(self.path, {"version": 1, "episodes": self.episodes, "books": self.books}, compact=True)
+
+    def _remove(self, ep_id: str):
+        for book, _, _, _ in self.episodes.pop(ep_id, {}).get("refs", []):
+            entries = self.books.get(book, [])
+            self.books[book] = [e for e in entries if e[2] != ep_id]
+            if not self.books[book]:
+                del self.books[book]
+            self._max_end.pop(book, None)
+
+    def _add(self, ep_id: str, digest: str, refs: List[Tuple[Ref, str]]):
+        stored = []
+        for ref, kind in refs:
+            entry = [ref.start, ref.end, ep_id, kind]
+            bisect.insort(self.books.setdefault(ref.book, []), entry)
+            self._max_end.pop(ref.book, None)
+            stored.append([ref.book, ref.start, ref.end, kind])
+        self.episodes[ep_id] = {"digest": digest, "refs": stored}
+
+    def update(self, episodes: Iterable[Dict[str, Any]], digest: Callable[[Dict[str, Any]], str]) -> int:
+        """
+        Bring the index in line with `episodes` (dicts with `id` and `summary`).
+        Returns the number of episodes (re)indexed.
+        """
+        seen = set()
+        changed = 0
+        for ep in episodes:
+            seen.add(ep["id"])
+            d = digest(ep)
+            if self.episodes.get(ep["id"], {}).get("digest") == d:
+                continue
+            self._remove(ep["id"])
+            try:
+                summary = ep["summary"] or {}
+            except KeyError:
+                summary = {}
+            self._add(ep["id"], d, episode_refs(summary))
+            changed += 1
+        for ep_id in set(self.episodes) - seen:
+            self._remove(ep_id)
+            changed += 1
+        if changed:
+            self.save()
+            log.info("Bible index: %d episodes re-indexed, %d books referenced", changed, len(self.books))
+        return changed
+
+    def _running_max(self, book: str) -> List[int]:
+        if book not in self._max_end:
+            running, best = [], -1
+            for entry in self.books.get(book, []):
+                # Whole-book entries are left out, or they would pin the maximum for the whole book
+                if entry[0] != _WHOLE_BOOK_START:
+                    best = max(best, entry[1])
+                running.append(best)
+            self._max_end[book] = running
+        return self._max_end[book]
+
+    def overlapping(self, ref: Ref) -> List[List[Any]]:
+        """Entries `[start, end, episode_id, kind]` whose passage overlaps `ref`, in canonical order."""
+        entries = self.books.get(ref.book, [])
+        max_end = self._running_max(ref.book)
+        # Whole-book entries sort first and overlap everything in the book
+        whole = bisect.bisect_right(entries, [_WHOLE_BOOK_START, float("inf")])
+        i = bisect.bisect_right(entries, [ref.end, float("inf")]) - 1
+        out = []
+        while i >= whole and max_end[i] >= ref.start:
+            if entries[i][1] >= ref.start:
+                out.append(entries[i])
+            i -= 1
+        out.reverse()
+        return entries[:whole] + out
+
+    def query(self, text: str) -> List[str]:
+        """Ids of episodes touching any passage in `text`, e.g. `index.query("Romans 8")`."""
+        ids: List[str] = []
+        for ref in parse_reference(text):
+            for entry in self.overlapping(ref):
+                if entry[2] not in ids:
+                    ids.append(entry[2])
+        return ids
+
+    def book_entries(self, book: str) -> List[Tuple[Ref, str, str]]:
+        """All `(ref, episode_id, kind)` for a book in canonical order, for the per-book pages."""
+        return [(Ref(book, s, e), ep_id, kind) for s, e, ep_id, kind in self.books.get(book, [])]
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+log = logging.getLogger("cache")
+
+# Eviction trims the cache to this share of `max_bytes`, so the next few puts don't trigger another scan
+LOW_WATER = 0.9
+
+class ChunkCache:
+    """
+    Persistent, content-addressed cache of chunk transcripts.
+
+    Entries are keyed by a hash of the chunk's audio bytes, the transcription
+    model and the language hint, so a re-run (or the same sermon published on
+    two feeds) reuses finished chunks instead of paying for them again. Files
+    live under `<cache_dir>/<key[:2]>/<key>.json`; when the total size goes over
+    `max_bytes` the least recently used entries (by mtime, refreshed on every
+    hit) are evicted down to `LOW_WATER` of it. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(path: str, model: str, language_hint: Optional[str]) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        h.update(b"\0" + model.encode("utf-8") + b"\0" + (language_hint or "").encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    p = os.path.join(root, name)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    yield p, st.st_size, st.st_mtime
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str, **extra: Any):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data: Dict[str, Any] = {"text": text}
+        data.update(extra)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        with self._lock:
+            # Replace and account under the lock, so concurrent puts of one key don't both count the old size
+            old = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+            self._total += os.path.getsize(path) - old
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in `LOW_WATER` of `max_bytes`."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * LOW_WATER
+            removed = 0
+            for p, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(p)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._total = total
+        if removed:
+            log.info("Evicted %d cache entries from %s (now %.1f MB)", removed, self.cache_dir, total / (1024 * 1024))
+
+class SummaryCache(ChunkCache):
+    """
+    Summaries keyed by a hash of everything that determines them: the
+    transcript, the prompt, the model and the temperature. Changing any of
+    these misses the cache, so a bulk re-run only pays for what changed.
+    """
+
+    @staticmethod
+    def summary_key(transcript: str, prompt: str, model: str, temperature: float) -> str:
+        h = hashlib.sha256()
+        for part in (transcript, prompt.strip(), model, repr(float(temperature))):
+            h.update(part.encode("utf-8") + b"\0")
+        return h.hexdigest()
+
+    def get_summary(self, key: str) -> Optional[Dict[str, Any]]:
+        text = self.get(key)
+        return json.loads(text) if text is not None else None
+
+    def put_summary(self, key: str, summary: Dict[str, Any], **extra: Any):
+        self.put(key, json.dumps(summary, ensure_ascii=False), **extra)
+
+def _cache_dir(cfg: Dict[str, Any]) -> str:
+    return (cfg.get("cache") or {}).get("dir", os.path.join(cfg["storage"]["data_dir"], "cache"))
+
+def open_chunk_cache(cfg: Dict[str, Any]) -> Optional[ChunkCache]:
+    """Build the chunk cache from the `cache:` config section (None if disabled)."""
+    ccfg = cfg.get("cache") or {}
+    max_mb = float(ccfg.get("transcripts_max_mb", 50))
+    if max_mb <= 0:
+        return None
+    return ChunkCache(os.path.join(_cache_dir(cfg), "transcripts"), int(max_mb * 1024 * 1024))
+
+def open_summary_cache(cfg: Dict[str, Any]) -> Optional[SummaryCache]:
+    """Build the summary cache from the `cache:` config section (None if disabled)."""
+    max_mb = float((cfg.get("cache") or {}).get("summaries_max_mb", 20))
+    if max_mb <= 0:
+        return None
+    return SummaryCache(os.path.join(_cache_dir(cfg), "summaries"), int(max_mb * 1024 * 1024))
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from .utils import read_json, write_json
+
+log = logging.getLogger("catalogue")
+
+CATALOGUE_NAME = "catalogue.json"
+# Local, uncommitted: file stats as of indexing, so unchanged episodes are not re-hashed on every load
+STATS_NAME = ".catalogue-stats.json"
+EPISODE_FILES = ("meta.json", "summary.json", "transcript.json")
+
+# Summarise workers update the catalogue concurrently
+_lock = threading.Lock()
+
+class LazyEpisode(dict):
+    """
+    A catalogue entry (everything the index page needs) whose `summary` and
+    `transcript` are read from disk only when accessed, and never retained.
+    """
+
+    def __init__(self, ep_dir: str, entry: Dict[str, Any]):
+        super().__init__(entry)
+        self.ep_dir = ep_dir
+
+    def __missing__(self, key: str) -> Any:
+        if key == "summary":
+            return read_json(os.path.join(self.ep_dir, "summary.json"), {})
+        if key == "transcript":
+            return read_json(os.path.join(self.ep_dir, "transcript.json"), {}).get("text", "")
+        raise KeyError(key)
+
+    def materialise(self) -> Dict[str, Any]:
+        """A plain dict with summary and transcript loaded, for rendering one episode page."""
+        return dict(self, summary=self["summary"], transcript=self["transcript"])
+
+def catalogue_path(episodes_dir: str) -> str:
+    return os.path.join(episodes_dir, CATALOGUE_NAME)
+
+def _file_stats(ep_path: str) -> Dict[str, Any]:
+    """[size, mtime_ns] of each of `EPISODE_FILES` (None if missing), to notice edits without reading them."""
+    stats: Dict[str, Any] = {}
+    for name in EPISODE_FILES:
+        try:
+            st = os.stat(os.path.join(ep_path, name))
+            stats[name] = [st.st_size, st.st_mtime_ns]
+        except FileNotFoundError:
+            stats[name] = None
+    return stats
+
+def _content_hash(ep_path: str) -> str:
+    h = hashlib.sha256()
+    for name in EPISODE_FILES:
+        try:
+            with open(os.path.join(ep_path, name), "rb") as f:
+                h.update(f.read())
+        except FileNotFoundError:
+            pass
+        h.update(b"\0")
+    return h.hexdigest()
+
+def build_entry(episodes_dir: str, ep_id: str, content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Read one episode directory into a compact catalogue entry."""
+    ep_path = os.path.join(episodes_dir, ep_id)
+    meta = read_json(os.path.join(ep_path, "meta.json"), {})
+    summary = read_json(os.path.join(ep_path, "summary.json"), {})
+    return {
+        "id": ep_id,
+        "title": meta.get("title", ep_id),
+        "published": meta.get("published", ""),
+        "published_ts": meta.get("published_ts", 0),
+        "link": meta.get("link", ""),
+        "image_url": meta.get("image_url", None),
+        "overall_theme": summary.get("overall_theme", "") if isinstance(summary, dict) else "",
+        "content_hash": content_hash or _content_hash(ep_path),
+    }
+
+def _save(episodes_dir: str, entries: Dict[str, Dict[str, Any]]):
+    write_json(catalogue_path(episodes_dir), {"version": 1, "episodes": entries}, compact=True)
+
+def _stats_path(episodes_dir: str) -> str:
+    return os.path.join(episodes_dir, STATS_NAME)
+
+def update_catalogue(episodes_dir: str, ep_id: str) -> Dict[str, Any]:
+    """(Re)index one episode after its files were written. Returns the new entry."""
+    # Stat before reading, so a write that lands while we read shows up as a change next time
+    stats = _file_stats(os.path.join(episodes_dir, ep_id))
+    entry = build_entry(episodes_dir, ep_id)
+    with _lock:
+        entries = read_json(catalogue_path(episodes_dir), {}).get("episodes", {})
+        entries[ep_id] = entry
+        _save(episodes_dir, entries)
+        known = read_json(_stats_path(episodes_dir), {})
+        known[ep_id] = stats
+        write_json(_stats_path(episodes_dir), known, compact=True)
+    return entry
+
+def load_catalogue(episodes_dir: str, rebuild: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Return the catalogue, reconciled with the episode directories on disk.
+
+    Directories without an entry are indexed (so episodes written by older
+    code or by hand are picked up) and entries whose directory is gone are
+    dropped. Only directories with a `summary.json` count: the summary is
+    the last file the pipeline writes, so an episode a crashed run left
+    half-finished stays off the site until it is resumed. An episode whose
+    files' size or mtime differ from the local stats sidecar (a fresh
+    checkout, a hand edit) is re-hashed, and its entry is re-read and the
+    catalogue rewritten only if the content hash changed. Pass
+    `rebuild=True` to re-read everything.
+    """
+    if not os.path.exists(episodes_dir):
+        return {}
+    with _lock:
+        entries = {} if rebuild else read_json(catalogue_path(episodes_dir), {}).get("episodes", {})
+        known = read_json(_stats_path(episodes_dir), {})
+        on_disk = {d for d in os.listdir(episodes_dir) if os.path.exists(os.path.join(episodes_dir, d, "summary.json"))}
+        changed = stats_changed = False
+        for ep_id in sorted(on_disk):
+            ep_path = os.path.join(episodes_dir, ep_id)
+            stats = _file_stats(ep_path)
+            entry = entries.get(ep_id)
+            if entry is not None and known.get(ep_id) == stats:
+                continue
+            content_hash = _content_hash(ep_path)
+            if entry is None or entry.get("content_hash") != content_hash:
+                entries[ep_id] = build_entry(episodes_dir, ep_id, content_hash)
+                changed = True
+            known[ep_id] = stats
+            stats_changed = True
+        for ep_id in set(entries) - on_disk:
+            del entries[ep_id]
+            changed = True
+        for ep_id in set(known) - on_disk:
+            del known[ep_id]
+            stats_changed = True
+        if changed or rebuild:
+            _save(episodes_dir, entries)
+        if stats_changed:
+            write_json(_stats_path(episodes_dir), known, compact=True)
+    return entries
+
+def load_episode_list(episodes_dir: str) -> List[LazyEpisode]:
+    return [LazyEpisode(os.path.join(episodes_dir, ep_id), entry)
+            for ep_id, entry in load_catalogue(episodes_dir).items()]
@@ -0,0 +1,188 @@
+"""
+Long-running alternative to the daily cron: keep one warm process, poll each
+feed on its own schedule and process new episodes as soon as they appear.
+
+Each feed's next poll is derived from its publish history (see
+`schedule.poll_interval`): quiet feeds are polled rarely, and a feed is
+polled every few minutes around the hours it usually publishes. New
+episodes go straight to a processing thread (the same staged pipeline as
+`src.main`) while polling carries on, and the site is rebuilt after each
+batch.
+
+    python -m src.daemon
+"""
+import heapq
+import logging
+import queue
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from . import metrics, openai_pool
+from .feed_watcher import find_new_episodes
+from .main import load_config, load_prompt, publish
+from .pipeline import process_episodes, runnable
+from .publisher import load_episodes
+from .schedule import PollSettings, learn_cadence, poll_interval
+from .state import StateStore, open_state
+from .utils import ensure_dir, setup_logging
+
+log = logging.getLogger("daemon")
+
+# Queue sentinel telling the processing thread to exit
+_STOP = object()
+
+class Daemon:
+    """
+    Polls `cfg["feeds"]` on per-feed schedules until `stop` is set. Episodes
+    found are processed in batches on a background thread; an episode is
+    never queued twice while it is in flight, and one that keeps failing is
+    retried at most every `daemon.retry_minutes`.
+    """
+
+    def __init__(self, cfg: Dict[str, Any], store: StateStore, user_prompt: str,
+                 stop: Optional[threading.Event] = None):
+        self.cfg = cfg
+        self.store = store
+        self.user_prompt = user_prompt
+        self.stop = stop or threading.Event()
+        dcfg = cfg.get("daemon") or {}
+        self.settings = PollSettings.from_config(dcfg)
+        self.retry_after = float(dcfg.get("retry_minutes", 60)) * 60
+        self.publish_command = dcfg.get("publish_command") or ""
+        self.max_attempts = int(cfg["pipeline"].get("max_attempts", 3))
+        self.feed_cache = store.load_feed_cache()
+        self._due: List[tuple] = [(0.0, url) for url in cfg["feeds"]]
+        heapq.heapify(self._due)
+        self._batches: "queue.Queue" = queue.Queue()
+        self._in_flight: set = set()
+        self._lock = threading.Lock()
+        self.polls = {"total": 0, "with_new": 0}
+
+    def next_poll(self, url: str, now: float) -> float:
+        cadence = learn_cadence(self.store.publish_times(url))
+        return now + poll_interval(now, cadence, self.settings)
+
+    def _enqueue(self, eps: List[Dict[str, Any]]) -> int:
+        with self._lock:
+            fresh = []
+            for ep in runnable(eps, self.store, self.max_attempts, self.retry_after):
+                if ep["id"] not in self._in_flight:
+                    self._in_flight.add(ep["id"])
+                    fresh.append(ep)
+        if fresh:
+            self._batches.put(fresh)
+        return len(fresh)
+
+    def poll_due(self, now: float) -> int:
+        """
+        Poll every feed that is due; queue new episodes and reschedule each feed. Returns episodes queued.
+        If polling fails the feeds are still rescheduled, `daemon.default_interval_minutes` from now.
+        """
+        urls = []
+        while self._due and self._due[0][0] <= now:
+            urls.append(heapq.heappop(self._due)[1])
+        if not urls:
+            return 0
+        pcfg = self.cfg["pipeline"]
+        ok = False
+        try:
+            with metrics.span("poll_feeds"):
+                new_eps = find_new_episodes(
+                    urls,
+                    self.store,
+                    per_feed_limit=int(pcfg.get("per_feed_limit", 3)),
+                    feed_cache=self.feed_cache,
+                    max_workers=int(pcfg.get("feed_workers", 4)),
+                    timeout=int(pcfg.get("feed_timeout", 30)),
+                )
+            self.store.save_feed_cache({url: self.feed_cache[url] for url in urls if url in self.feed_cache})
+            ok = True
+        finally:
+            # Popped feeds must go back on the heap whatever happened, or they are never polled again
+            for url in urls:
+                due = self.next_poll(url, time.time()) if ok else time.time() + self.settings.default_interval
+                heapq.heappush(self._due, (due, url))
+                log.info("Next poll of %s in %.0f min", url, (due - time.time()) / 60)
+        queued = self._enqueue(new_eps)
+        self.polls["total"] += len(urls)
+        self.polls["with_new"] += len({ep["feed_url"] for ep in new_eps if ep.get("feed_url")})
+        metrics.count("feed_polls", len(urls))
+        return queued
+
+    def _process(self, eps: List[Dict[str, Any]]):
+        metrics.start_run("daemon")
+        try:
+            process_episodes(eps, self.cfg, self.store, self.user_prompt)
+            publish(self.cfg, load_episodes(self.cfg["storage"]["episodes_dir"]))
+            self.store.mark_published()
+            now = time.time()
+            for ep in eps:
+                job = self.store.job(ep["id"])
+                if job and job["stage"] == "published" and ep.get("published_ts"):
+                    # How long after the feed published it the summary went live
+                    metrics.current().record_span("publication_lag", now - ep["published_ts"], episode=ep["id"])
+            if self.publish_command:
+                subprocess.run(self.publish_command, shell=True, check=False)
+        except Exception:
+            log.exception("Processing batch of %d episodes failed", len(eps))
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(ep["id"] for ep in eps)
+            metrics.write_report(self.cfg.get("metrics"))
+
+    def _worker(self):
+        while True:
+            batch = self._batches.get()
+            if batch is _STOP:
+                return
+            # Fold in whatever else arrived meanwhile so the site is rebuilt once per batch
+            while True:
+                try:
+                    more = self._batches.get_nowait()
+                except queue.Empty:
+                    break
+                if more is _STOP:
+                    self._batches.put(_STOP)
+                    break
+                batch.extend(more)
+            self._process(batch)
+
+    def run(self):
+        worker = threading.Thread(target=self._worker, name="daemon-process", daemon=True)
+        worker.start()
+        pending = self.store.pending_jobs(self.max_attempts)
+        if pending:
+            log.info("Resuming %d unfinished episodes from earlier runs", len(pending))
+            self._enqueue(pending)
+        log.info("Watching %d feeds", len(self.cfg["feeds"]))
+        while not self.stop.is_set():
+            try:
+                self.poll_due(time.time())
+            except Exception:
+                log.exception("Polling failed")
+            wait = self._due[0][0] - time.time() if self._due else self.settings.max_interval
+            self.stop.wait(max(1.0, wait))
+        log.info("Stopping after the current batch (%d polls, %d found new episodes)",
+                 self.polls["total"], self.polls["with_new"])
+        self._batches.put(_STOP)
+        worker.join()
+
+def main():
+    setup_logging()
+    cfg = load_config()
+    openai_pool.configure(cfg.get("openai"))
+    ensure_dir(cfg["storage"]["data_dir"])
+    ensure_dir(cfg["storage"]["episodes_dir"])
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    with open_state(cfg["storage"]) as store:
+        Daemon(cfg, store, load_prompt(), stop).run()
+
+if __name__ == "__main__":
+    main()
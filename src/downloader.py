@@ -1,34 +1,243 @@
+import glob
 import logging
 import os
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
 
 log = logging.getLogger("downloader")
 
-def download_audio(url: str, dest_dir: str, max_mb: int = 300) -> Optional[str]:
-    """Stream-download audio to dest_dir. Returns file path or None."""
-    os.makedirs(dest_dir, exist_ok=True)
+USER_AGENT = "sermon-summaries/1.0 (+https://github.com/lightbulbheaduk/sermon_summaries)"
+CHUNK_SIZE = 1024 * 1024
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+class TooLarge(Exception):
+    pass
+
+def get_session() -> requests.Session:
+    """Process-wide pooled Session so downloads reuse keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers["User-Agent"] = USER_AGENT
+            _session = s
+        return _session
+
+def probe(url: str, session: Optional[requests.Session] = None, timeout: int = 30) -> Dict[str, Any]:
+    """
+    HEAD the URL for its size, range support and a validator for `If-Range`
+    (a strong ETag, else Last-Modified). Empty values if the server won't say.
+    """
+    session = session or get_session()
+    info: Dict[str, Any] = {"size": None, "ranges": False, "url": url, "validator": None}
+    try:
+        r = session.head(url, allow_redirects=True, timeout=timeout)
+        if r.status_code < 400:
+            length = r.headers.get("Content-Length")
+            if length and length.isdigit():
+                info["size"] = int(length)
+            info["ranges"] = r.headers.get("Accept-Ranges", "").lower() == "bytes"
+            etag = r.headers.get("ETag")
+            # If-Range only accepts strong ETags
+            info["validator"] = etag if etag and not etag.startswith("W/") else r.headers.get("Last-Modified")
+            info["url"] = r.url or url
+    except requests.RequestException as e:
+        log.debug("HEAD failed for %s: %s", url, e)
+    return info
+
+def _fetch_range(session: requests.Session, url: str, part: str, start: int, end: Optional[int],
+                 max_bytes: int, timeout: int, if_range: Optional[str] = None) -> int:
+    """
+    Append bytes [start + len(part), end] of `url` to `part`, resuming whatever
+    is already there. With `if_range`, the server sends the whole file
+    instead of a range if it no longer matches that validator. Returns the
+    part's final size.
+    """
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    if end is not None and start + have > end:
+        return have
+    headers = {}
+    if start + have > 0 or end is not None:
+        headers["Range"] = "bytes=%d-%s" % (start + have, "" if end is None else end)
+        if if_range:
+            headers["If-Range"] = if_range
+    with session.get(url, stream=True, timeout=timeout, headers=headers) as r:
+        if r.status_code == 416 and end is None:
+            return have  # nothing left to fetch
+        r.raise_for_status()
+        mode = "ab"
+        if headers and r.status_code != 206:
+            if start > 0 or end is not None:
+                raise requests.HTTPError("Server ignored Range request for segment download")
+            log.info("Server ignored Range or the file changed; restarting download from byte 0")
+            mode, have = "wb", 0
+        with open(part, mode) as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    have += len(chunk)
+                    if start + have > max_bytes:
+                        raise TooLarge()
+    return have
+
+def _with_retries(fn, attempts: int, what: str):
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == attempts:
+                raise
+            delay = min(2 ** attempt, 10)
+            log.warning("%s interrupted (%s); resuming in %ds (attempt %d/%d)", what, e, delay, attempt + 1, attempts)
+            time.sleep(delay)
+
+def _download_segments(session: requests.Session, url: str, part: str, size: int, segments: int,
+                       max_bytes: int, timeout: int, attempts: int, if_range: Optional[str] = None):
+    """Fetch `size` bytes as parallel ranged segments, then stitch them into `part`."""
+    step = -(-size // segments)
+    bounds: List[Tuple[int, int]] = [(s, min(s + step, size) - 1) for s in range(0, size, step)]
+    seg_paths = ["%s.%d" % (part, i) for i in range(len(bounds))]
+
+    def fetch(i: int) -> int:
+        start, end = bounds[i]
+        return _with_retries(
+            lambda: _fetch_range(session, url, seg_paths[i], start, end, max_bytes, timeout, if_range),
+            attempts, "Segment %d" % i,
+        )
+
+    with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="segment") as pool:
+        sizes = list(pool.map(fetch, range(len(bounds))))
+    for (start, end), got in zip(bounds, sizes):
+        if got != end - start + 1:
+            raise requests.HTTPError("Segment %d-%d incomplete (%d bytes)" % (start, end, got))
+    with open(part, "wb") as out:
+        for p in seg_paths:
+            with open(p, "rb") as f:
+                while True:
+                    block = f.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    out.write(block)
+    for p in seg_paths:
+        os.remove(p)
+
+def _partials(part: str) -> List[str]:
+    """The `.part` file, its segment files and its validator stamp, whichever exist."""
+    return [p for p in [part, part + ".validator"] + glob.glob(glob.escape(part) + ".[0-9]*") if os.path.exists(p)]
+
+def _discard_partials(part: str):
+    for p in _partials(part):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+def stream_audio(url: str, sink: BinaryIO, max_mb: int = 300, timeout: int = 60,
+                 session: Optional[requests.Session] = None) -> int:
+    """
+    Stream the HTTP body of `url` into a writable binary `sink` (e.g. an
+    ffmpeg stdin pipe) without touching disk. Raises TooLarge once more than
+    `max_mb` has been read. Returns the number of bytes written.
+    """
+    session = session or get_session()
+    max_bytes = int(max_mb * 1024 * 1024)
+    total = 0
+    log.info("Streaming audio: %s", url)
+    with session.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        length = r.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise TooLarge()
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            if chunk:
+                sink.write(chunk)
+                total += len(chunk)
+                if total > max_bytes:
+                    raise TooLarge()
+    return total
+
+@metrics.timed("download")
+def download_audio(url: str, dest_dir: str, max_mb: int = 300, segments: int = 4,
+                   segment_min_mb: int = 32, timeout: int = 60, attempts: int = 4,
+                   session: Optional[requests.Session] = None) -> Optional[str]:
+    """
+    Download audio to dest_dir/audio. Returns file path or None.
+
+    The size is checked with a HEAD request first, so oversized files cost no
+    body bandwidth. Data is written to `<file>.part` and resumed with an HTTP
+    Range request after a dropped connection (or on a later call, as the
+    partial data is kept when a download fails). The server's ETag or
+    Last-Modified is stored next to the partial data and sent as `If-Range`,
+    so bytes of a file that has since changed are never spliced onto stale
+    ones. Files of
+    at least `segment_min_mb` on servers that accept ranges are fetched as
+    `segments` parallel ranged requests. The finished file is moved into
+    place atomically, and a file that is already complete is not fetched again.
+    """
+    session = session or get_session()
     local = os.path.join(dest_dir, "audio")
     os.makedirs(local, exist_ok=True)
     filename = os.path.basename(url.split("?")[0]) or "episode.mp3"
     path = os.path.join(local, filename)
+    part = path + ".part"
+    max_bytes = int(max_mb * 1024 * 1024)
+
+    info = probe(url, session, timeout=timeout)
+    size = info["size"]
+    if size is not None and size > max_bytes:
+        log.warning("File is %.1f MB, over max size (%d MB). Skipping download.", size / (1024 * 1024), max_mb)
+        return None
+    if size is not None and os.path.exists(path) and os.path.getsize(path) == size:
+        log.info("Already downloaded: %s", path)
+        return path
+
+    validator = info["validator"]
+    stamp = part + ".validator"
+    if _partials(part):
+        stored = None
+        if os.path.exists(stamp):
+            with open(stamp, "r", encoding="utf-8") as f:
+                stored = f.read()
+        if stored != validator:
+            log.info("%s changed on the server since the partial download; starting over", url)
+            _discard_partials(part)
+    if validator and not os.path.exists(stamp):
+        with open(stamp, "w", encoding="utf-8") as f:
+            f.write(validator)
 
     log.info("Downloading audio: %s", url)
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        total = 0
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-                    total += len(chunk)
-                    if (total / (1024 * 1024)) > max_mb:
-                        log.warning("File exceeds max size (%d MB). Aborting.", max_mb)
-                        f.close()
-                        try:
-                            os.remove(path)
-                        except OSError:
-                            pass
-                        return None
+    try:
+        if size and info["ranges"] and segments > 1 and size >= segment_min_mb * 1024 * 1024:
+            _download_segments(session, info["url"], part, size, segments, max_bytes, timeout, attempts, validator)
+        else:
+            _with_retries(lambda: _fetch_range(session, info["url"], part, 0, None, max_bytes, timeout, validator),
+                          attempts, "Download")
+        got = os.path.getsize(part)
+        if size is not None and got != size:
+            _discard_partials(part)  # not resumable: start from scratch next time
+            raise requests.HTTPError("Downloaded %d bytes, expected %d" % (got, size))
+    except TooLarge:
+        log.warning("File exceeds max size (%d MB). Aborting.", max_mb)
+        _discard_partials(part)
+        return None
+    except requests.RequestException as e:
+        log.error("Download failed for %s: %s (partial data kept for resume)", url, e)
+        return None
+
+    os.replace(part, path)
+    _discard_partials(part)
+    metrics.count("bytes_downloaded", os.path.getsize(path))
     log.info("Downloaded to %s (%.1f MB)", path, os.path.getsize(path) / (1024 * 1024))
-    return path
\ No newline at end of file
+    return path
@@ -1,12 +1,22 @@
+import heapq
+import io
 import logging
 import time
 import re
-from typing import Dict, List, Optional
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import mktime_tz, parsedate_tz
+from typing import Any, Container, Dict, List, Optional, Tuple, Union
 import feedparser
+import requests
+from requests.adapters import HTTPAdapter
 from .utils import slugify
 
 log = logging.getLogger("feed_watcher")
 
+USER_AGENT = "sermon-summaries/1.0 (+https://github.com/lightbulbheaduk/sermon_summaries)"
+
 IMG_TAG_RE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\']', re.IGNORECASE)
 
 def _first_img_from_html(html: Optional[str]) -> Optional[str]:
@@ -177,79 +187,349 @@ def _extract_image_from_feed(parsed) -> Optional[str]:
             return u
     return None
 
-def parse_feed(url: str) -> List[Dict]:
-    """Parse RSS and return episode dicts with fields we need."""
-    parsed = feedparser.parse(url)
-    feed_image_fallback = _extract_image_from_feed(parsed)
-
-    episodes = []
-    for entry in parsed.entries:
-        guid = (
-            getattr(entry, "id", None)
-            or getattr(entry, "guid", None)
-            or getattr(entry, "link", None)
-            or getattr(entry, "title", None)
-        )
-        if not guid:
-            continue
+def _entry_guid(entry) -> Optional[str]:
+    return (
+        getattr(entry, "id", None)
+        or getattr(entry, "guid", None)
+        or getattr(entry, "link", None)
+        or getattr(entry, "title", None)
+    )
+
+def _entry_ts(entry) -> int:
+    # Publish date handling (best-effort)
+    try:
+        if getattr(entry, "published_parsed", None):
+            return int(time.mktime(entry.published_parsed))
+        elif getattr(entry, "updated_parsed", None):
+            return int(time.mktime(entry.updated_parsed))
+    except Exception:
+        pass
+    return 0
 
-        # Prefer audio enclosures
-        audio_url = None
-        for enc in getattr(entry, "enclosures", []):
-            if "audio" in enc.get("type", "") or enc.get("href", "").endswith((".mp3", ".m4a", ".aac")):
-                audio_url = enc.get("href")
+def _parse_duration(value) -> Optional[int]:
+    """itunes:duration as seconds: "H:MM:SS", "MM:SS" or plain seconds (None if missing or unparseable)."""
+    if value is None:
+        return None
+    try:
+        seconds = 0.0
+        for part in str(value).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return int(seconds) if seconds > 0 else None
+
+def _build_episode(entry, guid: str, ts: int, feed_image_fallback: Optional[str]) -> Dict:
+    """Materialise the episode dict; this is where the expensive per-entry work happens."""
+    # Prefer audio enclosures
+    audio_url = None
+    audio_bytes = None
+    for enc in getattr(entry, "enclosures", []):
+        if "audio" in enc.get("type", "") or enc.get("href", "").endswith((".mp3", ".m4a", ".aac")):
+            audio_url = enc.get("href")
+            try:
+                audio_bytes = int(enc.get("length") or 0) or None
+            except ValueError:
+                pass
+            break
+    if not audio_url:
+        for lnk in getattr(entry, "links", []):
+            if str(lnk.get("type", "")).startswith("audio") and lnk.get("href"):
+                audio_url = lnk.get("href")
                 break
-        if not audio_url:
-            for lnk in getattr(entry, "links", []):
-                if str(lnk.get("type", "")).startswith("audio") and lnk.get("href"):
-                    audio_url = lnk.get("href")
-                    break
-
-        # Publish date handling (best-effort)
-        published = getattr(entry, "published", "") or getattr(entry, "updated", "")
-        ts = 0
+
+    published = getattr(entry, "published", "") or getattr(entry, "updated", "")
+
+    image_url = _extract_image_from_entry(entry) or feed_image_fallback
+    if not image_url:
+        log.debug("No image found for entry titled '%s'. Available keys: %s",
+                  getattr(entry, "title", "Untitled"), list(entry.keys()))
+
+    return {
+        "guid": str(guid),
+        "id": slugify(str(guid))[:80],
+        "title": getattr(entry, "title", "Untitled Episode"),
+        "link": getattr(entry, "link", ""),
+        "published": published,
+        "published_ts": ts,
+        "audio_url": audio_url,
+        "image_url": image_url,
+        "summary": getattr(entry, "summary", ""),
+        # As advertised by the feed; used to estimate cost before downloading (see `backfill`)
+        "duration_seconds": _parse_duration(getattr(entry, "itunes_duration", None)),
+        "audio_bytes": audio_bytes,
+    }
+
+# Streaming pre-selection: feed elements by local name (namespace stripped)
+_ITEM_TAGS = ("item", "entry")
+_PUBLISHED_TAGS = ("pubDate", "published", "issued")
+_UPDATED_TAGS = ("updated", "modified", "date")
+_GUID_TAGS = ("guid", "id", "link", "title")
+
+def _local_name(tag) -> str:
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+def _parse_date_text(text: Optional[str]) -> int:
+    if not text or not text.strip():
+        return 0
+    text = text.strip()
+    parsed = parsedate_tz(text)
+    if parsed:
         try:
-            if getattr(entry, "published_parsed", None):
-                ts = int(time.mktime(entry.published_parsed))
-            elif getattr(entry, "updated_parsed", None):
-                ts = int(time.mktime(entry.updated_parsed))
-        except Exception:
-            ts = 0
-
-        image_url = _extract_image_from_entry(entry) or feed_image_fallback
-        if not image_url:
-            log.debug("No image found for entry titled '%s'. Available keys: %s",
-                      getattr(entry, "title", "Untitled"), list(entry.keys()))
-
-        ep = {
-            "guid": str(guid),
-            "id": slugify(str(guid))[:80],
-            "title": getattr(entry, "title", "Untitled Episode"),
-            "link": getattr(entry, "link", ""),
-            "published": published,
-            "published_ts": ts,
-            "audio_url": audio_url,
-            "image_url": image_url,
-            "summary": getattr(entry, "summary", ""),
-        }
-        episodes.append(ep)
-    log.info("Parsed %d episodes from feed: %s", len(episodes), url)
+            return int(mktime_tz(parsed))
+        except (OverflowError, ValueError):
+            return 0
+    try:
+        return int(datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return 0
+
+def _item_rank(elem) -> Tuple[int, bool]:
+    """Cheap (timestamp, has_guid) for a raw <item>/<entry> element."""
+    # Last occurrence wins, as in feedparser
+    children = {_local_name(child.tag): child for child in elem}
+    has_guid = any(
+        tag in children and bool((children[tag].text or "").strip() or children[tag].get("href"))
+        for tag in _GUID_TAGS
+    )
+    for tags in (_PUBLISHED_TAGS, _UPDATED_TAGS):
+        for tag in tags:
+            if tag in children:
+                ts = _parse_date_text(children[tag].text)
+                if ts:
+                    return ts, has_guid
+    return 0, has_guid
+
+def _newest_items_xml(data: bytes, limit: int) -> Optional[bytes]:
+    """
+    Stream through a feed body with iterparse and rebuild a minimal document
+    holding the channel/feed header plus only the newest `limit` items.
+
+    Items are detached from the tree as soon as they are closed and ranked in a
+    bounded min-heap on their publish timestamp, so memory stays O(limit) and
+    feedparser only ever sees the survivors. Returns None when the body is not
+    well-formed XML (feedparser's lenient parser then handles the full body).
+    """
+    heap: List[Tuple[Tuple[int, int], ET.Element]] = []
+    stack: List[ET.Element] = []
+    seq = 0
+    try:
+        for event, elem in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            if _local_name(elem.tag) not in _ITEM_TAGS or not stack:
+                continue
+            container = stack[-1]
+            container.remove(elem)
+            ts, has_guid = _item_rank(elem)
+            # Earlier items win ties, matching the stable newest-first sort
+            key = (ts, -seq)
+            seq += 1
+            if not has_guid or limit <= 0:
+                continue
+            if len(heap) < limit:
+                heapq.heappush(heap, (key, elem))
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, elem))
+        root = elem if not stack else stack[0]
+    except ET.ParseError:
+        return None
+    if seq == 0:
+        return None
+    for _, item in sorted(heap, reverse=True):
+        container.append(item)
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+def _utf8_headers(headers: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """`headers` with the Content-Type charset set to utf-8, for a body `_newest_items_xml` re-encoded."""
+    if not headers:
+        return headers
+    out = {}
+    for name, value in headers.items():
+        if name.lower() == "content-type":
+            value = re.sub(r";\s*charset=[^;]*", "", value, flags=re.I) + "; charset=utf-8"
+        out[name] = value
+    return out
+
+def parse_feed(source: Union[str, bytes], response_headers: Optional[Dict[str, str]] = None,
+               limit: Optional[int] = None) -> List[Dict]:
+    """Parse RSS and return episode dicts with fields we need.
+
+    `source` is either a feed URL or the raw XML body already fetched by
+    `fetch_feed` (in which case the HTTP response headers help feedparser
+    pick the right character encoding).
+
+    With `limit`, only the newest `limit` entries (by publish timestamp) are
+    returned, newest first. A raw body is pre-filtered with a streaming pass
+    so feedparser never sees the rest, and image resolution/slugging only run
+    for the surviving entries.
+    """
+    label = source if isinstance(source, str) else "%d bytes" % len(source)
+    if limit is not None and isinstance(source, bytes):
+        reduced = _newest_items_xml(source, int(limit))
+        if reduced is not None:
+            # Re-serialised as UTF-8: a charset from the server would now be wrong
+            source, response_headers = reduced, _utf8_headers(response_headers)
+
+    parsed = feedparser.parse(source, response_headers=response_headers)
+
+    candidates = []
+    for idx, entry in enumerate(parsed.entries):
+        guid = _entry_guid(entry)
+        if not guid:
+            continue
+        candidates.append((_entry_ts(entry), -idx, guid, entry))
+    if limit is not None:
+        candidates = heapq.nlargest(max(0, int(limit)), candidates, key=lambda c: (c[0], c[1]))
+
+    feed_image_fallback = _extract_image_from_feed(parsed) if candidates else None
+    episodes = [_build_episode(entry, guid, ts, feed_image_fallback) for ts, _, guid, entry in candidates]
+    log.info("Parsed %d episodes from feed: %s", len(episodes), label)
     return episodes
 
-def find_new_episodes(all_feeds: List[str], processed_ids: List[str], per_feed_limit: int = 3) -> List[Dict]:
+def _make_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+def fetch_feed(url: str, cache_entry: Optional[Dict[str, Any]] = None,
+               session: Optional[requests.Session] = None, timeout: int = 30) -> Dict[str, Any]:
+    """
+    Conditionally GET a feed using the ETag/Last-Modified values from a previous run.
+
+    Returns a result dict with the HTTP status, the body (None on 304 or error),
+    the validators to store for next time and the elapsed wall-clock seconds.
+    """
+    headers = {}
+    if cache_entry:
+        if cache_entry.get("etag"):
+            headers["If-None-Match"] = cache_entry["etag"]
+        if cache_entry.get("modified"):
+            headers["If-Modified-Since"] = cache_entry["modified"]
+
+    result: Dict[str, Any] = {
+        "url": url,
+        "status": None,
+        "content": None,
+        "headers": {},
+        "etag": (cache_entry or {}).get("etag"),
+        "modified": (cache_entry or {}).get("modified"),
+        "elapsed": 0.0,
+        "error": None,
+    }
+    start = time.monotonic()
+    try:
+        r = (session or requests).get(url, headers=headers, timeout=timeout)
+        result["status"] = r.status_code
+        if r.status_code != 304:
+            r.raise_for_status()
+            result["content"] = r.content
+            result["headers"] = {k.lower(): v for k, v in r.headers.items()}
+            result["etag"] = r.headers.get("ETag")
+            result["modified"] = r.headers.get("Last-Modified")
+    except requests.RequestException as e:
+        result["error"] = str(e)
+    result["elapsed"] = time.monotonic() - start
+    return result
+
+def poll_feeds(all_feeds: List[str], feed_cache: Dict[str, Dict[str, Any]], per_feed_limit: Optional[int] = 3,
+               max_workers: int = 4, timeout: int = 30) -> List[Dict[str, Any]]:
+    """
+    Fetch and parse every feed concurrently through a bounded thread pool.
+
+    `feed_cache` maps feed URL -> stored validators plus the newest
+    `per_feed_limit` episodes seen on the last successful fetch (every episode
+    when `per_feed_limit` is None). It is updated
+    in place so the caller can persist it. A feed answering 304 Not Modified is
+    never parsed; its cached episodes are reused instead so that episodes which
+    failed processing last time are still retried.
+
+    Returns one result dict per feed, in the same order as `all_feeds`.
+    """
+    limit = None if per_feed_limit is None else max(0, int(per_feed_limit))
+
+    def work(url: str) -> Dict[str, Any]:
+        entry = feed_cache.get(url)
+        # Validators are only useful if the cached episode list was built with the same limit
+        conditional = entry if entry and entry.get("limit") == limit else None
+        res = fetch_feed(url, conditional, session=session, timeout=timeout)
+        if res["status"] == 304 and conditional is None:
+            # Nothing was cached to fall back on; treat it as a failed poll rather than an empty feed
+            res["error"] = "304 Not Modified to an unconditional request"
+        if res["error"]:
+            res["episodes"] = []
+        elif res["status"] == 304:
+            res["episodes"] = list(conditional.get("episodes", []))
+        else:
+            parse_start = time.monotonic()
+            res["episodes"] = parse_feed(res["content"], response_headers=res["headers"], limit=limit)
+            res["elapsed"] += time.monotonic() - parse_start
+        res["content"] = None  # don't hold on to feed bodies once parsed
+        for ep in res["episodes"]:
+            ep["feed_url"] = url
+        return res
+
+    workers = max(1, min(int(max_workers), len(all_feeds) or 1))
+    with _make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(work, all_feeds))
+
+    for res in results:
+        if res["error"]:
+            continue
+        feed_cache[res["url"]] = {
+            "etag": res["etag"],
+            "modified": res["modified"],
+            "limit": limit,
+            "episodes": res["episodes"],
+            "last_status": res["status"],
+            "last_poll": int(time.time()),
+        }
+    return results
+
+def format_feed_report(results: List[Dict[str, Any]]) -> str:
+    """One line per feed: status, elapsed time and number of candidate episodes."""
+    lines = []
+    for res in results:
+        if res["error"]:
+            status = "error (%s)" % res["error"]
+        elif res["status"] == 304:
+            status = "304 not modified"
+        else:
+            status = str(res["status"])
+        lines.append("  %-60s %-20s %6.2fs  %d candidates" % (res["url"], status, res["elapsed"], len(res.get("episodes", []))))
+    return "\n".join(lines)
+
+def find_new_episodes(all_feeds: List[str], processed_ids: Container[str], per_feed_limit: int = 3,
+                      feed_cache: Optional[Dict[str, Dict[str, Any]]] = None,
+                      max_workers: int = 4, timeout: int = 30) -> List[Dict]:
     """
     Return new episodes not seen before, but only consider the newest 'per_feed_limit'
     items per feed.
+
+    Feeds are polled concurrently (see `poll_feeds`); pass a persistent
+    `feed_cache` dict to enable conditional GETs between runs. `processed_ids`
+    can be any container, typically the `state.StateStore`.
     """
+    if feed_cache is None:
+        feed_cache = {}
+    start = time.monotonic()
+    results = poll_feeds(all_feeds, feed_cache, per_feed_limit=per_feed_limit,
+                         max_workers=max_workers, timeout=timeout)
+
     new_eps: List[Dict] = []
-    for feed in all_feeds:
-        eps = parse_feed(feed)
-        eps.sort(key=lambda e: e.get("published_ts", 0), reverse=True)
-        limited = eps[:max(0, int(per_feed_limit))]
+    for res in results:
         added = 0
-        for ep in limited:
+        for ep in res["episodes"]:
             if ep["audio_url"] and ep["id"] not in processed_ids:
                 new_eps.append(ep)
                 added += 1
-        log.info("Feed considered newest %d; %d new to process", len(limited), added)
-    return new_eps
\ No newline at end of file
+        if res["error"]:
+            log.error("Feed %s failed: %s", res["url"], res["error"])
+        else:
+            log.info("Feed considered newest %d; %d new to process", len(res["episodes"]), added)
+    log.info("Polled %d feeds in %.2fs:\n%s", len(results), time.monotonic() - start, format_feed_report(results))
+    return new_eps
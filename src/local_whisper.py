@@ -0,0 +1,116 @@
+"""
+Local CPU transcription with faster-whisper (an optional dependency:
+`pip install faster-whisper`).
+
+Chunks are decoded by a pool of worker processes, each holding its own copy
+of a quantised Whisper model (CTranslate2, int8 by default) and using
+`cpu_threads` threads, so a machine's cores are kept busy across chunks and
+episodes without the GIL getting in the way. Within a chunk, speech segments
+are decoded in batches of `batch_size` (faster-whisper's batched pipeline).
+The text per chunk is what the API returns, so transcripts come out in the
+same shape whichever backend produced them.
+"""
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from . import metrics
+from .transcriber import TranscriptionBackend
+
+try:
+    import faster_whisper
+except ImportError:  # optional; only needed for transcription.backend: faster-whisper
+    faster_whisper = None
+
+log = logging.getLogger("local_whisper")
+
+DEFAULTS = {
+    "model": "small.en",
+    "compute_type": "int8",
+    "workers": 0,
+    "cpu_threads": 4,
+    "batch_size": 8,
+    "beam_size": 5,
+    "download_root": "",
+}
+
+# Per worker process: the loaded model and its batch size
+_model = None
+_batch_size = 1
+
+def _init_worker(model: str, compute_type: str, cpu_threads: int, batch_size: int, download_root: str):
+    global _model, _batch_size
+    whisper = faster_whisper.WhisperModel(model, device="cpu", compute_type=compute_type,
+                                          cpu_threads=cpu_threads, download_root=download_root or None)
+    _model = faster_whisper.BatchedInferencePipeline(model=whisper) if batch_size > 1 else whisper
+    _batch_size = batch_size
+
+def _transcribe_file(path: str, language: Optional[str], beam_size: int) -> Tuple[str, float]:
+    """Runs in a worker process: (text, audio seconds) for one chunk."""
+    kwargs: Dict[str, Any] = {"language": language, "beam_size": beam_size, "vad_filter": True}
+    if _batch_size > 1:
+        kwargs["batch_size"] = _batch_size
+    segments, info = _model.transcribe(path, **kwargs)
+    return " ".join(s.text.strip() for s in segments), float(info.duration)
+
+def settings(fw_cfg: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """`transcription.faster_whisper` merged over `DEFAULTS`, with `workers: 0` resolved from the core count."""
+    s = dict(DEFAULTS, **(fw_cfg or {}))
+    s["cpu_threads"] = max(1, int(s["cpu_threads"]))
+    s["workers"] = int(s["workers"]) or max(1, (os.cpu_count() or 1) // s["cpu_threads"])
+    s["batch_size"] = max(1, int(s["batch_size"]))
+    return s
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """Transcribes chunks on a pool of `workers` processes, each loading the model once."""
+
+    def __init__(self, fw_cfg: Optional[Dict[str, Any]] = None):
+        if faster_whisper is None:
+            raise RuntimeError("transcription.backend is faster-whisper but it is not installed "
+                               "(pip install faster-whisper)")
+        s = settings(fw_cfg)
+        self.settings = s
+        self.name = "faster-whisper/%s/%s" % (s["model"], s["compute_type"])
+        self.beam_size = int(s["beam_size"])
+        # Spawned, not forked: the pipeline process is full of threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=s["workers"], mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(s["model"], s["compute_type"], s["cpu_threads"], s["batch_size"], s["download_root"]),
+        )
+        log.info("Local transcription with %s: %d processes x %d threads, batch size %d",
+                 self.name, s["workers"], s["cpu_threads"], s["batch_size"])
+
+    def transcribe(self, path: str, language_hint: Optional[str]) -> str:
+        log.info("Transcribing chunk locally: %s", os.path.basename(path))
+        with metrics.span("transcribe_chunk"):
+            text, seconds = self._pool.submit(_transcribe_file, path, language_hint, self.beam_size).result()
+        metrics.count("chunks_transcribed")
+        metrics.count("audio_seconds_transcribed", seconds)
+        return text
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+_backends: Dict[str, FasterWhisperBackend] = {}
+_backends_lock = threading.Lock()
+
+def get_backend(fw_cfg: Optional[Dict[str, Any]] = None) -> FasterWhisperBackend:
+    """The process-wide backend for these settings; models are loaded once and shared by every episode."""
+    key = json.dumps(settings(fw_cfg), sort_keys=True)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = FasterWhisperBackend(fw_cfg)
+        return _backends[key]
+
+@atexit.register
+def shutdown():
+    with _backends_lock:
+        for backend in _backends.values():
+            backend.close()
+        _backends.clear()
@@ -1,15 +1,14 @@
 import logging
 import os
-import shutil
 from typing import Any, Dict, List
 
 import yaml
 
-from .utils import setup_logging, read_json, write_json, read_text, ensure_dir
+from . import metrics, openai_pool
+from .utils import setup_logging, read_text, ensure_dir
+from .state import StateStore, open_state
 from .feed_watcher import find_new_episodes
-from .downloader import download_audio
-from .transcriber import transcribe_audio
-from .summarizer import extract_key_info
+from .pipeline import process_episodes, runnable
 from .publisher import load_episodes, publish_site
 
 log = logging.getLogger("main")
@@ -21,111 +20,89 @@ def load_config(path: str = "config.yml") -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
+def load_prompt() -> str:
+    prompt_path = "prompt.txt" if os.path.exists("prompt.txt") else "prompt.example.txt"
+    log.info("Using prompt from %s", prompt_path)
+    return read_text(prompt_path)
+
 def main():
     setup_logging()
     log.info("Starting pipeline")
 
     cfg = load_config()
-    data_dir = cfg["storage"]["data_dir"]
+    openai_pool.configure(cfg.get("openai"))
+    ensure_dir(cfg["storage"]["data_dir"])
+    ensure_dir(cfg["storage"]["episodes_dir"])
+
+    metrics.start_run("pipeline")
+    store = open_state(cfg["storage"])
+    try:
+        run(cfg, store)
+    finally:
+        store.close()
+        metrics.write_report(cfg.get("metrics"))
+
+def publish(cfg: Dict[str, Any], episodes: List[Dict[str, Any]]):
+    site = cfg["site"]
+    cache_dir = (cfg.get("cache") or {}).get("dir", os.path.join(cfg["storage"]["data_dir"], "cache"))
+    publish_site(
+        cfg["storage"]["site_dir"], episodes, site["title"], site["description"], site.get("base_url", ""),
+        api_page_size=int(site.get("api_page_size", 20)),
+        index_page_size=int(site.get("index_page_size", 20)),
+        archive_by_month=bool(site.get("archive_by_month", False)),
+        search=bool(site.get("search", True)),
+        search_cache_dir=os.path.join(cache_dir, "search"),
+        bible=bool(site.get("bible_index", True)),
+        bible_index_path=os.path.join(cache_dir, "bible_index.json"),
+    )
+
+def run(cfg: Dict[str, Any], store: StateStore):
+    """One pass of the pipeline: discover, process and publish."""
     episodes_dir = cfg["storage"]["episodes_dir"]
-    state_file = cfg["storage"]["state_file"]
-    site_dir = cfg["storage"]["site_dir"]
-    ensure_dir(data_dir)
-    ensure_dir(episodes_dir)
-
-    state = read_json(state_file, {"processed_ids": []})
-    processed_ids: List[str] = state.get("processed_ids", [])
 
-    # Find new episodes
+    # Find new episodes (feeds polled concurrently; ETag/Last-Modified kept between runs)
     feeds = cfg["feeds"]
     per_feed_limit = int(cfg["pipeline"].get("per_feed_limit", 3))
-    new_eps = find_new_episodes(feeds, processed_ids, per_feed_limit=per_feed_limit)
+    feed_cache = store.load_feed_cache()
+    with metrics.span("poll_feeds"):
+        new_eps = find_new_episodes(
+            feeds,
+            store,
+            per_feed_limit=per_feed_limit,
+            feed_cache=feed_cache,
+            max_workers=int(cfg["pipeline"].get("feed_workers", 4)),
+            timeout=int(cfg["pipeline"].get("feed_timeout", 30)),
+        )
+    store.save_feed_cache(feed_cache)
+    metrics.count("episodes_new", len(new_eps))
     log.info("New episodes to process: %d", len(new_eps))
 
+    # Episodes an earlier run left unfinished (crash or failed stage) resume where they stopped
+    max_attempts = int(cfg["pipeline"].get("max_attempts", 3))
+    queued = {ep["id"] for ep in new_eps}
+    pending = [ep for ep in store.pending_jobs(max_attempts) if ep["id"] not in queued]
+    if pending:
+        log.info("Resuming %d unfinished episodes from earlier runs", len(pending))
+    new_eps = runnable(new_eps + pending, store, max_attempts)
+
     if not new_eps:
-        # Still republish site with existing content; keeps "last updated" fresh during manual runs
+        # Still republish; only pages whose inputs changed (templates, config, edited data) are rewritten
         episodes = load_episodes(episodes_dir)
-        publish_site(site_dir, episodes, cfg["site"]["title"], cfg["site"]["description"], cfg["site"].get("base_url", ""))
+        publish(cfg, episodes)
+        store.mark_published()
         log.info("No new episodes. Done.")
         return
 
-    # Load prompt
-    prompt_path = "prompt.txt" if os.path.exists("prompt.txt") else "prompt.example.txt"
-    user_prompt = read_text(prompt_path)
-    log.info("Using prompt from %s", prompt_path)
+    user_prompt = load_prompt()
 
-    for ep in new_eps:
-        ep_id = ep["id"]
-        ep_dir = os.path.join(episodes_dir, ep_id)
-        ensure_dir(ep_dir)
-
-        # Save minimal meta
-        meta = {
-        "id": ep_id,
-        "guid": ep["guid"],
-        "title": ep["title"],
-        "link": ep["link"],
-        "published": ep["published"],
-        "published_ts": ep.get("published_ts", 0),  # add this line
-        "feed_audio_url": ep["audio_url"],
-        "image_url": ep.get("image_url"),          # keep image if you’re capturing it
-        }
-        write_json(os.path.join(ep_dir, "meta.json"), meta)
-
-        # Download audio
-        tmp_dir = os.path.join(data_dir, "tmp", ep_id)
-        ensure_dir(tmp_dir)
-        audio_path = download_audio(ep["audio_url"], data_dir, cfg["pipeline"]["max_download_mb"])
-        if not audio_path:
-            log.error("Skipping %s due to download failure/size.", ep_id)
-            continue
-
-        try:
-            # Transcribe
-            transcript_text = transcribe_audio(
-                input_path=audio_path,
-                work_dir=tmp_dir,
-                model=cfg["openai"]["transcription_model"],
-                segment_seconds=cfg["pipeline"]["segment_seconds"],
-                language_hint=cfg["pipeline"].get("language_hint"),
-            )
-            write_json(os.path.join(ep_dir, "transcript.json"), {"text": transcript_text})
-
-            # Summarize/extract
-            summary = extract_key_info(
-                transcript=transcript_text,
-                user_prompt=user_prompt,
-                model=cfg["openai"]["summarize_model"],
-                temperature=float(cfg["openai"].get("temperature", 0.2)),
-            )
-            # Trim quotes if needed
-            max_quotes = int(cfg["pipeline"].get("max_quotes", 5))
-            summary["quotes"] = summary.get("quotes", [])[:max_quotes]
-            write_json(os.path.join(ep_dir, "summary.json"), summary)
-
-            # Mark processed
-            processed_ids.append(ep_id)
-            state["processed_ids"] = processed_ids
-            write_json(state_file, state)
-
-        finally:
-            # Cleanup temp/audio
-            try:
-                if os.path.exists(tmp_dir):
-                    shutil.rmtree(tmp_dir, ignore_errors=True)
-            except Exception:
-                pass
-            try:
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-            except Exception:
-                pass
+    process_episodes(new_eps, cfg, store, user_prompt)
 
     # Rebuild site
     episodes = load_episodes(episodes_dir)
     # Sort newest first by published if available
     episodes.sort(key=lambda e: (e.get("published_ts") or 0, e.get("published") or ""), reverse=True)
-    publish_site(site_dir, episodes, cfg["site"]["title"], cfg["site"]["description"], cfg["site"].get("base_url", ""))
+    publish(cfg, episodes)
+    store.mark_published()
 
     log.info("Pipeline complete.")
 
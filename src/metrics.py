@@ -0,0 +1,199 @@
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from .utils import write_json, write_text
+
+log = logging.getLogger("metrics")
+
+T = TypeVar("T")
+
+# Episode the current code is working on; spans and counters are also attributed to it
+_episode: contextvars.ContextVar = contextvars.ContextVar("metrics_episode", default=None)
+
+PROMETHEUS_PREFIX = "podcast_pipeline"
+
+def _bump_span(table: Dict[str, Dict[str, Any]], name: str, seconds: float, error: bool):
+    s = table.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "errors": 0})
+    s["count"] += 1
+    s["seconds"] += seconds
+    s["max_seconds"] = max(s["max_seconds"], seconds)
+    if error:
+        s["errors"] += 1
+
+class RunMetrics:
+    """
+    Span durations and counters for one run, in total and per episode.
+    Safe to share between threads.
+    """
+
+    def __init__(self, command: str = "pipeline"):
+        self.command = command
+        self.started = time.time()
+        self._start = time.monotonic()
+        self.spans: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, float] = {}
+        self.episodes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _episode_entry(self, ep_id: str) -> Dict[str, Any]:
+        return self.episodes.setdefault(ep_id, {"spans": {}, "counters": {}})
+
+    def record_span(self, name: str, seconds: float, error: bool = False, episode: Optional[str] = None):
+        with self._lock:
+            _bump_span(self.spans, name, seconds, error)
+            if episode:
+                _bump_span(self._episode_entry(episode)["spans"], name, seconds, error)
+
+    def count(self, name: str, n: float = 1, episode: Optional[str] = None):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if episode:
+                counters = self._episode_entry(episode)["counters"]
+                counters[name] = counters.get(name, 0) + n
+
+    def episode_counters(self, ep_id: str) -> Dict[str, float]:
+        """A copy of the counters recorded against `ep_id` so far."""
+        with self._lock:
+            return dict(self.episodes.get(ep_id, {}).get("counters", {}))
+
+    def report(self) -> Dict[str, Any]:
+        """The run as a JSON-serialisable dict (seconds rounded to milliseconds)."""
+        def spans(table):
+            return {k: dict(v, seconds=round(v["seconds"], 3), max_seconds=round(v["max_seconds"], 3))
+                    for k, v in sorted(table.items())}
+
+        with self._lock:
+            return {
+                "command": self.command,
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "wall_seconds": round(time.monotonic() - self._start, 3),
+                "spans": spans(self.spans),
+                "counters": dict(sorted(self.counters.items())),
+                "episodes": {ep_id: {"spans": spans(e["spans"]), "counters": dict(sorted(e["counters"].items()))}
+                             for ep_id, e in sorted(self.episodes.items())},
+            }
+
+_run = RunMetrics()
+
+def start_run(command: str = "pipeline") -> RunMetrics:
+    """Start collecting a fresh run (spans recorded before this are dropped)."""
+    global _run
+    _run = RunMetrics(command)
+    return _run
+
+def current() -> RunMetrics:
+    return _run
+
+@contextlib.contextmanager
+def episode(ep_id: str) -> Iterator[None]:
+    """Attribute spans and counters recorded inside the block (and in `bind`-ed tasks) to `ep_id`."""
+    token = _episode.set(ep_id)
+    try:
+        yield
+    finally:
+        _episode.reset(token)
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the block as span `name`; an exception counts as an error and is re-raised."""
+    start = time.monotonic()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _run.record_span(name, time.monotonic() - start, error, _episode.get())
+
+def timed(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator form of `span`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name: str, n: float = 1):
+    """Add `n` to counter `name` for the run and the current episode."""
+    if n:
+        _run.count(name, n, _episode.get())
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wrap `fn` to run in the caller's context, so work handed to a thread pool
+    is still attributed to the episode that submitted it.
+    """
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets its own copy
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text(report: Dict[str, Any], prefix: str = PROMETHEUS_PREFIX) -> str:
+    """Run totals in the Prometheus text exposition format (for node_exporter's textfile collector)."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(str(v))}"' for k, v in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+    command = {"command": report["command"]}
+    spans = report["spans"].items()
+    metric("span_seconds", "gauge", "Total seconds spent in each span during the last run.",
+           [(dict(command, span=k), v["seconds"]) for k, v in spans])
+    metric("span_max_seconds", "gauge", "Longest single span during the last run.",
+           [(dict(command, span=k), v["max_seconds"]) for k, v in spans])
+    metric("span_count", "gauge", "Number of spans during the last run.",
+           [(dict(command, span=k), v["count"]) for k, v in spans])
+    metric("span_errors", "gauge", "Spans that raised during the last run.",
+           [(dict(command, span=k), v["errors"]) for k, v in spans])
+    metric("counter", "gauge", "Counters (bytes, tokens, cache hits, ...) for the last run.",
+           [(dict(command, name=k), v) for k, v in report["counters"].items()])
+    metric("run_seconds", "gauge", "Wall-clock duration of the last run.", [(command, report["wall_seconds"])])
+    metric("last_run_timestamp_seconds", "gauge", "When the last run started.",
+           [(command, int(datetime.fromisoformat(report["started"]).timestamp()))])
+    return "\n".join(lines) + "\n"
+
+def write_report(metrics_cfg: Optional[Dict[str, Any]], run: Optional[RunMetrics] = None) -> Optional[str]:
+    """
+    Write the run report to `<runs_dir>/<UTC timestamp>.json` (keeping the
+    newest `keep_runs`) and, if `prometheus_textfile` is set, the run totals
+    in Prometheus text format. Returns the report path (None when disabled).
+    """
+    mcfg = metrics_cfg or {}
+    report = (run or _run).report()
+    path = None
+    runs_dir = mcfg.get("runs_dir", os.path.join("logs", "runs"))
+    if runs_dir:
+        stamp = datetime.fromisoformat(report["started"]).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(runs_dir, f"{stamp}-{report['command']}.json")
+        write_json(path, report)
+        keep = int(mcfg.get("keep_runs", 100))
+        if keep > 0:
+            reports = sorted(n for n in os.listdir(runs_dir) if n.endswith(".json"))
+            for name in reports[:-keep]:
+                os.remove(os.path.join(runs_dir, name))
+        log.info("Run report written to %s", path)
+
+    textfile = mcfg.get("prometheus_textfile")
+    if textfile:
+        write_text(textfile, prometheus_text(report))  # atomic, so the collector never reads half a file
+    return path
@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import openai
+from openai import OpenAI
+from tenacity import Retrying, RetryCallState, stop_after_attempt, wait_exponential
+
+from . import metrics
+
+log = logging.getLogger("openai_pool")
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """
+    Continuous-refill token bucket: `rate_per_minute` tokens per minute, at
+    most `capacity` banked (a minute's worth by default). A rate of 0 or less
+    disables the limit. Safe to share between threads.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = float(rate_per_minute) / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, n: float = 1.0):
+        """Block until `n` tokens are available, then take them (requests bigger than the bucket wait for a full one)."""
+        if self.rate <= 0 or n <= 0:
+            return
+        n = min(float(n), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                delay = (n - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def adjust(self, n: float):
+        """Charge (or with a negative `n`, refund) tokens after the fact, e.g. once actual usage is known."""
+        if self.rate <= 0 or not n:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - n)
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that halves when the API throttles us and creeps back
+    up by one after a run of successes (AIMD), between 1 and `maximum`.
+    """
+
+    def __init__(self, maximum: int, increase_after: int = 8):
+        self.maximum = max(1, int(maximum))
+        self.limit = self.maximum
+        self.in_flight = 0
+        self.increase_after = increase_after
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> "AdaptiveLimit":
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def success(self):
+        with self._cond:
+            self._successes += 1
+            if self.limit < self.maximum and self._successes >= self.increase_after:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def throttled(self):
+        with self._cond:
+            self._successes = 0
+            new = max(1, self.limit // 2)
+            if new != self.limit:
+                log.info("Throttled by the API; concurrency %d -> %d", self.limit, new)
+            self.limit = new
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Delay the server asked for in `retry-after-ms` / `Retry-After` (seconds), if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue  # HTTP-date form; fall back to backoff
+    return None
+
+def _is_throttle(exc: BaseException) -> bool:
+    return isinstance(exc, openai.RateLimitError) or getattr(exc, "status_code", None) in (429, 503)
+
+class wait_retry_after:
+    """tenacity wait: the server's Retry-After when it sent one, otherwise `fallback`."""
+
+    def __init__(self, fallback: Callable[[RetryCallState], float], maximum: float = 60.0):
+        self.fallback = fallback
+        self.maximum = maximum
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        delay = retry_after_seconds(exc) if exc is not None else None
+        if delay is None:
+            return self.fallback(retry_state)
+        return min(delay, self.maximum)
+
+class OpenAIPool:
+    """
+    One OpenAI client shared by every caller of a kind of request
+    (transcription, summarisation), with a requests/min and tokens/min token
+    bucket, an adaptive concurrency limit, and retries that honour
+    `Retry-After`. The client's own retries are disabled so all backoff
+    happens here, where it can see every concurrent call.
+    """
+
+    def __init__(self, client: Any = None, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 8, attempts: int = 4):
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveLimit(max_concurrency)
+        self.attempts = attempts
+        self.wait = wait_retry_after(wait_exponential(min=1, max=10))
+
+    @property
+    def client(self) -> Any:
+        with self._client_lock:
+            if self._client is None:
+                self._client = OpenAI(max_retries=0)
+            return self._client
+
+    def call(self, fn: Callable[[Any], T], tokens: int = 0) -> T:
+        """
+        Run `fn(client)` under the limits, retrying failures (`tokens` is the
+        estimated token cost, corrected from `usage` when the response has it).
+        """
+        for attempt in Retrying(wait=self.wait, stop=stop_after_attempt(self.attempts), reraise=True,
+                                before_sleep=self._before_sleep):
+            with attempt:
+                self.requests.acquire(1)
+                self.tokens.acquire(tokens)
+                with self.concurrency:
+                    result = fn(self.client)
+                self.concurrency.success()
+                used = getattr(getattr(result, "usage", None), "total_tokens", None)
+                if isinstance(used, int):
+                    self.tokens.adjust(used - tokens)
+        return result
+
+    def _before_sleep(self, retry_state: RetryCallState):
+        exc = retry_state.outcome.exception()
+        metrics.count("openai_retries")
+        if _is_throttle(exc):
+            metrics.count("openai_throttled")
+            self.concurrency.throttled()
+        log.warning("OpenAI request failed (%s); retrying in %.1fs (attempt %d/%d)",
+                    exc, retry_state.next_action.sleep, retry_state.attempt_number + 1, self.attempts)
+
+_pools: Dict[str, OpenAIPool] = {}
+_pools_lock = threading.Lock()
+_shared_client: Any = None
+_settings: Dict[str, Any] = {}
+
+def configure(openai_cfg: Optional[Dict[str, Any]]):
+    """
+    Apply the `openai:` config section (`base_url`, `timeout`, and
+    `rate_limits.<kind>.{requests_per_minute, tokens_per_minute, max_concurrency}`).
+    Pools created before this call are discarded.
+    """
+    global _shared_client, _settings
+    with _pools_lock:
+        _settings = dict(openai_cfg or {})
+        _shared_client = None
+        _pools.clear()
+
+def get_pool(kind: str) -> OpenAIPool:
+    """The process-wide pool for `kind` ("transcription" or "summarize"); all kinds share one HTTP client."""
+    global _shared_client
+    with _pools_lock:
+        if kind not in _pools:
+            if _shared_client is None:
+                options = {k: _settings[k] for k in ("base_url", "timeout") if _settings.get(k)}
+                _shared_client = OpenAI(max_retries=0, **options)
+            limits = (_settings.get("rate_limits") or {}).get(kind) or {}
+            _pools[kind] = OpenAIPool(
+                client=_shared_client,
+                requests_per_minute=float(limits.get("requests_per_minute", 0)),
+                tokens_per_minute=float(limits.get("tokens_per_minute", 0)),
+                max_concurrency=int(limits.get("max_concurrency", 8)),
+                attempts=int(limits.get("attempts", 4)),
+            )
+        return _pools[kind]
+
+def as_pool(client: Any, kind: str) -> OpenAIPool:
+    """Accept an OpenAIPool, a bare client (wrapped without limits, e.g. a test fake) or None (the shared pool)."""
+    if client is None:
+        return get_pool(kind)
+    if isinstance(client, OpenAIPool):
+        return client
+    return OpenAIPool(client=client)
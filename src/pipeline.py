@@ -0,0 +1,294 @@
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from . import metrics
+from .utils import read_json, write_json, ensure_dir
+from .downloader import TooLarge, download_audio
+from .transcriber import backend_from_config, transcribe_audio_segments, transcribe_url_segments
+from .summarizer import extract_key_info
+from .state import STAGES, StateStore
+from .cache import SummaryCache, open_chunk_cache, open_summary_cache
+from .catalogue import update_catalogue
+
+log = logging.getLogger("pipeline")
+
+# Queue sentinel telling a stage worker to exit
+_DONE = object()
+
+# Job stage (see `state.STAGES`) checkpointed when each pipeline stage completes
+STAGE_DONE = {"download": "downloaded", "transcribe": "transcribed", "summarize": "summarised"}
+
+def _stage_download(job: Dict[str, Any], cfg: Dict[str, Any]) -> bool:
+    ep = job["ep"]
+    ensure_dir(job["ep_dir"])
+
+    # Save minimal meta
+    meta = {
+        "id": ep["id"],
+        "guid": ep["guid"],
+        "title": ep["title"],
+        "link": ep["link"],
+        "published": ep["published"],
+        "published_ts": ep.get("published_ts", 0),
+        "feed_audio_url": ep["audio_url"],
+        "image_url": ep.get("image_url"),
+    }
+    write_json(os.path.join(job["ep_dir"], "meta.json"), meta)
+
+    # Download into the episode's own tmp dir so concurrent downloads never share a filename
+    ensure_dir(job["tmp_dir"])
+    if cfg["pipeline"].get("stream_download"):
+        # The transcribe stage pipes the download straight into the segmenter
+        job["audio_path"] = None
+        return True
+    job["audio_path"] = download_audio(
+        ep["audio_url"],
+        job["tmp_dir"],
+        cfg["pipeline"]["max_download_mb"],
+        segments=int(cfg["pipeline"].get("download_segments", 4)),
+        segment_min_mb=int(cfg["pipeline"].get("download_segment_min_mb", 32)),
+    )
+    if not job["audio_path"]:
+        log.error("Skipping %s due to download failure/size.", ep["id"])
+        return False
+    return True
+
+def _stage_transcribe(job: Dict[str, Any], cfg: Dict[str, Any]) -> bool:
+    kwargs = dict(
+        work_dir=job["tmp_dir"],
+        model=cfg["openai"]["transcription_model"],
+        segment_seconds=cfg["pipeline"]["segment_seconds"],
+        language_hint=cfg["pipeline"].get("language_hint"),
+        max_in_flight=int(cfg["pipeline"].get("transcribe_max_in_flight", 4)),
+        cache=job.get("chunk_cache"),
+        preprocess=cfg["pipeline"].get("preprocess"),
+        backend=backend_from_config(cfg),
+    )
+    transcript = None
+    if job["audio_path"] is None:
+        try:
+            transcript = transcribe_url_segments(job["ep"]["audio_url"], max_mb=cfg["pipeline"]["max_download_mb"], **kwargs)
+        except TooLarge:
+            log.error("Skipping %s: audio exceeds max size (%s MB).", job["ep"]["id"], cfg["pipeline"]["max_download_mb"])
+            return False
+        except subprocess.CalledProcessError as e:
+            # Chunks already transcribed are in the chunk cache, so falling back is cheap
+            log.warning("Streaming segmentation failed for %s (%s); falling back to a full download.", job["ep"]["id"], e)
+            _cleanup(job)
+            if not _stage_download(job, dict(cfg, pipeline=dict(cfg["pipeline"], stream_download=False))):
+                return False
+    if transcript is None:
+        transcript = transcribe_audio_segments(input_path=job["audio_path"],
+                                               segmentation=cfg["pipeline"].get("segmentation"), **kwargs)
+    write_json(os.path.join(job["ep_dir"], "transcript.json"), transcript)
+    job["transcript"] = transcript["text"]
+    # Audio is no longer needed; free the disk space before the episode waits for a summariser
+    _cleanup(job)
+    return True
+
+def summarize_transcript(transcript: str, user_prompt: str, cfg: Dict[str, Any],
+                         cache: Optional[SummaryCache] = None) -> Dict[str, Any]:
+    """
+    Summarise a transcript with the configured model, reusing a cached
+    summary for the same (transcript, prompt, model, temperature) if there is one.
+    """
+    model = cfg["openai"]["summarize_model"]
+    temperature = float(cfg["openai"].get("temperature", 0.2))
+    key = cache.summary_key(transcript, user_prompt, model, temperature) if cache is not None else None
+    summary = cache.get_summary(key) if key else None
+    if summary is not None:
+        metrics.count("summary_cache_hits")
+    else:
+        scfg = cfg["pipeline"].get("summarization") or {}
+        summary = extract_key_info(
+            transcript=transcript,
+            user_prompt=user_prompt,
+            model=model,
+            temperature=temperature,
+            map_reduce_tokens=int(scfg.get("map_reduce_above_tokens", 0)) or None,
+            section_tokens=int(scfg.get("section_tokens", 6000)),
+            max_in_flight=int(scfg.get("max_in_flight", 4)),
+        )
+        if key:
+            cache.put_summary(key, summary)
+    # Trim quotes if needed
+    max_quotes = int(cfg["pipeline"].get("max_quotes", 5))
+    if "quotes" in summary:
+        summary = dict(summary, quotes=summary["quotes"][:max_quotes])
+    return summary
+
+def _stage_summarize(job: Dict[str, Any], cfg: Dict[str, Any]) -> bool:
+    summary = summarize_transcript(job["transcript"], job["user_prompt"], cfg, job.get("summary_cache"))
+    write_json(os.path.join(job["ep_dir"], "summary.json"), summary)
+    update_catalogue(os.path.dirname(job["ep_dir"]), job["ep"]["id"])
+    return True
+
+def _cleanup(job: Dict[str, Any]):
+    # Cleanup temp/audio
+    try:
+        if os.path.exists(job["tmp_dir"]):
+            shutil.rmtree(job["tmp_dir"], ignore_errors=True)
+    except Exception:
+        pass
+
+def _stage_worker(name: str, fn: Callable[[Dict[str, Any], Dict[str, Any]], bool], cfg: Dict[str, Any],
+                  in_q: "queue.Queue", out_q: Optional["queue.Queue"],
+                  on_result: Callable[[Dict[str, Any], str, bool, Optional[str]], None]):
+    while True:
+        job = in_q.get()
+        if job is _DONE:
+            return
+        ep_id = job["ep"]["id"]
+        start = time.monotonic()
+        error = None
+        try:
+            with metrics.episode(ep_id), metrics.span("stage." + name):
+                ok = fn(job, cfg)
+        except Exception as e:
+            log.exception("Stage %s failed for %s", name, ep_id)
+            ok, error = False, "%s: %s" % (type(e).__name__, e)
+        log.info("Stage %s %s for %s in %.1fs", name, "done" if ok else "failed", ep_id, time.monotonic() - start)
+        on_result(job, name, ok, error)
+        if ok and out_q is not None:
+            # Blocks while the next stage is saturated, which bounds the work in flight
+            out_q.put(job)
+        elif ok:
+            _cleanup(job)
+        # A failed job's tmp dir (e.g. a partial download) is left for `on_result` to keep or remove
+
+def _resume_transcript(job: Dict[str, Any]) -> bool:
+    """Load the transcript an earlier run already wrote, so the job can go straight to summarising."""
+    transcript = read_json(os.path.join(job["ep_dir"], "transcript.json"), None)
+    if not isinstance(transcript, dict) or not transcript.get("text"):
+        return False
+    job["transcript"] = transcript["text"]
+    return True
+
+def runnable(eps: List[Dict[str, Any]], store: StateStore, max_attempts: int = 0,
+             retry_after: float = 0) -> List[Dict[str, Any]]:
+    """
+    Drop episodes whose job has already failed `max_attempts` times (0 = no
+    limit) or whose last failure was less than `retry_after` seconds ago.
+    """
+    now = time.time()
+    keep = []
+    for ep in eps:
+        job = store.job(ep["id"])
+        if job and job["error"]:
+            if max_attempts > 0 and job["attempts"] >= max_attempts:
+                log.debug("Not retrying %s: failed %d times (%s)", ep["id"], job["attempts"], job["error"])
+                continue
+            if retry_after and now - (job["updated_at"] or 0) < retry_after:
+                continue
+        keep.append(ep)
+    return keep
+
+def process_episodes(new_eps: Iterable[Dict[str, Any]], cfg: Dict[str, Any], store: StateStore, user_prompt: str,
+                     on_finished: Optional[Callable[[Dict[str, Any], bool], None]] = None) -> Dict[str, int]:
+    """
+    Run download -> transcribe -> summarise as a staged pipeline.
+
+    Each stage has its own pool of worker threads (`pipeline.download_workers`,
+    `transcribe_workers`, `summarize_workers`) connected by bounded queues
+    (`pipeline.queue_size`), so several episodes are in flight at once and a
+    slow or failing episode only occupies one worker of one stage. Episodes
+    are marked processed in `store` as soon as their summary is written.
+
+    Each completed stage is checkpointed in `store` (see `state.STAGES`), and
+    a failure is recorded against the job. `new_eps` is consumed lazily, as
+    the download queue has room, so it may be a generator deciding what to
+    admit next; `on_finished(ep, ok)` is called (from a worker thread) once
+    each episode is summarised or has failed. An episode that already got past
+    transcription in an earlier run resumes at summarising, from the
+    transcript it wrote; one stopped after downloading re-enters the
+    download stage, which finds the complete file and does not fetch it
+    again. A failed job's temp directory is removed, unless
+    `pipeline.keep_failed_downloads` is set: then it is kept until the job
+    has used up `pipeline.max_attempts`, so a retried download resumes from
+    its `.part` file.
+
+    Returns counts of processed and failed episodes.
+    """
+    pcfg = cfg["pipeline"]
+    episodes_dir = cfg["storage"]["episodes_dir"]
+    data_dir = cfg["storage"]["data_dir"]
+    queue_size = max(1, int(pcfg.get("queue_size", 2)))
+
+    stages = [
+        ("download", _stage_download, max(1, int(pcfg.get("download_workers", 2)))),
+        ("transcribe", _stage_transcribe, max(1, int(pcfg.get("transcribe_workers", 2)))),
+        ("summarize", _stage_summarize, max(1, int(pcfg.get("summarize_workers", 2)))),
+    ]
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    chunk_cache = open_chunk_cache(cfg)
+    summary_cache = open_summary_cache(cfg)
+    counts = {"processed": 0, "failed": 0}
+    counts_lock = threading.Lock()
+    max_attempts = int(pcfg.get("max_attempts", 3))
+    keep_failed = bool(pcfg.get("keep_failed_downloads", False))
+
+    def on_result(job: Dict[str, Any], name: str, ok: bool, error: Optional[str]):
+        ep = job["ep"]
+        if not ok:
+            store.job_failed(ep["id"], error or "%s stage failed" % name)
+            # Optionally keep partial downloads for the retry to resume; clean up once there won't be one
+            if not keep_failed or (max_attempts > 0 and store.job(ep["id"])["attempts"] >= max_attempts):
+                _cleanup(job)
+        else:
+            store.advance(ep["id"], STAGE_DONE[name])
+            if name != stages[-1][0]:
+                return
+            store.mark_processed(ep["id"], guid=ep["guid"], feed_url=ep.get("feed_url"))
+        with counts_lock:
+            counts["processed" if ok else "failed"] += 1
+        metrics.count("episodes_processed" if ok else "episodes_failed")
+        if on_finished is not None:
+            on_finished(ep, ok)
+
+    pools = []
+    for i, (name, fn, workers) in enumerate(stages):
+        out_q = queues[i + 1] if i + 1 < len(stages) else None
+        threads = [
+            threading.Thread(target=_stage_worker, name=f"{name}-{n}",
+                             args=(name, fn, cfg, queues[i], out_q, on_result), daemon=True)
+            for n in range(workers)
+        ]
+        for t in threads:
+            t.start()
+        pools.append(threads)
+
+    for ep in new_eps:
+        stage = store.start_job(ep)
+        job = {
+            "ep": ep,
+            "ep_dir": os.path.join(episodes_dir, ep["id"]),
+            "tmp_dir": os.path.join(data_dir, "tmp", ep["id"]),
+            "user_prompt": user_prompt,
+            "chunk_cache": chunk_cache,
+            "summary_cache": summary_cache,
+        }
+        if STAGES.index(stage) >= STAGES.index("transcribed") and _resume_transcript(job):
+            log.info("Resuming %s at summarise (transcribed in an earlier run)", ep["id"])
+            metrics.count("episodes_resumed")
+            queues[2].put(job)
+        else:
+            queues[0].put(job)
+
+    # Drain stage by stage: once a stage's workers have exited, nothing more can reach the next one
+    for i, threads in enumerate(pools):
+        for _ in threads:
+            queues[i].put(_DONE)
+        for t in threads:
+            t.join()
+
+    if chunk_cache is not None:
+        log.info("Chunk cache: %d hits, %d misses", chunk_cache.hits, chunk_cache.misses)
+    log.info("Pipeline processed %d episodes (%d failed)", counts["processed"], counts["failed"])
+    return counts
@@ -1,36 +1,28 @@
+import hashlib
+import json
 import logging
 import os
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, TextIO
 from urllib.parse import quote_plus
 
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from .utils import ensure_dir, read_json, write_json
+from . import metrics
+from .utils import atomic_open, ensure_dir, read_json, slugify, write_json, write_text
+from .catalogue import LazyEpisode, load_episode_list
+from .bible import BOOKS, VERSE_BASE, BibleIndex
+from .search import PREFIX_LEN, STOPWORDS, build_shards, doc_numbers, episode_terms, prune_cache
 
 log = logging.getLogger("publisher")
 
 def load_episodes(episodes_dir: str) -> List[Dict[str, Any]]:
-    """Load episode meta + summary/transcript for rendering."""
-    items = []
-    if not os.path.exists(episodes_dir):
-        return items
-    for ep_id in sorted(os.listdir(episodes_dir)):
-        ep_path = os.path.join(episodes_dir, ep_id)
-        if not os.path.isdir(ep_path):
-            continue
-        meta = read_json(os.path.join(ep_path, "meta.json"), {})
-        summary = read_json(os.path.join(ep_path, "summary.json"), {})
-        transcript = read_json(os.path.join(ep_path, "transcript.json"), {}).get("text", "")
-        items.append({
-        "id": ep_id,
-        "title": meta.get("title", ep_id),
-        "published": meta.get("published", ""),
-        "published_ts": meta.get("published_ts", 0),  # add this
-        "link": meta.get("link", ""),
-        "image_url": meta.get("image_url", None),
-        "summary": summary,
-        "transcript": transcript,
-        })
+    """
+    Load the episode list for rendering from the catalogue (see `catalogue.py`).
+
+    Only the compact metadata the index needs is held in memory; each item's
+    `summary` and `transcript` are read from disk on access.
+    """
+    items: List[Dict[str, Any]] = list(load_episode_list(episodes_dir))
     # Ensure episodes are returned sorted by published date (newest first).
     # Some callers (or manual uses of `publisher.load_episodes`) expect a
     # newest-first ordering; `src/main.py` also sorts before publishing but
@@ -38,14 +30,160 @@ def load_episodes(episodes_dir: str) -> List[Dict[str, Any]]:
     items.sort(key=lambda e: (e.get("published_ts") or 0, e.get("published") or ""), reverse=True)
     return items
 
-def publish_site(site_dir: str, episodes: List[Dict], site_title: str, site_description: str, base_url: str = ""):
-    """Render HTML pages into docs/. Uses relative links to avoid 404s on GitHub Pages."""
+def _materialise(ep: Dict[str, Any]) -> Dict[str, Any]:
+    return ep.materialise() if isinstance(ep, LazyEpisode) else ep
+
+MANIFEST_NAME = ".manifest.json"
+
+def _digest(*parts: Any) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _index_fields(ep: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of an episode the index page actually renders."""
+    summary = ep.get("summary") or {}
+    return {
+        "id": ep["id"],
+        "title": ep.get("title"),
+        "published": ep.get("published"),
+        "link": ep.get("link"),
+        "image_url": ep.get("image_url"),
+        "overall_theme": ep.get("overall_theme") or (summary.get("overall_theme") if isinstance(summary, dict) else None),
+    }
+
+def _index_href(n: int, root: str) -> str:
+    return root + ("index.html" if n == 1 else f"page/{n}.html")
+
+def _month_key(ep: Dict[str, Any]) -> str:
+    ts = ep.get("published_ts") or 0
+    return datetime.utcfromtimestamp(ts).strftime("%Y-%m") if ts else "undated"
+
+def _month_label(key: str) -> str:
+    return "Undated" if key == "undated" else datetime.strptime(key, "%Y-%m").strftime("%B %Y")
+
+API_DIR = "api"
+CHANGES_NAME = "changes.json"
+CHANGES_KEEP = 50
+
+def _dump(f: TextIO, data: Any):
+    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+def _api_record(ep: Dict[str, Any]) -> Dict[str, Any]:
+    """An episode as listed in the paginated API index: just enough for a list view."""
+    fields = _index_fields(ep)
+    return {
+        "id": fields["id"],
+        "title": fields["title"],
+        "published": fields["published"],
+        "published_ts": ep.get("published_ts", 0),
+        "theme": fields["overall_theme"],
+        "image_url": fields["image_url"],
+        "href": f"{API_DIR}/episodes/{ep['id']}.json",
+    }
+
+def _api_detail(ep: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": ep["id"],
+        "title": ep.get("title"),
+        "published": ep.get("published", ""),
+        "published_ts": ep.get("published_ts", 0),
+        "link": ep.get("link", ""),
+        "image_url": ep.get("image_url"),
+        "page": f"episodes/{ep['id']}.html",
+        "summary": ep["summary"] or {},
+        "transcript": f"{API_DIR}/transcripts/{ep['id']}.json",
+    }
+
+def _page_path(n: int) -> str:
+    return f"{API_DIR}/index/{n}.json"
+
+def _record_changes(site_dir: str, build_time: datetime, changed: List[Dict[str, Any]],
+                    removed: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Append a "changes since the previous build" shard under `api/changes/` and
+    list it in `api/changes.json` (newest first, last CHANGES_KEEP builds).
+    Returns the updated changes log, or None if nothing changed.
+    """
+    log_path = os.path.join(site_dir, API_DIR, CHANGES_NAME)
+    changes = read_json(log_path, {"builds": []})
+    if not changed and not removed:
+        return None
+    builds = changes["builds"]
+    build_id = build_time.strftime("%Y%m%dT%H%M%SZ")
+    taken = {b["id"] for b in builds}
+    n = 1
+    while build_id in taken:  # more than one build in the same second
+        n += 1
+        build_id = "%s-%d" % (build_time.strftime("%Y%m%dT%H%M%SZ"), n)
+    stamp = build_time.isoformat() + "Z"
+    href = f"{API_DIR}/changes/{build_id}.json"
+    write_json(os.path.join(site_dir, href), {
+        "build_time": stamp,
+        "since": builds[0]["build_time"] if builds else None,
+        "changed": changed,
+        "removed": removed,
+    }, compact=True)
+    builds.insert(0, {"id": build_id, "build_time": stamp, "href": href,
+                      "changed": len(changed), "removed": len(removed)})
+    for old in builds[CHANGES_KEEP:]:
+        try:
+            os.remove(os.path.join(site_dir, old["href"]))
+        except FileNotFoundError:
+            pass
+    changes = {"latest": stamp, "builds": builds[:CHANGES_KEEP]}
+    write_json(log_path, changes, compact=True)
+    return changes
+
+@metrics.timed("publish")
+def publish_site(site_dir: str, episodes: List[Dict], site_title: str, site_description: str, base_url: str = "",
+                 force: bool = False, api_page_size: int = 20, index_page_size: int = 20,
+                 archive_by_month: bool = False, search: bool = True,
+                 search_cache_dir: Optional[str] = None, bible: bool = True,
+                 bible_index_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Render HTML pages into docs/. Uses relative links to avoid 404s on GitHub Pages.
+
+    Publishing is incremental: `<site_dir>/.manifest.json` records a hash of
+    every input that went into each output (episode data, templates, site
+    config). Outputs whose inputs are unchanged are neither rendered nor
+    written, and pages for episodes that no longer exist are removed. Pass
+    `force=True` to rebuild everything. Returns counts of written, unchanged
+    and removed files.
+
+    The index is split into pages of `index_page_size` episodes (`index.html`,
+    then `page/<n>.html`) so the front page stays the same size as the archive
+    grows; `archive_by_month` adds `archive/index.html` and one page per month.
+
+    With `search`, `search.html` queries a prebuilt inverted index over
+    titles, themes, quotes and transcripts: `search/docs.json` lists the
+    episodes and `search/<prefix>.json` holds the postings for terms starting
+    with that prefix, so a query only fetches the shards for its words. Each
+    episode's term weights are cached in `search_cache_dir` under its content
+    digest, so only changed episodes are re-tokenised and only shards whose
+    postings changed are rewritten.
+
+    With `bible`, passages from the summaries are normalised into a
+    `bible.BibleIndex` (persisted at `bible_index_path`, updated only for
+    changed episodes) and rendered as `bible/index.html` plus one page per book.
+
+    Alongside the HTML a sharded JSON API is written (compact JSON, paths
+    relative to the site root): `feed.json` is a small root document linking
+    to `api/index/<n>.json`, pages of `api_page_size` lightweight records with
+    prev/next links; each record links to `api/episodes/<id>.json` (summary),
+    which links to `api/transcripts/<id>.json`. Every build that changes
+    episodes adds an `api/changes/<build>.json` shard listed in
+    `api/changes.json`, so clients can poll for what changed since they last looked.
+    """
     ensure_dir(site_dir)
     ensure_dir(os.path.join(site_dir, "episodes"))
 
     # Ensure GitHub Pages does not try to run Jekyll
-    with open(os.path.join(site_dir, ".nojekyll"), "w", encoding="utf-8") as f:
-        f.write("")
+    nojekyll = os.path.join(site_dir, ".nojekyll")
+    if not os.path.exists(nojekyll):
+        write_text(nojekyll, "")
 
     env = Environment(
         loader=FileSystemLoader("templates"),
@@ -57,25 +195,202 @@ def publish_site(site_dir: str, episodes: List[Dict], site_title: str, site_desc
         return f"https://www.biblegateway.com/passage/?search={quote_plus(ref)}&version=NIV"
     env.filters["bible_link"] = bible_link
 
+    now = datetime.utcnow()
     ctx_common = {
         "site_title": site_title,
         "site_description": site_description,
-        "build_time": datetime.utcnow().isoformat() + "Z",
+        "build_time": now.isoformat() + "Z",
     }
 
-    # Index
+    def template_digest(*names: str) -> str:
+        return _digest(*(env.loader.get_source(env, n)[0] for n in names))
+
+    site_cfg = {"title": site_title, "description": site_description, "base_url": base_url}
+    manifest_path = os.path.join(site_dir, MANIFEST_NAME)
+    old = {} if force else read_json(manifest_path, {})
+    outputs: Dict[str, str] = {}
+    stats = {"written": 0, "unchanged": 0, "removed": 0}
+
+    def emit(rel: str, digest: str, render: Callable[[TextIO], None]) -> bool:
+        outputs[rel] = digest
+        path = os.path.join(site_dir, rel)
+        if old.get(rel) == digest and os.path.exists(path):
+            stats["unchanged"] += 1
+            return False
+        with atomic_open(path) as f:
+            render(f)
+        stats["written"] += 1
+        return True
+
+    # Links from the index pages to the optional extra views (relative to the site root)
+    nav = [href_label for href_label, enabled in (
+        (("search.html", "Search"), search),
+        (("archive/index.html", "Browse by month"), archive_by_month),
+        (("bible/index.html", "Bible passages"), bible),
+    ) if enabled]
+
+    # Index: index.html is page 1, later pages are page/<n>.html (index_page_size <= 0 disables paging)
     tmpl_idx = env.get_template("index.html")
-    html = tmpl_idx.render(title="Home", episodes=episodes, **ctx_common)
-    with open(os.path.join(site_dir, "index.html"), "w", encoding="utf-8") as f:
-        f.write(html)
+    idx_templates = template_digest("base.html", "index.html")
+    per_page = int(index_page_size) if index_page_size and int(index_page_size) > 0 else max(1, len(episodes))
+    n_pages = max(1, -(-len(episodes) // per_page))
+    for n in range(1, n_pages + 1):
+        root = "" if n == 1 else "../"
+        page_eps = episodes[(n - 1) * per_page:n * per_page]
+        ctx = {
+            "root": root,
+            "nav": nav,
+            "pagination": {
+                "page": n,
+                "pages": n_pages,
+                "prev": _index_href(n - 1, root) if n > 1 else None,
+                "next": _index_href(n + 1, root) if n < n_pages else None,
+            },
+        }
+        emit(
+            _index_href(n, ""),
+            _digest(idx_templates, site_cfg, ctx, [_index_fields(ep) for ep in page_eps]),
+            lambda f, page_eps=page_eps, ctx=ctx: f.write(
+                tmpl_idx.render(title="Home", episodes=page_eps, **ctx, **ctx_common)),
+        )
+
+    # Archive: archive/index.html lists months, archive/<yyyy-mm>.html lists that month's episodes
+    if archive_by_month:
+        months: Dict[str, List[Dict[str, Any]]] = {}
+        for ep in episodes:
+            months.setdefault(_month_key(ep), []).append(ep)
+        month_list = [{"key": key, "label": _month_label(key), "count": len(eps)} for key, eps in months.items()]
+        tmpl_arc = env.get_template("archive.html")
+        emit(
+            "archive/index.html",
+            _digest(template_digest("base.html", "archive.html"), site_cfg, month_list),
+            lambda f: f.write(tmpl_arc.render(title="Archive", months=month_list, root="../", **ctx_common)),
+        )
+        for month in month_list:
+            month_eps = months[month["key"]]
+            emit(
+                f"archive/{month['key']}.html",
+                _digest(idx_templates, site_cfg, month, nav, [_index_fields(ep) for ep in month_eps]),
+                lambda f, month=month, month_eps=month_eps: f.write(tmpl_idx.render(
+                    title=month["label"], heading=month["label"], episodes=month_eps,
+                    root="../", nav=nav, pagination=None, **ctx_common)),
+            )
 
     # Episode pages
     tmpl_ep = env.get_template("episode.html")
+    ep_templates = template_digest("base.html", "episode.html")
     for ep in episodes:
-        html = tmpl_ep.render(title=ep["title"], episode=ep, **ctx_common)
-        with open(os.path.join(site_dir, "episodes", f"{ep['id']}.html"), "w", encoding="utf-8") as f:
-            f.write(html)
+        emit(
+            f"episodes/{ep['id']}.html",
+            _digest(ep_templates, site_cfg, ep),
+            # Summary and transcript are only loaded for pages actually being rendered
+            lambda f, ep=ep: f.write(tmpl_ep.render(title=ep["title"], episode=_materialise(ep), **ctx_common)),
+        )
+
+    # Sharded JSON API: paginated index -> per-episode detail -> transcript
+    page_size = max(1, int(api_page_size))
+    pages = max(1, -(-len(episodes) // page_size))
+    for n in range(1, pages + 1):
+        page = {
+            "page": n,
+            "pages": pages,
+            "total": len(episodes),
+            "episodes": [_api_record(ep) for ep in episodes[(n - 1) * page_size:n * page_size]],
+            "prev": _page_path(n - 1) if n > 1 else None,
+            "next": _page_path(n + 1) if n < pages else None,
+        }
+        emit(_page_path(n), _digest(page), lambda f, page=page: _dump(f, page))
+
+    changed = []
+    for ep in episodes:
+        ep_digest = _digest(ep)
+        if emit(f"{API_DIR}/episodes/{ep['id']}.json", ep_digest, lambda f, ep=ep: _dump(f, _api_detail(ep))):
+            changed.append(_api_record(ep))
+        emit(f"{API_DIR}/transcripts/{ep['id']}.json", ep_digest,
+             lambda f, ep=ep: _dump(f, {"id": ep["id"], "text": ep["transcript"] or ""}))
+
+    prefix = f"{API_DIR}/episodes/"
+    removed = sorted(rel[len(prefix):-len(".json")] for rel in set(old) - set(outputs) if rel.startswith(prefix))
+    changes = _record_changes(site_dir, now, changed, removed) \
+        or read_json(os.path.join(site_dir, API_DIR, CHANGES_NAME), {})
+
+    # Bible passage index: bible/index.html lists books, bible/<book>.html lists passages by chapter
+    if bible:
+        bindex = BibleIndex(bible_index_path)
+        bindex.update(episodes, _digest)
+        titles = {ep["id"]: ep.get("title") for ep in episodes}
+        tmpl_book = env.get_template("bible_book.html")
+        book_templates = template_digest("base.html", "bible_book.html")
+        books = []
+        for book in BOOKS:
+            entries = [{"ref": str(ref), "chapter": ref.start // VERSE_BASE, "id": ep_id, "title": titles.get(ep_id, ep_id),
+                        "further": kind == "f"} for ref, ep_id, kind in bindex.book_entries(book)]
+            if not entries:
+                continue
+            slug = slugify(book)
+            books.append({"name": book, "slug": slug, "episodes": len({e["id"] for e in entries})})
+            emit(
+                f"bible/{slug}.html",
+                _digest(book_templates, site_cfg, book, entries),
+                lambda f, book=book, entries=entries: f.write(tmpl_book.render(
+                    title=book, book=book, entries=entries, root="../", **ctx_common)),
+            )
+        tmpl_bible = env.get_template("bible.html")
+        emit(
+            "bible/index.html",
+            _digest(template_digest("base.html", "bible.html"), site_cfg, books),
+            lambda f: f.write(tmpl_bible.render(title="Bible passages", books=books, root="../", **ctx_common)),
+        )
+
+    # Client-side search. Documents keep the number they were first given
+    # (oldest first), so a new, backfilled or removed episode only touches the
+    # shards for its own terms; docs.json has a null where a removed one was.
+    if search:
+        docs = list(reversed(episodes))
+        numbers = doc_numbers([ep["id"] for ep in docs], search_cache_dir)
+        vectors = {numbers[ep["id"]]: episode_terms(ep, _digest(ep), search_cache_dir) for ep in docs}
+        if search_cache_dir:
+            prune_cache(search_cache_dir, (ep["id"] for ep in docs))
+        for prefix, shard in build_shards(vectors).items():
+            emit(f"search/{prefix}.json", _digest(shard), lambda f, shard=shard: _dump(f, shard))
+        doc_list: List[Any] = [None] * (max(vectors) + 1 if vectors else 0)
+        for ep in docs:
+            doc_list[numbers[ep["id"]]] = [ep["id"], ep.get("title"), ep.get("published", "")]
+        emit("search/docs.json", _digest(doc_list), lambda f: _dump(f, doc_list))
+        tmpl_search = env.get_template("search.html")
+        stopwords = sorted(STOPWORDS)
+        emit(
+            "search.html",
+            _digest(template_digest("base.html", "search.html"), site_cfg, stopwords, PREFIX_LEN),
+            lambda f: f.write(tmpl_search.render(title="Search", stopwords=stopwords, prefix_len=PREFIX_LEN,
+                                                 root="", **ctx_common)),
+        )
+
+    # Small entry point: poll this (or api/changes.json) and follow the links
+    root = {
+        "version": 2,
+        "title": site_title,
+        "total": len(episodes),
+        "page_size": page_size,
+        "pages": pages,
+        "first": _page_path(1),
+        "changes": f"{API_DIR}/{CHANGES_NAME}",
+        "updated": changes.get("latest"),
+    }
+    emit("feed.json", _digest(root), lambda f: _dump(f, root))
+
+    # Drop pages we generated previously for episodes that are gone
+    for rel in set(old) - set(outputs):
+        try:
+            os.remove(os.path.join(site_dir, rel))
+            stats["removed"] += 1
+        except FileNotFoundError:
+            pass
 
-    # JSON feed for programmatic access
-    write_json(os.path.join(site_dir, "feed.json"), episodes)
-    log.info("Published %d episodes to %s", len(episodes), site_dir)
\ No newline at end of file
+    if outputs != old:
+        write_json(manifest_path, outputs)
+    for name, n in stats.items():
+        metrics.count("site_files_" + name, n)
+    log.info("Published %d episodes to %s (%d files written, %d unchanged, %d removed)",
+             len(episodes), site_dir, stats["written"], stats["unchanged"], stats["removed"])
+    return stats
@@ -0,0 +1,134 @@
+"""
+Re-summarise stored episodes without downloading or transcribing anything.
+
+Reads each episode's `transcript.json` and regenerates `summary.json` with the
+current prompt, model and temperature. Summaries are looked up in the summary
+cache first (see `cache.SummaryCache`), so after a prompt tweak only episodes
+whose (transcript, prompt, model, temperature) combination has not been seen
+before are sent to the API.
+
+    python -m src.resummarize                 # re-summarise everything that is stale, then republish
+    python -m src.resummarize --dry-run       # just count what would hit the API
+    python -m src.resummarize --seed          # record existing summaries as current for this prompt/model
+    python -m src.resummarize --ids a b       # only these episodes
+"""
+import argparse
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import metrics, openai_pool
+from .utils import setup_logging, read_json, write_json
+from .cache import SummaryCache, open_summary_cache
+from .catalogue import load_catalogue, update_catalogue
+from .pipeline import summarize_transcript
+
+log = logging.getLogger("resummarize")
+
+def _settings(cfg: Dict[str, Any]):
+    return cfg["openai"]["summarize_model"], float(cfg["openai"].get("temperature", 0.2))
+
+def resummarize(cfg: Dict[str, Any], user_prompt: str, ids: Optional[Iterable[str]] = None,
+                cache: Optional[SummaryCache] = None, workers: int = 4, per_minute: float = 0,
+                dry_run: bool = False, seed: bool = False) -> Dict[str, int]:
+    """
+    Bring every episode's summary in line with the current prompt and model.
+
+    Cached combinations are written straight from the cache; the rest are
+    summarised concurrently (`workers` at a time, at most `per_minute`
+    episodes started per minute). `seed` records the existing summaries as the
+    answer for the current settings instead of calling the API. Episodes whose
+    summary did not change are left untouched so the site rebuild skips them.
+    Returns counts of cached, summarised, unchanged, seeded, skipped and failed episodes.
+    """
+    episodes_dir = cfg["storage"]["episodes_dir"]
+    model, temperature = _settings(cfg)
+    wanted = list(ids) if ids else sorted(load_catalogue(episodes_dir))
+    counts = {"cached": 0, "summarised": 0, "unchanged": 0, "seeded": 0, "skipped": 0, "failed": 0}
+    lock = threading.Lock()
+    # A bucket of one: episode starts are spaced evenly, never bursting past per_minute
+    starts = openai_pool.TokenBucket(per_minute, capacity=1)
+
+    def bump(name: str):
+        with lock:
+            counts[name] += 1
+
+    def one(ep_id: str):
+        ep_dir = os.path.join(episodes_dir, ep_id)
+        transcript = read_json(os.path.join(ep_dir, "transcript.json"), {}).get("text", "")
+        if not transcript:
+            log.warning("No transcript for %s; skipping", ep_id)
+            bump("skipped")
+            return
+        key = cache.summary_key(transcript, user_prompt, model, temperature) if cache is not None else None
+        hit = key is not None and cache.get_summary(key) is not None
+        old = read_json(os.path.join(ep_dir, "summary.json"), None)
+        if seed:
+            if cache is not None and not hit and old is not None:
+                cache.put_summary(key, old)
+                bump("seeded")
+            else:
+                bump("skipped")
+            return
+        if dry_run:
+            bump("cached" if hit else "summarised")
+            return
+        if not hit:
+            starts.acquire()
+        try:
+            with metrics.episode(ep_id):
+                summary = summarize_transcript(transcript, user_prompt, cfg, cache)
+        except Exception:
+            log.exception("Summarising %s failed", ep_id)
+            bump("failed")
+            return
+        if summary == old:
+            bump("unchanged")
+            return
+        write_json(os.path.join(ep_dir, "summary.json"), summary)
+        update_catalogue(episodes_dir, ep_id)
+        bump("cached" if hit else "summarised")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="resummarize") as pool:
+        list(pool.map(one, wanted))
+
+    log.info("Re-summarised %d episodes: %s", len(wanted), ", ".join(f"{v} {k}" for k, v in counts.items() if v))
+    return counts
+
+def main(argv: Optional[List[str]] = None):
+    from .main import load_config, load_prompt, publish
+    from .publisher import load_episodes
+
+    parser = argparse.ArgumentParser(description="Re-summarise stored transcripts with the current prompt and model.")
+    parser.add_argument("--ids", nargs="+", help="only these episode ids")
+    parser.add_argument("--workers", type=int, help="episodes summarised concurrently")
+    parser.add_argument("--per-minute", type=float, help="max episodes sent to the API per minute (0 = no limit)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be re-summarised")
+    parser.add_argument("--seed", action="store_true",
+                        help="record existing summaries as current for this prompt/model without calling the API")
+    parser.add_argument("--no-publish", action="store_true", help="do not rebuild the site afterwards")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    cfg = load_config()
+    openai_pool.configure(cfg.get("openai"))
+    metrics.start_run("resummarize")
+    rcfg = cfg["pipeline"].get("resummarize") or {}
+    cache = open_summary_cache(cfg)
+    if cache is None:
+        log.warning("Summary cache disabled (cache.summaries_max_mb = 0); every episode will be re-summarised")
+    counts = resummarize(
+        cfg, load_prompt(), ids=args.ids, cache=cache,
+        workers=args.workers or int(rcfg.get("workers", 4)),
+        per_minute=args.per_minute if args.per_minute is not None else float(rcfg.get("per_minute", 30)),
+        dry_run=args.dry_run, seed=args.seed,
+    )
+    if not (args.dry_run or args.seed or args.no_publish) and (counts["cached"] or counts["summarised"]):
+        publish(cfg, load_episodes(cfg["storage"]["episodes_dir"]))
+    if not args.dry_run:
+        metrics.write_report(cfg.get("metrics"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import statistics
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+# Publish times needed before a feed's cadence is trusted
+MIN_HISTORY = 3
+
+class Cadence(NamedTuple):
+    """What a feed's publish history says about when to expect the next episode."""
+    gap: Optional[float]  # median seconds between episodes (None: not enough history)
+    period: int           # DAY for feeds publishing more than every other day, else WEEK
+    slots: List[int]      # usual publish hours, as seconds into the period (UTC)
+    last: Optional[int]   # newest publish time seen
+
+class PollSettings(NamedTuple):
+    min_interval: float = 5 * 60
+    max_interval: float = 6 * HOUR
+    default_interval: float = 30 * 60
+    window_interval: float = 5 * 60
+    window: float = 3 * HOUR
+    polls_per_gap: float = 10
+
+    @classmethod
+    def from_config(cls, daemon_cfg: Optional[Dict[str, Any]]) -> "PollSettings":
+        d = daemon_cfg or {}
+        base = cls()
+        return cls(
+            min_interval=float(d.get("min_interval_minutes", base.min_interval / 60)) * 60,
+            max_interval=float(d.get("max_interval_minutes", base.max_interval / 60)) * 60,
+            default_interval=float(d.get("default_interval_minutes", base.default_interval / 60)) * 60,
+            window_interval=float(d.get("window_interval_minutes", base.window_interval / 60)) * 60,
+            window=float(d.get("window_hours", base.window / HOUR)) * HOUR,
+            polls_per_gap=float(d.get("polls_per_gap", base.polls_per_gap)),
+        )
+
+def learn_cadence(timestamps: Iterable[int], min_share: float = 0.2) -> Cadence:
+    """
+    Learn a feed's cadence from its publish timestamps: the median gap
+    between episodes, and the hours (of the day for daily feeds, of the week
+    otherwise) in which at least `min_share` of episodes appeared, counting
+    the neighbouring hours too so that a publisher running a little late
+    still counts as the same slot.
+    """
+    ts = sorted({int(t) for t in timestamps if t and t > 0})
+    last = ts[-1] if ts else None
+    if len(ts) < MIN_HISTORY:
+        return Cadence(None, WEEK, [], last)
+    gap = float(statistics.median(b - a for a, b in zip(ts, ts[1:])))
+    period = DAY if gap < 2 * DAY else WEEK
+    hours = period // HOUR
+    counts = Counter((t % period) // HOUR for t in ts)
+    slots = []
+    for h in sorted(counts):
+        near = counts[h] + counts.get((h - 1) % hours, 0) + counts.get((h + 1) % hours, 0)
+        if near / len(ts) >= min_share:
+            slots.append(h * HOUR)
+    return Cadence(gap, period, slots, last)
+
+def _window_offsets(now: float, cadence: Cadence):
+    """(seconds since the most recent window start, seconds until the next) across all slots."""
+    pos = now % cadence.period
+    since = min((pos - s) % cadence.period for s in cadence.slots)
+    until = min((s - pos) % cadence.period or cadence.period for s in cadence.slots)
+    return since, until
+
+def in_window(now: float, cadence: Cadence, window: float) -> bool:
+    """Whether `now` falls within `window` seconds after one of the feed's usual publish hours."""
+    if not cadence.slots:
+        return False
+    since, _ = _window_offsets(now, cadence)
+    return since < window
+
+def poll_interval(now: float, cadence: Cadence, settings: PollSettings) -> float:
+    """
+    Seconds until a feed should be polled again.
+
+    Without history: `default_interval`. Otherwise about `polls_per_gap`
+    polls per typical gap between episodes, halved once the next episode is
+    overdue, between `min_interval` and `max_interval`. Inside a usual
+    publish window the feed is polled every `window_interval`, and a long
+    interval is cut short so the next window is never slept through.
+    """
+    if cadence.gap is None:
+        interval = settings.default_interval
+    else:
+        interval = min(max(cadence.gap / settings.polls_per_gap, settings.min_interval), settings.max_interval)
+        if cadence.last is not None and now - cadence.last > cadence.gap:
+            interval /= 2
+    if cadence.slots:
+        since, until = _window_offsets(now, cadence)
+        if since < settings.window:
+            interval = min(interval, settings.window_interval)
+        else:
+            interval = min(interval, until)
+    return max(settings.min_interval, interval)
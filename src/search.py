@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from .utils import read_json, write_json
+
+log = logging.getLogger("search")
+
+# Terms are sharded by their first PREFIX_LEN characters: search/<prefix>.json
+PREFIX_LEN = 2
+
+# Episode id -> document number, kept beside the term vectors (ids never start with ".")
+DOC_IDS_NAME = ".doc_ids.json"
+
+# Where a term was found counts for more than how often it was said
+FIELD_WEIGHTS = {"title": 8, "theme": 4, "quotes": 2, "transcript": 1}
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by can could did do does
+doing don down for from had has have having he her here hers him his how i if in into is it its just let like me
+more most my no nor not now of off on once only or other our ours out over own really said same say says she
+should so some such than that the their theirs them then there these they this those through to too under until
+up us very was we well were what when where which while who whom why will with would yes you your yours
+""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase ASCII-folded words of at least PREFIX_LEN characters, stop words removed."""
+    folded = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    folded = folded.replace("'", "")  # "God's" -> "gods", matching the search page
+    return [w for w in _WORD_RE.findall(folded) if len(w) >= PREFIX_LEN and w not in STOPWORDS]
+
+def _lookup(ep: Dict[str, Any], key: str) -> Any:
+    # Indexing (not .get) so a LazyEpisode loads the field from disk
+    try:
+        return ep[key]
+    except KeyError:
+        return None
+
+def term_weights(ep: Dict[str, Any]) -> Dict[str, int]:
+    """Weighted term frequencies for one episode (reads its summary and transcript)."""
+    summary = _lookup(ep, "summary") or {}
+    fields = {
+        "title": ep.get("title") or "",
+        "theme": ep.get("overall_theme") or summary.get("overall_theme") or "",
+        "quotes": " ".join(q for q in summary.get("quotes") or [] if isinstance(q, str)),
+        "transcript": _lookup(ep, "transcript") or "",
+    }
+    weights: Counter = Counter()
+    for field, text in fields.items():
+        for term, n in Counter(tokenize(text)).items():
+            weights[term] += FIELD_WEIGHTS[field] * n
+    return dict(weights)
+
+def episode_terms(ep: Dict[str, Any], digest: str, cache_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    `term_weights(ep)`, cached in `<cache_dir>/<id>.json` under the episode's
+    content digest so unchanged transcripts are not re-read or re-tokenised.
+    """
+    path = os.path.join(cache_dir, ep["id"] + ".json") if cache_dir else None
+    if path:
+        cached = read_json(path, {})
+        if cached.get("digest") == digest:
+            return cached["terms"]
+    terms = term_weights(ep)
+    if path:
+        write_json(path, {"digest": digest, "terms": terms}, compact=True)
+    return terms
+
+def prune_cache(cache_dir: str, keep: Iterable[str]):
+    """Drop cached term vectors for episodes that are no longer published."""
+    if not os.path.isdir(cache_dir):
+        return
+    keep = {ep_id + ".json" for ep_id in keep} | {DOC_IDS_NAME}
+    for name in os.listdir(cache_dir):
+        if name.endswith(".json") and name not in keep:
+            os.remove(os.path.join(cache_dir, name))
+
+def doc_numbers(ep_ids: List[str], cache_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Stable document numbers for `ep_ids`.
+
+    The id -> number map in `<cache_dir>/.doc_ids.json` is append-only: new
+    episodes get the next free numbers in the order given and removed ones
+    keep theirs, so a backfilled or deleted episode does not renumber (and
+    rewrite the shards of) every other document. Without a cache directory
+    documents are numbered by position.
+    """
+    path = os.path.join(cache_dir, DOC_IDS_NAME) if cache_dir else None
+    numbers: Dict[str, int] = read_json(path, {}) if path else {}
+    added = [ep_id for ep_id in ep_ids if ep_id not in numbers]
+    for ep_id in added:
+        numbers[ep_id] = len(numbers)
+    if path and added:
+        write_json(path, numbers, compact=True)
+    return numbers
+
+def build_shards(vectors: Dict[int, Dict[str, int]]) -> Dict[str, Dict[str, List[List[int]]]]:
+    """
+    Invert per-document term weights (`{doc: {term: weight}}`) into
+    `{prefix: {term: [[doc, score], ...]}}`.
+
+    Postings are sorted by score, best first, and terms within a shard are
+    sorted so the output is deterministic.
+    """
+    postings: Dict[str, List[List[int]]] = {}
+    for doc, terms in sorted(vectors.items()):
+        for term, score in terms.items():
+            postings.setdefault(term, []).append([doc, score])
+    shards: Dict[str, Dict[str, List[List[int]]]] = {}
+    for term in sorted(postings):
+        shards.setdefault(term[:PREFIX_LEN], {})[term] = sorted(postings[term], key=lambda p: (-p[1], p[0]))
+    return shards
@@ -0,0 +1,330 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from .utils import read_json
+
+log = logging.getLogger("state")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id TEXT PRIMARY KEY,
+    guid TEXT,
+    feed_url TEXT,
+    processed_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS episodes_guid ON episodes(guid);
+CREATE TABLE IF NOT EXISTS feeds (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    modified TEXT,
+    last_guid TEXT,
+    last_poll INTEGER,
+    last_status INTEGER,
+    candidate_limit INTEGER,
+    candidates TEXT
+);
+CREATE TABLE IF NOT EXISTS feed_history (
+    url TEXT NOT NULL,
+    published_ts INTEGER NOT NULL,
+    PRIMARY KEY (url, published_ts)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    episode TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_stage ON jobs(stage);
+CREATE TABLE IF NOT EXISTS backfill (
+    id TEXT PRIMARY KEY,
+    feed_url TEXT,
+    published_ts INTEGER,
+    episode TEXT,
+    queued_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Publish times remembered per feed for learning its cadence (see `schedule.learn_cadence`)
+FEED_HISTORY = 50
+
+# Per-episode job stages, in order. An episode counts as processed once it is summarised.
+STAGES = ("discovered", "downloaded", "transcribed", "summarised", "published")
+UNFINISHED = STAGES[:3]
+
+class StateStore:
+    """
+    SQLite-backed pipeline state (WAL mode).
+
+    Replaces the `processed_ids` list in `data/state.json`: membership checks
+    are primary-key/index lookups and every update is its own small
+    transaction, so neither grows with the size of the archive. Also holds the
+    per-feed conditional-GET cache (ETag, Last-Modified, last seen guid, last
+    poll time) and each episode's job stage (see `STAGES`), checkpointed as
+    the pipeline completes each stage so a rerun resumes where it stopped.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            # Fold the WAL back into the main file so only state.db needs committing
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+    def __enter__(self) -> "StateStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Episodes
+
+    def __contains__(self, ep_id: object) -> bool:
+        return self.is_processed(ep_id=str(ep_id))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM episodes").fetchone()[0]
+
+    def is_processed(self, ep_id: Optional[str] = None, guid: Optional[str] = None) -> bool:
+        with self._lock:
+            if ep_id is not None:
+                row = self._conn.execute("SELECT 1 FROM episodes WHERE id = ?", (ep_id,)).fetchone()
+                if row:
+                    return True
+            if guid is not None:
+                row = self._conn.execute("SELECT 1 FROM episodes WHERE guid = ?", (guid,)).fetchone()
+                if row:
+                    return True
+        return False
+
+    def mark_processed(self, ep_id: str, guid: Optional[str] = None, feed_url: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO episodes (id, guid, feed_url, processed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET guid = COALESCE(excluded.guid, guid), "
+                "feed_url = COALESCE(excluded.feed_url, feed_url), processed_at = excluded.processed_at",
+                (ep_id, guid, feed_url, int(time.time())),
+            )
+
+    def processed_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT id FROM episodes ORDER BY rowid")]
+
+    # Jobs
+
+    def start_job(self, ep: Dict[str, Any]) -> str:
+        """Record `ep` as discovered unless it already has a job; returns the job's current stage."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, stage, episode, updated_at) VALUES (?, ?, ?, ?)",
+                (ep["id"], STAGES[0], json.dumps(ep, ensure_ascii=False, separators=(",", ":")), int(time.time())),
+            )
+            return self._conn.execute("SELECT stage FROM jobs WHERE id = ?", (ep["id"],)).fetchone()[0]
+
+    def advance(self, ep_id: str, stage: str):
+        """Checkpoint an episode as having completed `stage`."""
+        if stage not in STAGES:
+            raise ValueError("Unknown stage %r" % stage)
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET stage = ?, error = NULL, updated_at = ? WHERE id = ?",
+                               (stage, int(time.time()), ep_id))
+
+    def job_failed(self, ep_id: str, error: str):
+        """Count a failed attempt; the job stays at the last stage it completed."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET attempts = attempts + 1, error = ?, updated_at = ? WHERE id = ?",
+                               (error, int(time.time()), ep_id))
+
+    def job(self, ep_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT stage, attempts, error, updated_at FROM jobs WHERE id = ?",
+                                     (ep_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": ep_id, "stage": row[0], "attempts": row[1], "error": row[2], "updated_at": row[3]}
+
+    def pending_jobs(self, max_attempts: int = 0) -> List[Dict[str, Any]]:
+        """
+        Episodes whose job stopped before being summarised (a crash or a failed
+        stage in an earlier run), oldest first, skipping those that have
+        already failed `max_attempts` times (0 = no limit).
+        """
+        marks = ",".join("?" * len(UNFINISHED))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT episode FROM jobs WHERE stage IN ({marks}) AND (? <= 0 OR attempts < ?) ORDER BY updated_at",
+                UNFINISHED + (max_attempts, max_attempts),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows if r[0]]
+
+    def mark_published(self) -> int:
+        """Advance every summarised job to published (after a successful site build); returns how many."""
+        with self._lock:
+            return self._conn.execute("UPDATE jobs SET stage = ?, updated_at = ? WHERE stage = ?",
+                                      ("published", int(time.time()), "summarised")).rowcount
+
+    # Backfill
+
+    def queue_backfill(self, eps: List[Dict[str, Any]]) -> int:
+        """Add archive episodes to the backfill queue (already queued ones keep their entry); returns how many were new."""
+        now = int(time.time())
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO backfill (id, feed_url, published_ts, episode, queued_at) VALUES (?, ?, ?, ?, ?)",
+                [(ep["id"], ep.get("feed_url"), int(ep.get("published_ts") or 0),
+                  json.dumps(ep, ensure_ascii=False, separators=(",", ":")), now) for ep in eps],
+            )
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def backfill_queue(self) -> List[Dict[str, Any]]:
+        """Queued backfill episodes that have not been processed yet, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT b.episode FROM backfill b LEFT JOIN episodes e ON e.id = b.id "
+                "WHERE e.id IS NULL ORDER BY b.published_ts DESC"
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    # Feeds
+
+    def load_feed_cache(self) -> Dict[str, Dict[str, Any]]:
+        """Return the feed cache in the shape `feed_watcher.poll_feeds` expects."""
+        cache = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, etag, modified, last_poll, last_status, candidate_limit, candidates FROM feeds"
+            ).fetchall()
+        for url, etag, modified, last_poll, last_status, limit, candidates in rows:
+            cache[url] = {
+                "etag": etag,
+                "modified": modified,
+                "limit": limit,
+                "episodes": json.loads(candidates) if candidates else [],
+                "last_status": last_status,
+                "last_poll": last_poll,
+            }
+        return cache
+
+    def save_feed(self, url: str, entry: Dict[str, Any]):
+        """Store a feed's cache entry and add its episodes' publish times to the feed's history."""
+        episodes = entry.get("episodes") or []
+        last_guid = episodes[0]["guid"] if episodes else None
+        published = [(url, int(ep["published_ts"])) for ep in episodes if ep.get("published_ts")]
+        with self._lock:
+            if published:
+                self._conn.executemany("INSERT OR IGNORE INTO feed_history (url, published_ts) VALUES (?, ?)",
+                                       published)
+                self._conn.execute(
+                    "DELETE FROM feed_history WHERE url = ? AND published_ts < COALESCE(("
+                    "SELECT published_ts FROM feed_history WHERE url = ? "
+                    "ORDER BY published_ts DESC LIMIT 1 OFFSET ?), 0)",
+                    (url, url, FEED_HISTORY - 1),
+                )
+            self._conn.execute(
+                "INSERT INTO feeds (url, etag, modified, last_guid, last_poll, last_status, candidate_limit, candidates) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, modified = excluded.modified, "
+                "last_guid = COALESCE(excluded.last_guid, last_guid), last_poll = excluded.last_poll, "
+                "last_status = excluded.last_status, candidate_limit = excluded.candidate_limit, "
+                "candidates = excluded.candidates",
+                (url, entry.get("etag"), entry.get("modified"), last_guid, entry.get("last_poll"),
+                 entry.get("last_status"), entry.get("limit"),
+                 json.dumps(episodes, ensure_ascii=False, separators=(",", ":"))),
+            )
+
+    def save_feed_cache(self, cache: Dict[str, Dict[str, Any]]):
+        for url, entry in cache.items():
+            self.save_feed(url, entry)
+
+    def publish_times(self, url: str) -> List[int]:
+        """The newest `FEED_HISTORY` publish timestamps seen in `url`, oldest first."""
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                "SELECT published_ts FROM feed_history WHERE url = ? ORDER BY published_ts", (url,))]
+
+    def feeds(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, etag, modified, last_guid, last_poll, last_status FROM feeds ORDER BY url"
+            ).fetchall()
+        for url, etag, modified, last_guid, last_poll, last_status in rows:
+            yield {"url": url, "etag": etag, "modified": modified, "last_guid": last_guid,
+                   "last_poll": last_poll, "last_status": last_status}
+
+    # Misc
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def migrate_from_json(self, state_file: str, feed_cache_file: Optional[str] = None) -> int:
+        """
+        One-shot import of the legacy `state.json` (and `feeds.json`) files.
+
+        Runs once per database; the imported files are renamed with a
+        `.migrated` suffix so they cannot drift out of sync with the store.
+        Returns the number of episode ids imported.
+        """
+        if self.get_meta("migrated_from_json"):
+            return 0
+        imported = 0
+        if os.path.exists(state_file):
+            ids = read_json(state_file, {}).get("processed_ids", [])
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO episodes (id, processed_at) VALUES (?, ?)",
+                    [(ep_id, None) for ep_id in ids],
+                )
+                self._conn.execute("COMMIT")
+            imported = len(ids)
+        if feed_cache_file and os.path.exists(feed_cache_file):
+            self.save_feed_cache(read_json(feed_cache_file, {}))
+        self.set_meta("migrated_from_json", str(int(time.time())))
+        for path in (state_file, feed_cache_file):
+            if path and os.path.exists(path):
+                os.replace(path, path + ".migrated")
+        if imported:
+            log.info("Migrated %d processed ids from %s into %s", imported, state_file, self.path)
+        return imported
+
+def open_state(storage_cfg: Dict[str, Any]) -> StateStore:
+    """Open the state store configured under `storage:` and run the legacy JSON migration if needed."""
+    data_dir = storage_cfg.get("data_dir", "data")
+    store = StateStore(storage_cfg.get("state_db", os.path.join(data_dir, "state.db")))
+    store.migrate_from_json(
+        storage_cfg.get("state_file", os.path.join(data_dir, "state.json")),
+        storage_cfg.get("feed_cache_file", os.path.join(data_dir, "feeds.json")),
+    )
+    return store
@@ -1,49 +1,121 @@
 import json
 import logging
-from typing import Dict
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
-from tenacity import retry, wait_exponential, stop_after_attempt
-from openai import OpenAI
+import openai
+
+from . import metrics
+from .openai_pool import OpenAIPool, as_pool
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts are estimated without it
+    tiktoken = None
 
 log = logging.getLogger("summarizer")
 
-@retry(wait=wait_exponential(min=1, max=10), stop=stop_after_attempt(4))
-def extract_key_info(transcript: str, user_prompt: str, model: str, temperature: float = 0.2) -> Dict:
-    client = OpenAI()
-    messages = [
-        {"role": "system", "content": "You are a careful, faithful extractor. Answer ONLY in JSON."},
-        {"role": "user", "content": user_prompt.strip()},
-        {"role": "user", "content": f"Transcript:\n\n{transcript}"},
-    ]
-    # Request JSON output. Some models support response_format for strict JSON.
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            response_format={"type": "json_object"},
-        )
-        content = resp.choices[0].message.content
-    except Exception:
-        # Fallback if response_format not supported
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-        )
-        content = resp.choices[0].message.content
-
-    # Parse JSON safely
+SYSTEM_PROMPT = "You are a careful, faithful extractor. Answer ONLY in JSON."
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Token count of `text` (tiktoken's cl100k_base if installed, else ~4 characters per token)."""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def split_transcript(text: str, max_tokens: int) -> List[str]:
+    """
+    Split a transcript into consecutive sections of at most `max_tokens`,
+    breaking between paragraphs or sentences where possible (a sentence
+    longer than the budget is split between words).
+    """
+    pieces: List[str] = []
+    for sentence in re.split(r"(?<=[.!?])\s+|\n\s*\n", text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words: List[str] = []
+        used = 0
+        for word in sentence.split():
+            n = count_tokens(word) + 1
+            if words and used + n > max_tokens:
+                pieces.append(" ".join(words))
+                words, used = [], 0
+            words.append(word)
+            used += n
+        if words:
+            pieces.append(" ".join(words))
+
+    sections: List[str] = []
+    current: List[str] = []
+    used = 0
+    for piece in pieces:
+        n = count_tokens(piece) + 1
+        if current and used + n > max_tokens:
+            sections.append(" ".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += n
+    if current:
+        sections.append(" ".join(current))
+    return sections
+
+def _parse_json(content: str) -> Dict[str, Any]:
     try:
-        data = json.loads(content)
+        return json.loads(content)
     except Exception:
         # Attempt to recover a JSON object from content
-        import re
         m = re.search(r"\{.*\}", content, re.S)
         if not m:
             raise RuntimeError("Model did not return JSON.")
-        data = json.loads(m.group(0))
+        return json.loads(m.group(0))
+
+# Tokens reserved for the model's answer when charging a request against the tokens/min budget
+RESPONSE_TOKENS = 1000
 
+def _chat_json(pool: OpenAIPool, model: str, messages: List[Dict[str, str]], temperature: float) -> Dict[str, Any]:
+    """
+    One chat completion parsed as a JSON object, sent through `pool`. Each
+    request is retried on its own (including when the answer is not JSON), so
+    a failure only resends this request.
+    """
+    def request(client):
+        # Request JSON output. Some models support response_format for strict JSON.
+        try:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                response_format={"type": "json_object"},
+            )
+        except openai.BadRequestError:
+            # Fallback if response_format not supported
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+            )
+        _parse_json(resp.choices[0].message.content)  # an unparseable answer is retried
+        return resp
+
+    estimate = sum(count_tokens(m["content"]) for m in messages) + RESPONSE_TOKENS
+    resp = pool.call(request, tokens=estimate)
+    usage = getattr(resp, "usage", None)
+    metrics.count("summarize_requests")
+    metrics.count("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    metrics.count("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+    return _parse_json(resp.choices[0].message.content)
+
+def _normalise(data: Dict[str, Any]) -> Dict[str, Any]:
     # Basic normalization and defaults
     data.setdefault("overall_theme", "")
     data.setdefault("quotes", [])
@@ -56,24 +128,84 @@ def extract_key_info(transcript: str, user_prompt: str, model: str, temperature:
         data["bible_passages"] = [str(data["bible_passages"])]
     if not isinstance(data["follow_on_questions"], list):
         data["follow_on_questions"] = [str(data["follow_on_questions"])]
-    
+
     bp = data.get("further_bible_passages", [])
+    if not isinstance(bp, list):
+        bp = [bp]
     normalised = []
     for item in bp:
         if isinstance(item, dict):
-            ref = item.get("ref", "").strip()
-            rationale = item.get("rationale", "").strip()
+            ref = str(item.get("ref", "")).strip()
+            rationale = str(item.get("rationale", "")).strip()
         else:
             ref = str(item).strip()
             rationale = ""
-        
+
         if ref:
             normalised.append({"ref": ref, "rationale": rationale})
     data["further_bible_passages"] = normalised
-    
-    if not isinstance(data["further_bible_passages"], list):
-        data["further_bible_passages"] = [str(data["further_bible_passages"])]
+    return data
+
+def _summarise_sections(pool: OpenAIPool, transcript: str, user_prompt: str, model: str, temperature: float,
+                        section_tokens: int, max_in_flight: int) -> Dict[str, Any]:
+    """Map: extract from each section in parallel. Reduce: merge the extractions into one answer."""
+    sections = split_transcript(transcript, section_tokens)
+    log.info("Summarising %d sections of up to %d tokens (%d in flight)", len(sections), section_tokens, max_in_flight)
+
+    def extract(i: int) -> Dict[str, Any]:
+        return _chat_json(pool, model, [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt.strip()},
+            {"role": "user", "content": (
+                f"This is section {i + 1} of {len(sections)} of a longer transcript. Extract only from this section, "
+                "using the same JSON keys; overall_theme should describe this section."
+            )},
+            {"role": "user", "content": f"Transcript section:\n\n{sections[i]}"},
+        ], temperature)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(sections))),
+                            thread_name_prefix="summarise") as executor:
+        partials = [_normalise(p) for p in executor.map(metrics.bind(extract), range(len(sections)))]
+
+    return _chat_json(pool, model, [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt.strip()},
+        {"role": "user", "content": (
+            "The transcript was too long to read at once, so it was split into consecutive sections and the "
+            "instructions above were applied to each. Merge these section extractions into ONE JSON object for the "
+            "whole transcript, following the instructions above: write a single overall_theme for the whole episode, "
+            "choose the best quotes, combine Bible passages without duplicates, and pick the most useful questions "
+            "and further passages. Use only material present in the sections."
+        )},
+        {"role": "user", "content": "Section extractions:\n\n" + json.dumps(partials, ensure_ascii=False)},
+    ], temperature)
+
+@metrics.timed("summarize")
+def extract_key_info(transcript: str, user_prompt: str, model: str, temperature: float = 0.2,
+                     map_reduce_tokens: Optional[int] = None, section_tokens: int = 6000,
+                     max_in_flight: int = 4, pool: Optional[OpenAIPool] = None) -> Dict:
+    """
+    Extract the summary JSON (overall_theme, quotes, bible_passages,
+    follow_on_questions, further_bible_passages) from a transcript.
+
+    Transcripts longer than `map_reduce_tokens` are split into sections of at
+    most `section_tokens`, summarised in parallel (`max_in_flight` requests at
+    a time) and merged by a final reduce call. Requests go through `pool`
+    (default: the shared summarisation pool, see `openai_pool`) and each has
+    its own retry policy, so a timeout only resends one section.
+    """
+    pool = as_pool(pool, "summarize")
+    tokens = count_tokens(transcript)
+    if map_reduce_tokens and tokens > map_reduce_tokens:
+        data = _summarise_sections(pool, transcript, user_prompt, model, temperature, section_tokens, max_in_flight)
+    else:
+        data = _chat_json(pool, model, [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt.strip()},
+            {"role": "user", "content": f"Transcript:\n\n{transcript}"},
+        ], temperature)
+    data = _normalise(data)
 
-    log.info("Extraction done: %d quotes, %d passages, %d questions, %d further_passages",
+    log.info("Extraction done (%d tokens): %d quotes, %d passages, %d questions, %d further_passages", tokens,
              len(data["quotes"]), len(data["bible_passages"]), len(data["follow_on_questions"]), len(data["further_bible_passages"]))
-    return data
\ No newline at end of file
+    return data
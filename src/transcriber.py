@@ -1,56 +1,454 @@
+import abc
 import glob
 import logging
 import os
+import re
 import shlex
 import shutil
 import subprocess
-from typing import List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from tenacity import retry, wait_exponential, stop_after_attempt
-from openai import OpenAI
+from . import metrics
+from .cache import ChunkCache
+from .downloader import stream_audio
+from .openai_pool import OpenAIPool, as_pool, get_pool
 
 log = logging.getLogger("transcriber")
 
 def have_ffmpeg() -> bool:
     return shutil.which("ffmpeg") is not None
 
-def segment_audio(input_path: str, out_dir: str, segment_seconds: int) -> List[str]:
-    """Split audio into chunks using ffmpeg. Returns list of chunk paths."""
+# Speech-oriented encodings for `pipeline.preprocess.format`: (codec args, chunk extension)
+PREPROCESS_FORMATS = {
+    "opus": (["-c:a", "libopus", "-application", "voip"], "ogg"),
+    "mp3": (["-c:a", "libmp3lame"], "mp3"),
+}
+
+# trim_silence is set but the segmenter in use cannot honour it; warned about once per process
+_trim_warned = False
+
+def _encode_args(preprocess: Optional[Dict[str, Any]], trim_ends: bool = True) -> Tuple[List[str], str]:
+    """
+    ffmpeg output args and chunk extension for the optional preprocessing stage.
+
+    Without preprocessing chunks are stream-copied at the podcast's original
+    bitrate. With it they are transcoded to low-bitrate 16 kHz mono, and
+    with `trim_silence` the silence at the start and end of the encoded
+    audio is cut (pauses inside it are kept). Only pass `trim_ends` when each
+    chunk is encoded on its own: trimming a continuous stream before the
+    segment muxer cuts it would shift every chunk away from its real offset,
+    so without it `trim_silence` is ignored (with a warning, once).
+    """
+    global _trim_warned
+    if not preprocess or not preprocess.get("enabled"):
+        return ["-c", "copy"], "mp3"
+    fmt = str(preprocess.get("format", "opus")).lower()
+    if fmt not in PREPROCESS_FORMATS:
+        raise ValueError("Unknown preprocess format %r (expected one of %s)" % (fmt, ", ".join(PREPROCESS_FORMATS)))
+    codec, ext = PREPROCESS_FORMATS[fmt]
+    rate = int(preprocess.get("sample_rate", 16000))
+    args = ["-vn", "-ac", "1", "-ar", str(rate)]
+    if not trim_ends and preprocess.get("trim_silence"):
+        if not _trim_warned:
+            _trim_warned = True
+            log.warning("preprocess.trim_silence is ignored: it only applies to silence-aware segmentation "
+                        "(segmentation.mode: silence without stream_download)")
+    elif preprocess.get("trim_silence"):
+        # silenceremove only trims a start, so the end is trimmed as the start of the reversed chunk
+        trim = "silenceremove=start_periods=1:start_threshold={t}dB:start_silence=0.5".format(
+            t=preprocess.get("silence_threshold_db", -50))
+        args += ["-af", "aformat=channel_layouts=mono,aresample=%d,%s,areverse,%s,areverse" % (rate, trim, trim)]
+    args += codec + ["-b:a", str(preprocess.get("bitrate", "24k"))]
+    return args, ext
+
+def _record_preprocess(bytes_in: int, bytes_out: int):
+    """Count the audio bytes preprocessing read and wrote (for the run report) and log the saving."""
+    metrics.count("preprocess_bytes_in", bytes_in)
+    metrics.count("preprocess_bytes_out", bytes_out)
+    if bytes_in and bytes_out:
+        log.info("Chunk payload: %.1f MB in -> %.1f MB out (%.0f%% saved)",
+                 bytes_in / (1024 * 1024), bytes_out / (1024 * 1024), 100.0 * (1 - bytes_out / bytes_in))
+
+def _chunk_bytes(chunks: List[str]) -> int:
+    return sum(os.path.getsize(c) for c in chunks if os.path.exists(c))
+
+@metrics.timed("segment")
+def segment_audio(input_path: str, out_dir: str, segment_seconds: int,
+                  preprocess: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Split audio into chunks using ffmpeg (optionally transcoding them for
+    upload). Returns list of chunk paths. Chunk i starts at exactly
+    i * `segment_seconds`, so silence is never trimmed here.
+    """
     os.makedirs(out_dir, exist_ok=True)
-    pattern = os.path.join(out_dir, "chunk_%03d.mp3")
-    cmd = f'ffmpeg -hide_banner -loglevel error -y -i {shlex.quote(input_path)} -f segment -segment_time {segment_seconds} -c copy {shlex.quote(pattern)}'
+    encode, ext = _encode_args(preprocess, trim_ends=False)
+    pattern = os.path.join(out_dir, "chunk_%03d." + ext)
+    cmd = f'ffmpeg -hide_banner -loglevel error -y -i {shlex.quote(input_path)} -f segment -segment_time {segment_seconds} {shlex.join(encode)} {shlex.quote(pattern)}'
     log.info("Segmenting audio (%ss): %s", segment_seconds, cmd)
     subprocess.run(cmd, shell=True, check=True)
-    chunks = sorted(glob.glob(os.path.join(out_dir, "chunk_*.mp3")))
+    chunks = sorted(glob.glob(os.path.join(out_dir, "chunk_*." + ext)))
     log.info("Created %d chunks", len(chunks))
+    if preprocess and preprocess.get("enabled"):
+        _record_preprocess(os.path.getsize(input_path), _chunk_bytes(chunks))
     return chunks
 
-@retry(wait=wait_exponential(min=1, max=10), stop=stop_after_attempt(4))
-def transcribe_chunk(client: OpenAI, model: str, path: str, language_hint: Optional[str]) -> str:
-    with open(path, "rb") as f:
-        log.info("Transcribing chunk: %s", os.path.basename(path))
-        kwargs = {}
-        if language_hint:
-            kwargs["language"] = language_hint
-        result = client.audio.transcriptions.create(
-            model=model,
-            file=f,
-            **kwargs
-        )
-        return result.text
-
-def transcribe_audio(input_path: str, work_dir: str, model: str = "whisper-1", segment_seconds: int = 600, language_hint: Optional[str] = None) -> str:
+SILENCE_START_RE = re.compile(r"silence_start:\s*(-?[\d.]+)")
+SILENCE_END_RE = re.compile(r"silence_end:\s*(-?[\d.]+)")
+DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):([\d.]+)")
+
+@metrics.timed("silence_detect")
+def detect_silences(input_path: str, noise_db: float = -35, min_silence: float = 0.4) -> Tuple[List[Tuple[float, float]], float]:
+    """Run ffmpeg silencedetect over the file. Returns ([(start, end), ...], duration_seconds)."""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", input_path,
+           "-af", "silencedetect=noise=%sdB:d=%s" % (noise_db, min_silence), "-f", "null", "-"]
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    duration = 0.0
+    silences: List[Tuple[float, float]] = []
+    start: Optional[float] = None
+    for line in proc.stderr.decode("utf-8", "replace").splitlines():
+        m = DURATION_RE.search(line)
+        if m and not duration:
+            duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+            continue
+        m = SILENCE_START_RE.search(line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = SILENCE_END_RE.search(line)
+        if m and start is not None:
+            silences.append((start, float(m.group(1))))
+            start = None
+    if start is not None and duration:
+        silences.append((start, duration))  # trailing silence runs to the end
+    return silences, duration
+
+def plan_segments(silences: List[Tuple[float, float]], duration: float, target: float,
+                  min_seconds: float, max_seconds: float) -> List[Tuple[float, float]]:
+    """
+    Choose cut points in pauses: each cut is the silence midpoint closest to
+    `target` seconds after the previous cut, within [min_seconds, max_seconds],
+    never leaving a final chunk shorter than `min_seconds` if it can be
+    avoided. With no pause in range the cut falls back to exactly `target`,
+    or to halfway through the rest when a cut at `target` would leave less
+    than `min_seconds` after it.
+    Returns (start, end) pairs covering the whole duration.
+    """
+    mids = sorted((s + e) / 2.0 for s, e in silences)
+    segments: List[Tuple[float, float]] = []
+    pos = 0.0
+    while duration - pos > max_seconds:
+        lo, hi = pos + min_seconds, pos + max_seconds
+        candidates = [m for m in mids if lo <= m <= hi and duration - m >= min_seconds]
+        if candidates:
+            cut = min(candidates, key=lambda m: abs(m - (pos + target)))
+        elif duration - (pos + target) >= min_seconds:
+            cut = pos + target
+        else:
+            cut = pos + (duration - pos) / 2.0
+        segments.append((pos, cut))
+        pos = cut
+    if duration > pos:
+        segments.append((pos, duration))
+    return segments
+
+def segment_on_silence(input_path: str, out_dir: str, target_seconds: float, min_seconds: float,
+                       max_seconds: float, noise_db: float = -35, min_silence: float = 0.4,
+                       preprocess: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Cut audio at pauses near `target_seconds` instead of at fixed boundaries,
+    so words are not split mid-sentence and chunks come out evenly sized.
+
+    Yields `{"path", "start", "end"}` per chunk (offsets in seconds into the
+    original audio) as each one is written, so transcription of the first
+    chunk can start while the rest are cut.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    silences, duration = detect_silences(input_path, noise_db, min_silence)
+    if not duration:
+        raise RuntimeError("Could not determine duration of %s" % input_path)
+    plan = plan_segments(silences, duration, target_seconds, min_seconds, max_seconds)
+    log.info("Silence-aware plan: %d chunks from %d pauses over %.0fs: %s", len(plan), len(silences), duration,
+             ", ".join("%.0f" % (end - start) for start, end in plan))
+    encode, ext = _encode_args(preprocess)
+    bytes_in = os.path.getsize(input_path)
+    written: List[str] = []
+    for i, (start, end) in enumerate(plan):
+        path = os.path.join(out_dir, "chunk_%03d.%s" % (i, ext))
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+               "-ss", "%.3f" % start, "-to", "%.3f" % end, "-i", input_path] + encode + [path]
+        with metrics.span("segment"):
+            subprocess.run(cmd, check=True)
+        written.append(path)
+        yield {"path": path, "start": start, "end": end}
+    if preprocess and preprocess.get("enabled"):
+        _record_preprocess(bytes_in, _chunk_bytes(written))
+
+def stream_segments(url: str, out_dir: str, segment_seconds: int, max_mb: int = 300,
+                    preprocess: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    Pipe the HTTP body of `url` straight into ffmpeg's segment muxer and yield
+    each chunk path as soon as ffmpeg has closed it.
+
+    No full-size copy of the episode is written to disk, and callers can start
+    transcribing the first chunk while the rest is still downloading. Raises
+    `downloader.TooLarge` if the body exceeds `max_mb`, and
+    `subprocess.CalledProcessError` if ffmpeg cannot segment the stream (e.g.
+    an MP4 with its index at the end, which needs a seekable input). As in
+    `segment_audio`, silence is not trimmed, so chunk offsets stay exact.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    encode, ext = _encode_args(preprocess, trim_ends=False)
+    pattern = os.path.join(out_dir, "chunk_%03d." + ext)
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", "pipe:0",
+           "-f", "segment", "-segment_time", str(segment_seconds),
+           "-segment_list", "pipe:1", "-segment_list_type", "flat"] + encode + [pattern]
+    log.info("Streaming into segmenter (%ss): %s", segment_seconds, " ".join(shlex.quote(c) for c in cmd))
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    feed_error: List[BaseException] = []
+    streamed = {"bytes": 0, "chunk_bytes": 0}
+
+    def feed():
+        try:
+            streamed["bytes"] = stream_audio(url, proc.stdin, max_mb=max_mb)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its return code tells the story
+        except BaseException as e:
+            feed_error.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="stream-feed", daemon=True)
+    feeder.start()
+    count = 0
+    try:
+        for line in proc.stdout:
+            name = line.decode("utf-8", "replace").strip()
+            if name:
+                count += 1
+                path = os.path.join(out_dir, os.path.basename(name))
+                streamed["chunk_bytes"] += os.path.getsize(path)
+                yield path
+    except GeneratorExit:
+        proc.kill()  # consumer gave up; don't keep downloading
+        raise
+    finally:
+        rc = proc.wait()
+        feeder.join()
+    if feed_error:
+        raise feed_error[0]
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
+    metrics.count("bytes_downloaded", streamed["bytes"])
+    log.info("Streamed %d chunks", count)
+    if preprocess and preprocess.get("enabled"):
+        _record_preprocess(streamed["bytes"], streamed["chunk_bytes"])
+
+def transcribe_chunk(pool: OpenAIPool, model: str, path: str, language_hint: Optional[str]) -> str:
+    """Transcribe one chunk through `pool` (rate limits and retries are the pool's; see `openai_pool`)."""
+    kwargs = {}
+    if language_hint:
+        kwargs["language"] = language_hint
+
+    def request(client):
+        # Reopened on every attempt so a retry uploads the whole file again
+        with open(path, "rb") as f:
+            return client.audio.transcriptions.create(
+                model=model,
+                file=f,
+                **kwargs
+            )
+
+    log.info("Transcribing chunk: %s", os.path.basename(path))
+    with metrics.span("transcribe_chunk"):
+        text = pool.call(request).text
+    metrics.count("chunks_transcribed")
+    metrics.count("bytes_uploaded", os.path.getsize(path))
+    return text
+
+class TranscriptionBackend(abc.ABC):
+    """
+    Turns one audio chunk into text. `name` identifies the engine and model
+    in chunk cache keys, so transcripts from different backends are never
+    mixed up. `transcribe` is called from several threads at once.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def transcribe(self, path: str, language_hint: Optional[str]) -> str:
+        """Text of the chunk at `path`, in `language_hint` if given."""
+
+class OpenAIBackend(TranscriptionBackend):
+    """The OpenAI transcription API, through an `OpenAIPool` (None: the shared transcription pool)."""
+
+    def __init__(self, model: str, pool: Optional[OpenAIPool] = None):
+        self.name = model
+        self.model = model
+        # The shared pool is looked up per call, so no client is created until a chunk is sent
+        self.pool = as_pool(pool, "transcription") if pool is not None else None
+
+    def transcribe(self, path: str, language_hint: Optional[str]) -> str:
+        return transcribe_chunk(self.pool or get_pool("transcription"), self.model, path, language_hint)
+
+# Values of `transcription.backend`
+BACKENDS = ("openai", "faster-whisper")
+
+def backend_from_config(cfg: Dict[str, Any]) -> TranscriptionBackend:
+    """
+    The backend chosen by `transcription.backend`: "openai" (default; model
+    `openai.transcription_model`) or "faster-whisper" (local CPU, settings
+    under `transcription.faster_whisper`; see `local_whisper`).
+    """
+    tcfg = cfg.get("transcription") or {}
+    kind = tcfg.get("backend", "openai")
+    if kind == "openai":
+        return OpenAIBackend(cfg["openai"]["transcription_model"])
+    if kind == "faster-whisper":
+        from .local_whisper import get_backend
+        return get_backend(tcfg.get("faster_whisper"))
+    raise ValueError("Unknown transcription backend %r (expected one of %s)" % (kind, ", ".join(BACKENDS)))
+
+def _as_backend(api: Any, model: str) -> TranscriptionBackend:
+    """Accept a backend, or anything `openai_pool.as_pool` takes (then `model` picks the API model)."""
+    if isinstance(api, TranscriptionBackend):
+        return api
+    return OpenAIBackend(model, api)
+
+def _transcribe_cached(backend: TranscriptionBackend, path: str, language_hint: Optional[str],
+                       cache: Optional[ChunkCache], remove: bool = False) -> str:
+    if cache is None:
+        text = backend.transcribe(path, language_hint)
+    else:
+        key = cache.key(path, backend.name, language_hint)
+        text = cache.get(key)
+        if text is not None:
+            log.info("Chunk cache hit: %s", os.path.basename(path))
+            metrics.count("chunk_cache_hits")
+        else:
+            text = backend.transcribe(path, language_hint)
+            cache.put(key, text, model=backend.name)
+    if remove:
+        os.remove(path)
+    return text
+
+def transcribe_chunks(api: Any, model: str, chunks: Iterable[str], language_hint: Optional[str] = None,
+                      max_in_flight: int = 4, cache: Optional[ChunkCache] = None,
+                      remove_chunks: bool = False) -> List[str]:
+    """
+    Transcribe chunks concurrently, at most `max_in_flight` at a time.
+
+    `api` is a `TranscriptionBackend`, or else requests go to the OpenAI
+    API with `model` through `api` as a pool (None means the shared
+    transcription pool, a bare client is wrapped without limits); the pool's
+    rate limits and concurrency apply across every episode using it, and
+    each chunk is retried on its own. Chunks are submitted as the iterable
+    yields them (so a generator such as `stream_segments` overlaps
+    segmentation with transcription) and the texts are returned in chunk
+    order regardless of completion order. With a `cache`, chunks whose
+    audio was already transcribed by the same backend and model are not
+    transcribed again. `remove_chunks` deletes each chunk file once it is
+    transcribed.
+    """
+    backend = _as_backend(api, model)
+    with ThreadPoolExecutor(max_workers=max(1, int(max_in_flight)), thread_name_prefix="chunk") as pool:
+        futures = [pool.submit(metrics.bind(_transcribe_cached), backend, c, language_hint, cache, remove_chunks)
+                   for c in chunks]
+        return [f.result().strip() for f in futures]
+
+def _join_chunks(texts: List[str], offsets: List[float]) -> Dict[str, Any]:
+    transcript = "\n\n".join(texts).strip()
+    log.info("Transcript length (chars): %d", len(transcript))
+    return {
+        "text": transcript,
+        "chunks": [{"start": round(off, 2), "text": t} for off, t in zip(offsets, texts)],
+    }
+
+def transcribe_audio_segments(input_path: str, work_dir: str, model: str = "whisper-1", segment_seconds: int = 600,
+                              language_hint: Optional[str] = None, max_in_flight: int = 4,
+                              cache: Optional[ChunkCache] = None, preprocess: Optional[Dict[str, Any]] = None,
+                              segmentation: Optional[Dict[str, Any]] = None,
+                              backend: Optional[TranscriptionBackend] = None) -> Dict[str, Any]:
+    """
+    Transcribe potentially large audio by chunking, then concatenating text.
+
+    Returns `{"text": ..., "chunks": [{"start": seconds, "text": ...}, ...]}` so
+    the transcript keeps each chunk's offset into the episode. With
+    `segmentation.mode: silence` the cuts are placed in pauses (see
+    `segment_on_silence`) and each chunk is uploaded as soon as it is cut;
+    otherwise audio is cut every `segment_seconds`. Chunks go to `backend`
+    (default: the OpenAI API with `model`).
+    """
+    if not have_ffmpeg():
+        raise RuntimeError("ffmpeg is required for chunking. Install ffmpeg and retry.")
+
+    chunks_dir = os.path.join(work_dir, "chunks")
+    api = backend or get_pool("transcription")
+    seg = segmentation or {}
+    if seg.get("mode", "fixed") == "silence":
+        offsets: List[float] = []
+
+        def paths() -> Iterator[str]:
+            for c in segment_on_silence(
+                input_path, chunks_dir, segment_seconds,
+                min_seconds=float(seg.get("min_seconds", segment_seconds * 0.7)),
+                max_seconds=float(seg.get("max_seconds", segment_seconds * 1.3)),
+                noise_db=float(seg.get("silence_db", -35)),
+                min_silence=float(seg.get("silence_min_seconds", 0.4)),
+                preprocess=preprocess,
+            ):
+                offsets.append(c["start"])
+                yield c["path"]
+
+        texts = transcribe_chunks(api, model, paths(), language_hint, max_in_flight=max_in_flight, cache=cache)
+    else:
+        chunks = segment_audio(input_path, chunks_dir, segment_seconds, preprocess=preprocess)
+        offsets = [float(i * segment_seconds) for i in range(len(chunks))]
+        texts = transcribe_chunks(api, model, chunks, language_hint, max_in_flight=max_in_flight, cache=cache)
+    return _join_chunks(texts, offsets)
+
+def transcribe_audio(input_path: str, work_dir: str, model: str = "whisper-1", segment_seconds: int = 600,
+                     language_hint: Optional[str] = None, max_in_flight: int = 4,
+                     cache: Optional[ChunkCache] = None, preprocess: Optional[Dict[str, Any]] = None,
+                     segmentation: Optional[Dict[str, Any]] = None,
+                     backend: Optional[TranscriptionBackend] = None) -> str:
     """Transcribe potentially large audio by chunking, then concatenating text."""
+    return transcribe_audio_segments(input_path, work_dir, model, segment_seconds, language_hint,
+                                     max_in_flight, cache, preprocess, segmentation, backend)["text"]
+
+def transcribe_url_segments(url: str, work_dir: str, model: str = "whisper-1", segment_seconds: int = 600,
+                            language_hint: Optional[str] = None, max_in_flight: int = 4,
+                            cache: Optional[ChunkCache] = None, max_mb: int = 300,
+                            preprocess: Optional[Dict[str, Any]] = None,
+                            backend: Optional[TranscriptionBackend] = None) -> Dict[str, Any]:
+    """
+    Streaming variant of `transcribe_audio_segments`: the download is piped
+    through the segmenter (see `stream_segments`) and each chunk is sent for
+    transcription as soon as it exists, then deleted. Network download,
+    segmentation and API calls overlap, and only the chunks in flight ever sit
+    on disk. Silence-aware cuts need the whole file, so a stream is always cut
+    every `segment_seconds`.
+    """
     if not have_ffmpeg():
         raise RuntimeError("ffmpeg is required for chunking. Install ffmpeg and retry.")
 
     chunks_dir = os.path.join(work_dir, "chunks")
-    chunks = segment_audio(input_path, chunks_dir, segment_seconds)
-    client = OpenAI()
-    full_text_parts: List[str] = []
-    for c in chunks:
-        text = transcribe_chunk(client, model, c, language_hint)
-        full_text_parts.append(text.strip())
-    transcript = "\n\n".join(full_text_parts).strip()
-    log.info("Transcript length (chars): %d", len(transcript))
-    return transcript
\ No newline at end of file
+    api = backend or get_pool("transcription")
+    texts = transcribe_chunks(
+        api, model, stream_segments(url, chunks_dir, segment_seconds, max_mb=max_mb, preprocess=preprocess), language_hint,
+        max_in_flight=max_in_flight, cache=cache, remove_chunks=True,
+    )
+    return _join_chunks(texts, [float(i * segment_seconds) for i in range(len(texts))])
+
+def transcribe_url(url: str, work_dir: str, model: str = "whisper-1", segment_seconds: int = 600,
+                   language_hint: Optional[str] = None, max_in_flight: int = 4,
+                   cache: Optional[ChunkCache] = None, max_mb: int = 300,
+                   preprocess: Optional[Dict[str, Any]] = None,
+                   backend: Optional[TranscriptionBackend] = None) -> str:
+    """Streaming variant of `transcribe_audio`; see `transcribe_url_segments`."""
+    return transcribe_url_segments(url, work_dir, model, segment_seconds, language_hint, max_in_flight,
+                                   cache, max_mb, preprocess, backend)["text"]
@@ -1,9 +1,11 @@
+import contextlib
 import json
 import logging
 import os
 import re
+import threading
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import IO, Any, Iterator
 
 # Configure logging once for the whole app
 def setup_logging():
@@ -24,15 +26,41 @@ def read_json(path: str, default: Any) -> Any:
     except FileNotFoundError:
         return default
 
-def write_json(path: str, data: Any):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = "w") -> Iterator[IO]:
+    """
+    Open a temporary file beside `path` that replaces `path` (os.replace)
+    only once the block completes, so a crash or an exception mid-write never
+    leaves a truncated file behind: readers see the old content or the new.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def write_json(path: str, data: Any, compact: bool = False):
+    with atomic_open(path) as f:
+        if compact:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        else:
+            json.dump(data, f, ensure_ascii=False, indent=2)
 
 def read_text(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
+def write_text(path: str, text: str):
+    with atomic_open(path) as f:
+        f.write(text)
+
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.fakes import StaticServer, rss
+from src import backfill, metrics
+from src.backfill import Budget, Usage, priority
+from src.feed_watcher import _parse_duration
+from src.state import StateStore
+
+
+def test_budget_reserves_estimates_and_settles_actuals():
+    budget = Budget(max_audio_minutes=100)
+    assert budget.admit("a", Usage(40, 1000, 100))
+    assert budget.admit("b", Usage(40, 1000, 100))
+    # 40 + 40 in flight: another 40 would overshoot
+    assert not budget.admit("c", Usage(40, 1000, 100))
+    assert budget.stopped.startswith("audio minutes cap")
+    assert not budget.admit("d", Usage(1, 0, 0))  # stays stopped, so priority order is never skipped
+    budget.settle("a", Usage(40, 900, 50))
+    assert budget.spent == Usage(40, 900, 50)
+
+    budget = Budget(max_cost_usd=0.01)
+    assert budget.prices.cost(Usage(1, 0, 0)) == 0.006
+    assert budget.admit("a", Usage(1, 0, 0))
+    assert not budget.admit("b", Usage(1, 0, 0))
+    assert budget.stopped.startswith("cost cap")
+
+
+def test_priority_orders():
+    eps = [{"id": "old", "published_ts": 1, "feed_url": "heavy"},
+           {"id": "new", "published_ts": 3, "feed_url": "light"},
+           {"id": "mid", "published_ts": 2, "feed_url": "heavy"}]
+    by = lambda order: [ep["id"] for ep in sorted(eps, key=lambda ep: priority(ep, order, {"heavy": 2}))]
+    assert by("newest") == ["new", "mid", "old"]
+    assert by("oldest") == ["old", "mid", "new"]
+    assert by("weight") == ["mid", "old", "new"]
+    assert _parse_duration("1:02:03") == 3723 and _parse_duration("45:00") == 2700
+    assert _parse_duration("1800") == 1800 and _parse_duration("") is None
+
+
+def test_backfill_drains_in_budgeted_slices(tmp_path, monkeypatch):
+    now = int(time.time())
+    processed = []
+
+    def fake_process(eps, cfg, store, user_prompt, on_finished=None):
+        for ep in eps:  # consumed lazily, like the real pipeline
+            store.start_job(ep)
+            with metrics.episode(ep["id"]):
+                metrics.count("prompt_tokens", 5000)
+                metrics.count("completion_tokens", 500)
+            store.mark_processed(ep["id"], guid=ep["guid"])
+            processed.append(ep["id"])
+            on_finished(ep, True)
+        return {"processed": len(processed), "failed": 0}
+
+    monkeypatch.setattr(backfill, "process_episodes", fake_process)
+    metrics.start_run("backfill")
+    cfg = {"pipeline": {"max_attempts": 3}, "backfill": {"order": "newest"}}
+
+    with StaticServer() as host:
+        items = [{"title": "S%d" % i, "guid": "urn:s%d" % i, "link": "", "pub_ts": now - i * 86400,
+                  "audio_url": host.url + "/%d.mp3" % i, "duration": "30:00"} for i in range(5)]
+        cfg["feeds"] = [host.add("/feed.xml", rss("Feed", items), "application/rss+xml")]
+        with StateStore(str(tmp_path / "state.db")) as store:
+            store.mark_processed("urn-s0")
+            assert backfill.discover(cfg, store) == 4
+            # Unchanged feed: answered 304 and nothing new is queued
+            assert backfill.discover(cfg, store) == 0
+
+            dry = backfill.backfill(cfg, store, "prompt", Budget(max_audio_minutes=70), dry_run=True)
+            assert dry["would_process"] == 2 and processed == []
+
+            first = backfill.backfill(cfg, store, "prompt", Budget(max_audio_minutes=70))
+            assert processed == ["urn-s1", "urn-s2"]
+            assert first["audio_minutes"] == 60 and first["tokens"] == 11000 and first["remaining"] == 2
+            assert first["stopped"].startswith("audio minutes cap")
+
+            # The next invocation picks up where the last one stopped
+            second = backfill.backfill(cfg, store, "prompt", Budget(max_tokens=8000))
+            assert processed == ["urn-s1", "urn-s2", "urn-s3"]
+            assert second["remaining"] == 1
+            assert backfill._add_totals(store, second)["remaining"] == 1
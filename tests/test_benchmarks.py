@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import sys
+
+import requests
+from openai import OpenAI
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import results
+from benchmarks.fakes import FakeOpenAI, StaticServer
+from src.feed_watcher import fetch_feed
+
+
+def test_compare_flags_only_real_slowdowns():
+    rows = {r["name"]: r for r in results.compare(
+        {"a": 1.5, "b": 1.1, "c": 0.002, "new": 1.0},
+        {"a": 1.0, "b": 1.0, "c": 0.001, "gone": 1.0},
+        threshold=0.2,
+    )}
+    assert set(rows) == {"a", "b", "c"}
+    assert rows["a"]["regression"]
+    assert not rows["b"]["regression"]
+    assert not rows["c"]["regression"]  # doubled, but within timer noise
+
+
+def test_record_compares_with_previous_matching_run(tmp_path, capsys):
+    args = argparse.Namespace(results_dir=str(tmp_path), no_save=False, threshold=0.2, baseline=False,
+                              fail_on_regression=True)
+    results.save("micro", {"x": 1.0}, {"scales": [10]}, str(tmp_path))
+    results.save("micro", {"x": 0.1}, {"scales": [99]}, str(tmp_path))  # different params: not comparable
+
+    assert results.record("micro", {"x": 2.0}, {"scales": [10]}, args) == 1
+    assert "REGRESSION" in capsys.readouterr().out
+    assert results.record("micro", {"x": 2.1}, {"scales": [10]}, args) == 0
+
+
+def test_fake_openai_throttles_and_answers():
+    with FakeOpenAI(latency=0, throttle_rate=0.5, seed=3) as api:
+        client = OpenAI(base_url=api.base_url, api_key="test", max_retries=5)
+        resp = client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+        assert "overall_theme" in json.loads(resp.choices[0].message.content)
+        assert api.stats["ok"] == 1
+        assert api.stats["requests"] == api.stats["ok"] + api.stats["throttled"]
+
+
+def test_static_server_supports_etag_and_ranges():
+    with StaticServer() as host:
+        url = host.add("/feed.xml", b"0123456789", "application/rss+xml")
+        first = fetch_feed(url)
+        assert first["status"] == 200 and first["content"] == b"0123456789"
+        assert fetch_feed(url, {"etag": first["etag"]})["status"] == 304
+        r = requests.get(url, headers={"Range": "bytes=4-"})
+        assert r.status_code == 206 and r.content == b"456789"
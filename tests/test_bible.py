@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.bible import BibleIndex, parse_reference
+from src.publisher import publish_site
+from src.utils import write_json
+from src.catalogue import load_episode_list
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("John 3:16", ["John 3:16"]),
+    ("Psalm 23:1-6", ["Psalms 23:1-6"]),
+    ("Romans 8", ["Romans 8"]),
+    ("Rom. 8-9", ["Romans 8-9"]),
+    ("Genesis 1:1–2:3", ["Genesis 1:1-2:3"]),
+    ("John 3:16, 18; 4:1", ["John 3:16", "John 3:18", "John 4:1"]),
+    ("II Kings 5:1-14", ["2 Kings 5:1-14"]),
+    ("1 Jn 1:9", ["1 John 1:9"]),
+    ("Jude 5", ["Jude 1:5"]),
+    ("Luke 15:11-32a", ["Luke 15:11-32"]),
+    ("Philippians 4:13 (NIV)", ["Philippians 4:13"]),
+    ("Song of Solomon 2:4", ["Song of Songs 2:4"]),
+    ("Revelation", ["Revelation"]),
+    ("Isaiah 53:5; 1 Peter 2:24", ["Isaiah 53:5", "1 Peter 2:24"]),
+    ("Luke 15:11-32 – The Prodigal Son", ["Luke 15:11-32"]),
+    ("Romans 8:28, Jude 3", ["Romans 8:28", "Jude 1:3"]),
+    ("Hezekiah 3:1", []),
+])
+def test_parse_reference_normalises(text, expected):
+    assert [str(r) for r in parse_reference(text)] == expected
+
+
+def summary(*refs, further=()):
+    return {"bible_passages": list(refs), "further_bible_passages": [{"ref": r, "rationale": ""} for r in further]}
+
+
+def test_bible_index_answers_overlap_queries_and_updates_incrementally(tmp_path):
+    path = str(tmp_path / "bible_index.json")
+    episodes = [
+        {"id": "a", "summary": summary("Romans 8:28", "John 3:16")},
+        {"id": "b", "summary": summary("Romans 7:1-8:4")},
+        {"id": "c", "summary": summary("Romans 9", further=["Romans 8:31-39"])},
+        {"id": "d", "summary": summary("Romans 1:1-3:20")},
+    ]
+    digest = lambda ep: repr(ep["summary"])
+    index = BibleIndex(path)
+    assert index.update(episodes, digest) == 4
+
+    assert index.query("Romans 8") == ["b", "a", "c"]
+    assert index.query("Romans 8:1-2") == ["b"]
+    assert index.query("Romans 2:5") == ["d"]
+    assert index.query("John 3") == ["a"]
+    assert index.query("Romans 16") == []
+
+    # Reloaded from disk, only the changed and removed episodes are touched
+    index = BibleIndex(path)
+    episodes[0]["summary"] = summary("Romans 12:1-2")
+    assert index.update(episodes[:3], digest) == 2
+    assert index.query("Romans 8") == ["b", "c"]
+    assert index.query("Romans 2:5") == []
+    assert index.query("Romans 12") == ["a"]
+
+    # A whole-book reference matches every query on the book without widening the scan for the others
+    episodes.append({"id": "e", "summary": summary("Romans")})
+    assert index.update(episodes, digest) == 2
+    assert index.query("Romans 8") == ["e", "b", "c"]
+    assert index.query("Romans 16") == ["e"]
+    assert index._running_max("Romans")[0] == -1
+
+
+def test_publish_site_writes_per_book_pages(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    eps_dir = tmp_path / "episodes"
+    for ep_id, s in [("a", summary("Romans 8:28")), ("b", summary("Rom 8:1-4", further=["Psalm 23"]))]:
+        write_json(str(eps_dir / ep_id / "meta.json"), {"id": ep_id, "title": f"Sermon {ep_id}"})
+        write_json(str(eps_dir / ep_id / "summary.json"), s)
+    site = tmp_path / "site"
+    publish_site(str(site), load_episode_list(str(eps_dir)), "Site", "Desc",
+                 bible_index_path=str(tmp_path / "bible_index.json"))
+
+    books = (site / "bible" / "index.html").read_text(encoding="utf-8")
+    assert "psalms.html" in books and "romans.html" in books and "genesis.html" not in books
+    romans = (site / "bible" / "romans.html").read_text(encoding="utf-8")
+    assert romans.index("Romans 8:1-4") < romans.index("Romans 8:28")
+    assert 'href="../episodes/a.html">Sermon a</a>' in romans
+    assert "(further reading)" in (site / "bible" / "psalms.html").read_text(encoding="utf-8")
@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import time
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.cache import LOW_WATER, ChunkCache
+
+
+def test_chunk_cache_key_depends_on_bytes_model_and_language(tmp_path):
+    a = tmp_path / "a.mp3"
+    b = tmp_path / "b.mp3"
+    a.write_bytes(b"same audio")
+    b.write_bytes(b"same audio")
+    assert ChunkCache.key(str(a), "whisper-1", "en") == ChunkCache.key(str(b), "whisper-1", "en")
+    assert ChunkCache.key(str(a), "whisper-1", "en") != ChunkCache.key(str(a), "whisper-1", None)
+    assert ChunkCache.key(str(a), "whisper-1", "en") != ChunkCache.key(str(a), "gpt-4o-mini-transcribe", "en")
+
+
+def test_chunk_cache_round_trip_and_lru_eviction(tmp_path):
+    cache = ChunkCache(str(tmp_path / "cache"), max_bytes=200)
+    cache.put("aa" + "0" * 62, "x" * 60)
+    time.sleep(0.01)
+    cache.put("bb" + "0" * 62, "y" * 60)
+    time.sleep(0.01)
+    assert cache.get("aa" + "0" * 62) == "x" * 60  # refreshes 'aa'
+    time.sleep(0.01)
+    cache.put("cc" + "0" * 62, "z" * 60)  # over budget: least recently used ('bb') goes
+
+    assert cache.get("bb" + "0" * 62) is None
+    assert cache.get("aa" + "0" * 62) == "x" * 60
+    assert cache.get("cc" + "0" * 62) == "z" * 60
+    # Trimmed below the high-water mark, leaving room before the next scan
+    assert cache._total <= 200 * LOW_WATER
+
+    # A fresh instance sees the persisted entries
+    assert ChunkCache(str(tmp_path / "cache"), max_bytes=200).get("cc" + "0" * 62) == "z" * 60
+
+
+def test_chunk_cache_size_stays_right_under_concurrent_puts_of_one_key(tmp_path):
+    cache = ChunkCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    key = "dd" + "0" * 62
+    threads = [threading.Thread(target=cache.put, args=(key, "t" * (10 + i))) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache._total == os.path.getsize(cache._path(key))
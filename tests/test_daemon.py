@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+
+import pytest
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.fakes import StaticServer, rss
+from src import daemon
+from src.schedule import DAY, WEEK
+from src.state import StateStore
+
+
+def make_cfg(tmp_path, feeds):
+    return {
+        "feeds": feeds,
+        "pipeline": {"per_feed_limit": 3, "max_attempts": 2},
+        "storage": {"data_dir": str(tmp_path), "episodes_dir": str(tmp_path / "episodes")},
+        "daemon": {"retry_minutes": 60},
+        "metrics": {"runs_dir": str(tmp_path / "runs")},
+    }
+
+
+def test_daemon_polls_queues_once_and_schedules_from_history(tmp_path, monkeypatch):
+    now = int(time.time())
+    processed = []
+
+    def fake_process(eps, cfg, store, user_prompt):
+        for ep in eps:
+            store.start_job(ep)
+            if ep["id"].endswith("1"):
+                store.job_failed(ep["id"], "RuntimeError: boom")
+            else:
+                store.advance(ep["id"], "summarised")
+                store.mark_processed(ep["id"], guid=ep["guid"])
+            processed.append(ep["id"])
+
+    monkeypatch.setattr(daemon, "process_episodes", fake_process)
+    monkeypatch.setattr(daemon, "publish", lambda cfg, episodes: None)
+
+    with StaticServer() as host:
+        items = [{"title": "S%d" % i, "guid": "urn:s%d" % i, "link": "", "pub_ts": now - DAY - i * WEEK,
+                  "audio_url": host.url + "/%d.mp3" % i} for i in range(3)]
+        url = host.add("/feed.xml", rss("Feed", items), "application/rss+xml")
+        with StateStore(str(tmp_path / "state.db")) as store:
+            d = daemon.Daemon(make_cfg(tmp_path, [url]), store, "prompt")
+            assert d.poll_due(time.time()) == 3
+            # Polled again before processing: nothing is queued twice
+            d._due = [(0.0, url)]
+            assert d.poll_due(time.time()) == 0
+
+            d._process(d._batches.get())
+            assert sorted(processed) == ["urn-s0", "urn-s1", "urn-s2"]
+            assert store.job("urn-s0")["stage"] == "published"
+            # The feed's weekly history is learned: next poll is hours away, not the 30 min default
+            assert store.publish_times(url) == sorted(it["pub_ts"] for it in items)
+            due, _ = d._due[0]
+            assert due - time.time() > 3600
+
+            # The failed episode is not retried until retry_minutes have passed
+            d._due = [(0.0, url)]
+            assert d.poll_due(time.time()) == 0
+            d.retry_after = 0
+            d._due = [(0.0, url)]
+            assert d.poll_due(time.time()) == 1
+    assert os.listdir(tmp_path / "runs")
+
+
+def test_daemon_reschedules_feeds_when_polling_fails(tmp_path, monkeypatch):
+    def boom(*args, **kwargs):
+        raise OSError("network down")
+
+    monkeypatch.setattr(daemon, "find_new_episodes", boom)
+    feeds = ["http://a.invalid/feed", "http://b.invalid/feed"]
+    with StateStore(str(tmp_path / "state.db")) as store:
+        d = daemon.Daemon(make_cfg(tmp_path, feeds), store, "prompt")
+        start = time.time()
+        with pytest.raises(OSError):
+            d.poll_due(start)
+        assert sorted(url for _, url in d._due) == feeds
+        assert all(due - start >= d.settings.default_interval for due, _ in d._due)
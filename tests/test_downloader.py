@@ -0,0 +1,128 @@
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.downloader import download_audio
+
+BODY = bytes(range(256)) * 8192  # 2 MiB
+
+
+@pytest.fixture
+def audio_server():
+    stats = {"get": 0, "head": 0, "bytes": 0, "ranges": [], "drop_once": False, "etag": '"v1"', "if_range": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self):
+            stats["head"] += 1
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", stats["etag"])
+            self.end_headers()
+
+        def do_GET(self):
+            stats["get"] += 1
+            start, end = 0, len(BODY) - 1
+            m = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if_range = self.headers.get("If-Range")
+            if if_range:
+                stats["if_range"].append(if_range)
+            if m and if_range not in (None, stats["etag"]):
+                m = None  # changed since: send the whole file
+            if m:
+                start = int(m.group(1))
+                end = int(m.group(2)) if m.group(2) else end
+                stats["ranges"].append((start, end))
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(BODY)}")
+            else:
+                self.send_response(200)
+            self.send_header("ETag", stats["etag"])
+            payload = BODY[start:end + 1]
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            if stats["drop_once"]:
+                # Send half, then drop the connection
+                stats["drop_once"] = False
+                stats["bytes"] += len(payload) // 2
+                self.wfile.write(payload[: len(payload) // 2])
+                self.close_connection = True
+                return
+            # Counted before writing: the client may be done before this thread runs again
+            stats["bytes"] += len(payload)
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/sermon.mp3", stats
+    server.shutdown()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_oversized_file_rejected_before_body(audio_server, tmp_path):
+    url, stats = audio_server
+    assert download_audio(url, str(tmp_path), max_mb=1) is None
+    assert stats["get"] == 0
+
+
+def test_resume_after_dropped_connection(audio_server, tmp_path):
+    url, stats = audio_server
+    stats["drop_once"] = True
+    path = download_audio(url, str(tmp_path), max_mb=10, segments=1, attempts=2)
+    assert read(path) == BODY
+    # The retry asked only for what was missing
+    assert stats["ranges"] == [(len(BODY) // 2, len(BODY) - 1)]
+    assert stats["bytes"] == len(BODY)
+    assert not os.path.exists(path + ".part")
+
+
+def test_parallel_segments_and_repeat_download_is_free(audio_server, tmp_path):
+    url, stats = audio_server
+    path = download_audio(url, str(tmp_path), max_mb=10, segments=4, segment_min_mb=1)
+    assert read(path) == BODY
+    assert len(stats["ranges"]) == 4
+
+    gets = stats["get"]
+    assert download_audio(url, str(tmp_path), max_mb=10) == path
+    assert stats["get"] == gets
+
+
+def test_failed_download_keeps_partial_for_next_call(audio_server, tmp_path):
+    url, stats = audio_server
+    stats["drop_once"] = True
+    assert download_audio(url, str(tmp_path), max_mb=10, segments=1, attempts=1) is None
+    part = tmp_path / "audio" / "sermon.mp3.part"
+    assert part.stat().st_size == len(BODY) // 2
+
+    path = download_audio(url, str(tmp_path), max_mb=10, segments=1)
+    assert read(path) == BODY
+    assert stats["ranges"] == [(len(BODY) // 2, len(BODY) - 1)]
+    assert stats["if_range"] == ['"v1"']
+    assert os.listdir(tmp_path / "audio") == ["sermon.mp3"]
+
+
+def test_partial_of_a_changed_file_is_not_resumed(audio_server, tmp_path):
+    url, stats = audio_server
+    stats["drop_once"] = True
+    assert download_audio(url, str(tmp_path), max_mb=10, segments=1, attempts=1) is None
+    stats["etag"] = '"v2"'
+    path = download_audio(url, str(tmp_path), max_mb=10, segments=1)
+    assert read(path) == BODY
+    assert stats["ranges"] == []  # started over rather than splicing onto stale bytes
@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.feed_watcher import _utf8_headers, find_new_episodes, parse_feed
+
+
+def make_rss(n_items, start_day=1):
+    items = []
+    for i in range(n_items):
+        day = start_day + i
+        items.append(f"""
+    <item>
+      <title>Sermon {i}</title>
+      <guid>ep-{i}</guid>
+      <link>https://example.org/ep/{i}</link>
+      <pubDate>{day:02d} Jan 2025 10:00:00 GMT</pubDate>
+      <enclosure url="https://example.org/audio/{i}.mp3" type="audio/mpeg" length="1000"/>
+    </item>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+  <channel>
+    <title>Test feed</title>
+    <itunes:image href="https://example.org/feed.png"/>{''.join(items)}
+  </channel>
+</rss>""".encode("utf-8")
+
+
+@pytest.fixture
+def feed_server():
+    body = make_rss(5)
+    hits = {"200": 0, "304": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == '"v1"':
+                hits["304"] += 1
+                self.send_response(304)
+                self.end_headers()
+                return
+            hits["200"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits
+    server.shutdown()
+
+
+def test_find_new_episodes_uses_conditional_get(feed_server):
+    base, hits = feed_server
+    feeds = [f"{base}/a.xml", f"{base}/b.xml"]
+    cache = {}
+
+    first = find_new_episodes(feeds, [], per_feed_limit=2, feed_cache=cache)
+    assert [e["guid"] for e in first] == ["ep-4", "ep-3", "ep-4", "ep-3"]
+    assert hits == {"200": 2, "304": 0}
+    assert cache[feeds[0]]["etag"] == '"v1"'
+
+    # Second run: server answers 304, cached candidates still filtered by processed ids
+    second = find_new_episodes(feeds, ["ep-4"], per_feed_limit=2, feed_cache=cache)
+    assert [e["guid"] for e in second] == ["ep-3", "ep-3"]
+    assert hits == {"200": 2, "304": 2}
+
+
+def test_find_new_episodes_refetches_when_limit_changes(feed_server):
+    base, hits = feed_server
+    cache = {}
+    find_new_episodes([f"{base}/a.xml"], [], per_feed_limit=1, feed_cache=cache)
+    eps = find_new_episodes([f"{base}/a.xml"], [], per_feed_limit=3, feed_cache=cache)
+    assert len(eps) == 3
+    assert hits == {"200": 2, "304": 0}
+
+
+def test_find_new_episodes_survives_unreachable_feed(feed_server):
+    base, _ = feed_server
+    cache = {}
+    eps = find_new_episodes(["http://127.0.0.1:9/nope.xml", f"{base}/a.xml"], [], per_feed_limit=1,
+                            feed_cache=cache, timeout=2)
+    assert [e["guid"] for e in eps] == ["ep-4"]
+    assert "http://127.0.0.1:9/nope.xml" not in cache
+
+
+def test_parse_feed_limit_matches_full_parse():
+    body = make_rss(25).replace(
+        b"<guid>ep-7</guid>",
+        b"<guid>ep-7</guid><itunes:image href=\"https://example.org/ep7.png\"/>",
+    ).replace(b"08 Jan 2025", b"31 Dec 2030")
+    full = parse_feed(body)
+    full.sort(key=lambda e: e["published_ts"], reverse=True)
+    limited = parse_feed(body, limit=3)
+    assert limited == full[:3]
+    assert limited[0]["guid"] == "ep-7"
+    assert limited[0]["image_url"] == "https://example.org/ep7.png"
+
+
+def test_parse_feed_limit_handles_atom_and_malformed_xml():
+    atom = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Atom</title>
+  <entry><id>a1</id><title>Old</title><updated>2024-01-01T00:00:00Z</updated>
+    <link rel="enclosure" type="audio/mpeg" href="https://example.org/a1.mp3"/></entry>
+  <entry><id>a2</id><title>New</title><updated>2024-06-01T00:00:00Z</updated>
+    <link rel="enclosure" type="audio/mpeg" href="https://example.org/a2.mp3"/></entry>
+</feed>"""
+    eps = parse_feed(atom, limit=1)
+    assert [e["guid"] for e in eps] == ["a2"]
+    assert eps[0]["audio_url"] == "https://example.org/a2.mp3"
+
+    # An undeclared HTML entity is not well-formed XML: falls back to feedparser's lenient parser
+    broken = make_rss(4).replace(b"<title>Sermon 3</title>", b"<title>Sermon&nbsp;3</title>")
+    assert [e["guid"] for e in parse_feed(broken, limit=2)] == ["ep-3", "ep-2"]
+
+
+def test_parse_feed_limit_keeps_non_utf8_text():
+    body = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<rss version="2.0"><channel><title>Caf\u00e9</title>
+  <item><title>First \u00e9</title><guid>e1</guid><pubDate>Mon, 06 Jan 2025 10:00:00 GMT</pubDate>
+    <enclosure url="https://example.org/1.mp3" type="audio/mpeg"/></item>
+  <item><title>Second \u00e9</title><guid>e2</guid><pubDate>Tue, 07 Jan 2025 10:00:00 GMT</pubDate>
+    <enclosure url="https://example.org/2.mp3" type="audio/mpeg"/></item>
+</channel></rss>""".encode("latin-1")
+    headers = {"content-type": "application/rss+xml; charset=ISO-8859-1"}
+    assert _utf8_headers(headers) == {"content-type": "application/rss+xml; charset=utf-8"}
+    # The reduced body is re-encoded as UTF-8, so the server's charset must not be applied to it
+    assert [e["title"] for e in parse_feed(body, headers, limit=1)] == ["Second \u00e9"]
+    assert [e["title"] for e in parse_feed(body, headers)] == ["First \u00e9", "Second \u00e9"]
+
+
+def test_unconditional_304_is_a_failed_poll_not_a_crash():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(304)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        cache = {}
+        url = "http://127.0.0.1:%d/feed.xml" % server.server_address[1]
+        assert find_new_episodes([url], set(), feed_cache=cache) == []
+        assert cache == {}
+    finally:
+        server.shutdown()
+        server.server_close()
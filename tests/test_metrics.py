@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import metrics
+from src.transcriber import transcribe_chunks
+
+
+def test_spans_and_counters_attributed_to_episode():
+    run = metrics.start_run("test")
+    with metrics.episode("ep1"):
+        with metrics.span("download"):
+            metrics.count("bytes_downloaded", 100)
+        with pytest.raises(ValueError):
+            with metrics.span("download"):
+                raise ValueError("boom")
+    metrics.count("bytes_downloaded", 5)
+
+    report = run.report()
+    assert report["spans"]["download"]["count"] == 2
+    assert report["spans"]["download"]["errors"] == 1
+    assert report["counters"]["bytes_downloaded"] == 105
+    assert report["episodes"]["ep1"]["counters"] == {"bytes_downloaded": 100}
+    assert report["episodes"]["ep1"]["spans"]["download"]["count"] == 2
+
+
+def test_bind_carries_episode_into_thread_pool():
+    run = metrics.start_run("test")
+
+    def work(i):
+        metrics.count("items", i)
+
+    with metrics.episode("ep1"):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(metrics.bind(work), range(1, 9)))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(work, 100).result()  # unbound: run total only
+
+    report = run.report()
+    assert report["counters"]["items"] == 136
+    assert report["episodes"]["ep1"]["counters"]["items"] == 36
+
+
+def test_transcribe_chunks_reports_bytes_per_episode(tmp_path):
+    run = metrics.start_run("test")
+    paths = []
+    for i in range(3):
+        p = tmp_path / f"chunk_{i:03d}.mp3"
+        p.write_bytes(b"x" * (10 + i))
+        paths.append(str(p))
+    transcriptions = SimpleNamespace(create=lambda model, file, **kwargs: SimpleNamespace(text="hi"))
+    client = SimpleNamespace(audio=SimpleNamespace(transcriptions=transcriptions))
+
+    with metrics.episode("ep1"):
+        transcribe_chunks(client, "m", paths, max_in_flight=3)
+
+    ep = run.report()["episodes"]["ep1"]
+    assert ep["counters"] == {"bytes_uploaded": 33, "chunks_transcribed": 3}
+    assert ep["spans"]["transcribe_chunk"]["count"] == 3
+
+
+def test_write_report_and_prometheus_textfile(tmp_path):
+    run = metrics.start_run("test")
+    with metrics.span("publish"):
+        pass
+    metrics.count("prompt_tokens", 42)
+    runs_dir = tmp_path / "runs"
+    runs_dir.mkdir()
+    for n in range(3):
+        (runs_dir / f"2000010{n}T000000Z-test.json").write_text("{}")
+    prom = tmp_path / "pipeline.prom"
+
+    path = metrics.write_report({"runs_dir": str(runs_dir), "keep_runs": 2, "prometheus_textfile": str(prom)}, run)
+
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["command"] == "test"
+    assert report["counters"] == {"prompt_tokens": 42}
+    assert sorted(os.listdir(runs_dir)) == ["20000102T000000Z-test.json", os.path.basename(path)]
+    text = prom.read_text()
+    assert 'podcast_pipeline_counter{command="test",name="prompt_tokens"} 42' in text
+    assert 'podcast_pipeline_span_count{command="test",span="publish"} 1' in text
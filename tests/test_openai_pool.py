@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.openai_pool import AdaptiveLimit, OpenAIPool, TokenBucket
+from src.summarizer import extract_key_info
+from src.transcriber import transcribe_chunks
+
+
+@pytest.fixture
+def fake_api():
+    """A local stand-in for the OpenAI API: throttles the first `throttle` requests with Retry-After."""
+    state = {"requests": 0, "throttle": 0, "retry_after_ms": "300", "in_flight": 0, "max_in_flight": 0,
+             "lock": threading.Lock()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status, body, headers=()):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state["lock"]:
+                state["requests"] += 1
+                throttled = state["throttle"] > 0
+                if throttled:
+                    state["throttle"] -= 1
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            try:
+                if throttled:
+                    self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                               [("retry-after-ms", state["retry_after_ms"])])
+                    return
+                time.sleep(0.05)
+                if self.path.endswith("/audio/transcriptions"):
+                    self.reply(200, {"text": "chunk text"})
+                else:
+                    answer = {"overall_theme": "hope", "quotes": ["q"], "bible_passages": ["John 3:16"]}
+                    self.reply(200, {
+                        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": json.dumps(answer)}}],
+                        "usage": {"prompt_tokens": 40, "completion_tokens": 10, "total_tokens": 50},
+                    })
+            finally:
+                with state["lock"]:
+                    state["in_flight"] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", api_key="test", max_retries=0)
+    yield client, state
+    server.shutdown()
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(1200, capacity=1)  # 20 per second, no burst
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.24
+
+
+def test_adaptive_limit_halves_on_throttle_and_recovers():
+    limit = AdaptiveLimit(8, increase_after=2)
+    limit.throttled()
+    limit.throttled()
+    assert limit.limit == 2
+    for _ in range(4):
+        limit.success()
+    assert limit.limit == 4
+
+
+def test_pool_honours_retry_after_from_the_api(fake_api):
+    client, state = fake_api
+    state["throttle"] = 1
+    pool = OpenAIPool(client=client, max_concurrency=4, tokens_per_minute=6000)
+    start = time.monotonic()
+    data = extract_key_info("Short sermon.", "prompt", "m", pool=pool)
+    elapsed = time.monotonic() - start
+    assert data["overall_theme"] == "hope"
+    assert state["requests"] == 2
+    # Waited for the server's 300ms, not the 1s exponential fallback
+    assert 0.3 <= elapsed < 1.0
+    assert pool.concurrency.limit == 2
+
+
+def test_transcription_shares_the_pool_limits(fake_api, tmp_path):
+    client, state = fake_api
+    chunks = []
+    for i in range(6):
+        p = tmp_path / f"chunk_{i:03d}.mp3"
+        p.write_bytes(bytes([i]) * 100)
+        chunks.append(str(p))
+    pool = OpenAIPool(client=client, max_concurrency=2)
+    texts = transcribe_chunks(pool, "m", chunks, "en", max_in_flight=6)
+    assert texts == ["chunk text"] * 6
+    # Six worker threads, but the pool only lets two requests reach the API at once
+    assert state["max_in_flight"] == 2
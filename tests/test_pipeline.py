@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+import time
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import pipeline
+from src.state import StateStore
+from src.utils import read_json
+
+
+def make_cfg(tmp_path, workers=2):
+    return {
+        "openai": {"transcription_model": "m", "summarize_model": "m"},
+        "pipeline": {
+            "max_download_mb": 10,
+            "segment_seconds": 600,
+            "download_workers": workers,
+            "transcribe_workers": workers,
+            "summarize_workers": workers,
+            "queue_size": 1,
+        },
+        "storage": {"data_dir": str(tmp_path), "episodes_dir": str(tmp_path / "episodes")},
+    }
+
+
+def make_ep(i):
+    return {"id": f"ep-{i}", "guid": f"urn:{i}", "title": f"T{i}", "link": "", "published": "",
+            "published_ts": i, "audio_url": f"http://example.org/{i}.mp3"}
+
+
+def test_process_episodes_overlaps_and_isolates_failures(tmp_path, monkeypatch):
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def fake_download(url, dest_dir, max_mb, **kwargs):
+        if url.endswith("/1.mp3"):
+            return None  # download failure for one episode
+        path = os.path.join(dest_dir, "audio.mp3")
+        open(path, "wb").close()
+        return path
+
+    def fake_transcribe(input_path, work_dir, **kwargs):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(0.1)
+        with lock:
+            in_flight["now"] -= 1
+        if "ep-2" in work_dir:
+            raise RuntimeError("API error")
+        return {"text": "transcript for " + os.path.basename(work_dir), "chunks": []}
+
+    def fake_summarize(transcript, user_prompt, model, temperature, **kwargs):
+        return {"overall_theme": transcript, "quotes": ["q"] * 10}
+
+    monkeypatch.setattr(pipeline, "download_audio", fake_download)
+    monkeypatch.setattr(pipeline, "transcribe_audio_segments", fake_transcribe)
+    monkeypatch.setattr(pipeline, "extract_key_info", fake_summarize)
+
+    cfg = make_cfg(tmp_path)
+    with StateStore(str(tmp_path / "state.db")) as store:
+        counts = pipeline.process_episodes([make_ep(i) for i in range(6)], cfg, store, "prompt")
+        assert counts == {"processed": 4, "failed": 2}
+        assert sorted(store.processed_ids()) == ["ep-0", "ep-3", "ep-4", "ep-5"]
+
+    assert in_flight["max"] == 2
+    summary = read_json(str(tmp_path / "episodes" / "ep-5" / "summary.json"), {})
+    assert summary["overall_theme"] == "transcript for ep-5"
+    assert len(summary["quotes"]) == 5
+    # Temporary audio is always cleaned up by default, success or failure
+    assert not os.listdir(tmp_path / "tmp")
+
+    # keep_failed_downloads: failed jobs keep theirs for the retry to resume from...
+    cfg["pipeline"].update(keep_failed_downloads=True, max_attempts=3)
+    with StateStore(str(tmp_path / "state.db")) as store:
+        counts = pipeline.process_episodes([make_ep(1), make_ep(2)], cfg, store, "prompt")
+        assert counts == {"processed": 0, "failed": 2}
+    assert sorted(os.listdir(tmp_path / "tmp")) == ["ep-1", "ep-2"]
+    assert os.listdir(tmp_path / "tmp" / "ep-2") == ["audio.mp3"]
+
+    # ...until the episode is out of attempts
+    with StateStore(str(tmp_path / "state.db")) as store:
+        counts = pipeline.process_episodes([make_ep(1), make_ep(2)], cfg, store, "prompt")
+        assert counts == {"processed": 0, "failed": 2}
+    assert not os.listdir(tmp_path / "tmp")
+
+
+def test_process_episodes_checkpoints_and_resumes(tmp_path, monkeypatch):
+    calls = {"download": 0, "transcribe": 0}
+
+    def fake_download(url, dest_dir, max_mb, **kwargs):
+        calls["download"] += 1
+        path = os.path.join(dest_dir, "audio.mp3")
+        open(path, "wb").close()
+        return path
+
+    def fake_transcribe(input_path, work_dir, **kwargs):
+        calls["transcribe"] += 1
+        return {"text": "words", "chunks": []}
+
+    attempts = {"n": 0}
+
+    def flaky_summarize(transcript, user_prompt, model, temperature, **kwargs):
+        attempts["n"] += 1
+        if attempts["n"] == 1:
+            raise RuntimeError("timeout")
+        return {"overall_theme": transcript, "quotes": []}
+
+    monkeypatch.setattr(pipeline, "download_audio", fake_download)
+    monkeypatch.setattr(pipeline, "transcribe_audio_segments", fake_transcribe)
+    monkeypatch.setattr(pipeline, "extract_key_info", flaky_summarize)
+
+    cfg = make_cfg(tmp_path, workers=1)
+    with StateStore(str(tmp_path / "state.db")) as store:
+        assert pipeline.process_episodes([make_ep(0)], cfg, store, "prompt") == {"processed": 0, "failed": 1}
+        job = store.job("ep-0")
+        assert job["stage"] == "transcribed" and job["attempts"] == 1 and "timeout" in job["error"]
+        assert not os.path.exists(tmp_path / "episodes" / "ep-0" / "summary.json")
+
+        # The next run picks the job up at summarising: no new download or transcription
+        pending = store.pending_jobs()
+        assert pipeline.process_episodes(pending, cfg, store, "prompt") == {"processed": 1, "failed": 0}
+        assert calls == {"download": 1, "transcribe": 1}
+        assert store.job("ep-0")["stage"] == "summarised"
+        assert store.processed_ids() == ["ep-0"]
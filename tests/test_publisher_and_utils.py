@@ -11,8 +11,11 @@ import pytest
 # Ensure project root is on sys.path so `from src...` imports work
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.utils import write_json, slugify
-from src.publisher import load_episodes
+from src.utils import read_json, write_json, slugify
+from src.publisher import load_episodes, publish_site
+from src import search
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 
 def make_episode(tmpdir, ep_id, title, published_str=None, published_ts=None):
@@ -65,5 +68,220 @@ def test_load_episodes_with_and_without_published_ts(tmp_path):
     assert set(ids) >= {"no_ts_a", "no_ts_b"}
 
 
+def test_publish_site_is_incremental(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)  # templates/ is resolved relative to the repo root
+    eps_dir = tmp_path / "episodes"
+    eps_dir.mkdir()
+    site = str(tmp_path / "site")
+    for i in range(3):
+        make_episode(eps_dir, f"ep{i}", f"Title {i}", published_ts=1700000000 + i)
+
+    publish = lambda description: publish_site(site, load_episodes(str(eps_dir)), "Site", description, search=False, bible=False)
+    first = publish("Desc")
+    # index + 3 episode pages + feed.json + 1 API index page + 3 API details + 3 transcripts
+    assert first == {"written": 12, "unchanged": 0, "removed": 0}
+
+    mtime = os.path.getmtime(os.path.join(site, "episodes", "ep0.html"))
+    second = publish("Desc")
+    assert second == {"written": 0, "unchanged": 12, "removed": 0}
+    assert os.path.getmtime(os.path.join(site, "episodes", "ep0.html")) == mtime
+
+    # A transcript edit only touches that episode's page, its API files and the feed root
+    write_json(str(eps_dir / "ep1" / "transcript.json"), {"text": "edited"})
+    third = publish("Desc")
+    assert third == {"written": 4, "unchanged": 8, "removed": 0}
+
+    # Removing an episode removes its files; a site config change re-renders every HTML page
+    shutil.rmtree(eps_dir / "ep2")
+    fourth = publish("Other description")
+    assert fourth == {"written": 5, "unchanged": 4, "removed": 3}
+    assert not os.path.exists(os.path.join(site, "episodes", "ep2.html"))
+    assert not os.path.exists(os.path.join(site, "api", "episodes", "ep2.json"))
+
+
+def test_publish_site_json_api_is_paginated_with_change_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    eps_dir = tmp_path / "episodes"
+    eps_dir.mkdir()
+    site = tmp_path / "site"
+    for i in range(5):
+        make_episode(eps_dir, f"ep{i}", f"Title {i}", published_ts=1700000000 + i)
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", api_page_size=2)
+
+    def load(rel):
+        return json.loads((site / rel).read_text(encoding="utf-8"))
+
+    root = load("feed.json")
+    assert (root["total"], root["pages"]) == (5, 3)
+    ids, rel = [], root["first"]
+    while rel:
+        page = load(rel)
+        ids += [e["id"] for e in page["episodes"]]
+        rel = page["next"]
+    assert ids == ["ep4", "ep3", "ep2", "ep1", "ep0"]
+
+    detail = load(page["episodes"][0]["href"])
+    assert detail["summary"] == {"overall_theme": "t"} and "text" not in detail
+    assert load(detail["transcript"])["text"] == "t"
+
+    changes = load(root["changes"])
+    assert [b["changed"] for b in changes["builds"]] == [5]
+
+    # The next build lists only what changed since the previous one
+    write_json(str(eps_dir / "ep3" / "summary.json"), {"overall_theme": "new"})
+    shutil.rmtree(eps_dir / "ep0")
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", api_page_size=2)
+    changes = load("api/changes.json")
+    assert len(changes["builds"]) == 2 and load("feed.json")["updated"] == changes["latest"]
+    shard = load(changes["builds"][0]["href"])
+    assert [e["id"] for e in shard["changed"]] == ["ep3"] and shard["changed"][0]["theme"] == "new"
+    assert shard["removed"] == ["ep0"]
+    assert shard["since"] == changes["builds"][1]["build_time"]
+
+
+def test_publish_site_paginates_index_and_builds_month_archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    eps_dir = tmp_path / "episodes"
+    eps_dir.mkdir()
+    site = tmp_path / "site"
+    # Two episodes in November 2023, three in December 2023
+    for i, ts in enumerate([1700000000, 1700100000, 1701500000, 1701600000, 1701700000]):
+        make_episode(eps_dir, f"ep{i}", f"Title {i}", published_ts=ts)
+    write_json(str(eps_dir / "ep4" / "meta.json"),
+               {"id": "ep4", "title": "Title 4", "published_ts": 1701700000, "image_url": "https://example.com/a.jpg"})
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", index_page_size=2, archive_by_month=True)
+
+    first = (site / "index.html").read_text(encoding="utf-8")
+    assert first.count('class="episode"') == 2 and 'href="page/2.html"' in first
+    assert 'src="https://example.com/a.jpg"' in first and 'loading="lazy"' in first
+    last = (site / "page" / "3.html").read_text(encoding="utf-8")
+    assert last.count('class="episode"') == 1
+    assert 'href="../episodes/ep0.html"' in last and 'href="../page/2.html"' in last
+    assert not (site / "page" / "1.html").exists()
+
+    archive = (site / "archive" / "index.html").read_text(encoding="utf-8")
+    assert "December 2023" in archive and "November 2023" in archive
+    november = (site / "archive" / "2023-11.html").read_text(encoding="utf-8")
+    assert november.count('class="episode"') == 2
+
+    # Shrinking the archive drops the pages that are no longer needed
+    for i in range(3):
+        shutil.rmtree(eps_dir / f"ep{i}")
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", index_page_size=2, archive_by_month=True)
+    assert not (site / "page" / "2.html").exists() and not (site / "page" / "3.html").exists()
+    assert not (site / "archive" / "2023-11.html").exists()
+
+
+def test_search_index_is_sharded_and_incremental(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    eps_dir = tmp_path / "episodes"
+    eps_dir.mkdir()
+    site = tmp_path / "site"
+    cache = str(tmp_path / "cache")
+    transcripts = ["Grace and forgiveness", "Hope in suffering", "Forgiving one another"]
+    for i, text in enumerate(transcripts):
+        make_episode(eps_dir, f"ep{i}", f"Title {i}", published_ts=1700000000 + i)
+        write_json(str(eps_dir / f"ep{i}" / "transcript.json"), {"text": text})
+    write_json(str(eps_dir / "ep2" / "meta.json"), {"id": "ep2", "title": "Forgiveness", "published_ts": 1700000002})
+
+    calls = []
+    real = search.term_weights
+    monkeypatch.setattr(search, "term_weights", lambda ep: calls.append(ep["id"]) or real(ep))
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", search_cache_dir=cache)
+    assert sorted(calls) == ["ep0", "ep1", "ep2"]
+
+    def load(rel):
+        return json.loads((site / rel).read_text(encoding="utf-8"))
+
+    docs = load("search/docs.json")
+    assert [d[0] for d in docs] == ["ep0", "ep1", "ep2"]  # oldest first
+    fo = load("search/fo.json")
+    assert set(fo) == {"forgiveness", "forgiving"}
+    # A title match outranks a transcript match
+    assert [docs[doc][0] for doc, _ in fo["forgiveness"]] == ["ep2", "ep0"]
+    assert "and" not in load("search/an.json")  # stop word
+    assert (site / "search.html").exists()
+
+    # Editing one transcript re-tokenises only that episode and rewrites only the shards it touches
+    calls.clear()
+    write_json(str(eps_dir / "ep1" / "transcript.json"), {"text": "Hope and joy"})
+    mtime = os.path.getmtime(site / "search" / "fo.json")
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", search_cache_dir=cache)
+    assert calls == ["ep1"]
+    assert load("search/jo.json") == {"joy": [[1, 1]]}
+    assert not (site / "search" / "su.json").exists()
+    assert os.path.getmtime(site / "search" / "fo.json") == mtime
+
+    # A backfilled older episode and a removed one keep every other document's number
+    make_episode(eps_dir, "old", "Forgiveness of old", published_ts=1600000000)
+    shutil.rmtree(eps_dir / "ep0")
+    publish_site(str(site), load_episodes(str(eps_dir)), "Site", "Desc", search_cache_dir=cache)
+    docs = load("search/docs.json")
+    assert [d and d[0] for d in docs] == [None, "ep1", "ep2", "old"]
+    assert load("search/jo.json") == {"joy": [[1, 1]]}
+    assert [docs[doc][0] for doc, _ in load("search/fo.json")["forgiveness"]] == ["ep2", "old"]
+
+
+def test_load_episodes_reads_summary_and_transcript_lazily(tmp_path):
+    make_episode(tmp_path, "a", "First", published_ts=1)
+    (ep,) = load_episodes(str(tmp_path))
+    assert ep["overall_theme"] == "t"
+    assert "summary" not in dict(ep) and "transcript" not in dict(ep)
+    write_json(str(tmp_path / "a" / "transcript.json"), {"text": "full text"})
+    assert ep["transcript"] == "full text"
+    assert ep["summary"] == {"overall_theme": "t"}
+    # The catalogue is persisted next to the episode directories
+    assert os.path.exists(tmp_path / "catalogue.json")
+
+
+def test_catalogue_picks_up_hand_edits(tmp_path):
+    make_episode(tmp_path, "a", "First", published_ts=1)
+    assert load_episodes(str(tmp_path))[0]["title"] == "First"
+    # Same size as before: only the mtime tells the edit apart
+    meta = tmp_path / "a" / "meta.json"
+    st = os.stat(meta)
+    write_json(str(meta), {"id": "a", "title": "Fixed", "published": "", "published_ts": 1})
+    os.utime(meta, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    (ep,) = load_episodes(str(tmp_path))
+    assert ep["title"] == "Fixed" and "files" not in ep
+
+    # A fresh checkout (new mtimes, no local stats) re-hashes but leaves the committed catalogue alone
+    catalogue = tmp_path / "catalogue.json"
+    before = catalogue.read_bytes()
+    os.remove(tmp_path / ".catalogue-stats.json")
+    for name in ("meta.json", "summary.json", "transcript.json"):
+        os.utime(tmp_path / "a" / name, ns=(st.st_atime_ns, st.st_mtime_ns + 5 * 10**9))
+    catalogue.write_bytes(before + b" ")  # a rewrite would drop the trailing space
+    assert load_episodes(str(tmp_path))[0]["title"] == "Fixed"
+    assert catalogue.read_bytes() == before + b" "
+
+
+def test_write_json_is_atomic(tmp_path):
+    path = str(tmp_path / "state.json")
+    write_json(path, {"processed_ids": ["a"]})
+
+    class Unserialisable:
+        pass
+
+    # A failure mid-write leaves the previous file intact and no temp file behind
+    with pytest.raises(TypeError):
+        write_json(path, {"processed_ids": ["a", Unserialisable()]})
+    assert read_json(path, None) == {"processed_ids": ["a"]}
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_half_finished_episodes_stay_off_the_site(tmp_path):
+    make_episode(tmp_path, "done", "Done", published_ts=1)
+    partial = tmp_path / "partial"
+    partial.mkdir()
+    write_json(str(partial / "meta.json"), {"id": "partial", "title": "Partial"})
+    write_json(str(partial / "transcript.json"), {"text": "t"})
+    assert [e["id"] for e in load_episodes(str(tmp_path))] == ["done"]
+
+    # Once resumed and summarised it appears
+    write_json(str(partial / "summary.json"), {"overall_theme": "t"})
+    assert sorted(e["id"] for e in load_episodes(str(tmp_path))) == ["done", "partial"]
+
+
 if __name__ == "__main__":
     pytest.main([str(Path(__file__))])
@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import pipeline
+from src.cache import open_summary_cache
+from src.resummarize import resummarize
+from src.utils import read_json, write_json
+
+
+def make_cfg(tmp_path):
+    return {
+        "openai": {"summarize_model": "m", "temperature": 0.2},
+        "pipeline": {"max_quotes": 2},
+        "storage": {"data_dir": str(tmp_path), "episodes_dir": str(tmp_path / "episodes")},
+    }
+
+
+def make_episodes(tmp_path, n):
+    for i in range(n):
+        write_json(str(tmp_path / "episodes" / f"ep{i}" / "meta.json"), {"id": f"ep{i}", "title": f"T{i}"})
+        write_json(str(tmp_path / "episodes" / f"ep{i}" / "transcript.json"), {"text": f"transcript {i}"})
+        write_json(str(tmp_path / "episodes" / f"ep{i}" / "summary.json"), {"overall_theme": "old"})
+
+
+def fake_extractor(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def fake(transcript, user_prompt, model, temperature, **kwargs):
+        with lock:
+            calls.append(transcript)
+        return {"overall_theme": f"{user_prompt}: {transcript}", "quotes": ["a", "b", "c"]}
+
+    monkeypatch.setattr(pipeline, "extract_key_info", fake)
+    return calls
+
+
+def test_resummarize_only_calls_the_api_for_stale_combinations(tmp_path, monkeypatch):
+    calls = fake_extractor(monkeypatch)
+    make_episodes(tmp_path, 3)
+    cfg = make_cfg(tmp_path)
+    cache = open_summary_cache(cfg)
+
+    first = resummarize(cfg, "prompt v1", cache=cache, workers=3)
+    assert first["summarised"] == 3 and len(calls) == 3
+    summary = read_json(str(tmp_path / "episodes" / "ep1" / "summary.json"), {})
+    assert summary == {"overall_theme": "prompt v1: transcript 1", "quotes": ["a", "b"]}
+
+    # Same prompt again: nothing to do
+    calls.clear()
+    assert resummarize(cfg, "prompt v1", cache=cache)["unchanged"] == 3
+    assert calls == []
+
+    # A prompt tweak re-summarises everything; switching back is served from the cache
+    resummarize(cfg, "prompt v2", cache=cache)
+    assert len(calls) == 3
+    calls.clear()
+    back = resummarize(cfg, "prompt v1", cache=cache)
+    assert back["cached"] == 3 and calls == []
+
+    # An edited transcript is the only thing that needs the API
+    write_json(str(tmp_path / "episodes" / "ep2" / "transcript.json"), {"text": "corrected"})
+    counts = resummarize(cfg, "prompt v1", cache=cache)
+    assert calls == ["corrected"] and counts["summarised"] == 1 and counts["unchanged"] == 2
+
+
+def test_resummarize_seed_and_dry_run_make_no_calls(tmp_path, monkeypatch):
+    calls = fake_extractor(monkeypatch)
+    make_episodes(tmp_path, 2)
+    cfg = make_cfg(tmp_path)
+    cache = open_summary_cache(cfg)
+
+    assert resummarize(cfg, "p", cache=cache, dry_run=True)["summarised"] == 2
+    assert resummarize(cfg, "p", cache=cache, seed=True)["seeded"] == 2
+    # Seeded summaries count as current for this prompt and model
+    assert resummarize(cfg, "p", cache=cache)["unchanged"] == 2
+    assert calls == []
+    assert read_json(str(tmp_path / "episodes" / "ep0" / "summary.json"), {}) == {"overall_theme": "old"}
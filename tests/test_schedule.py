@@ -0,0 +1,53 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.schedule import DAY, HOUR, WEEK, PollSettings, in_window, learn_cadence, poll_interval
+
+# A Sunday, 00:00 UTC
+SUNDAY = 1762646400
+
+
+def weekly_sermons(n=8, hour=11):
+    # Published every Sunday in the 20 minutes after `hour`
+    return [SUNDAY - w * WEEK + hour * HOUR + (w % 3) * 600 for w in range(n)]
+
+
+def test_learns_weekly_slot():
+    cadence = learn_cadence(weekly_sermons())
+    assert abs(cadence.gap - WEEK) < HOUR
+    assert cadence.period == WEEK
+    assert cadence.slots == [(SUNDAY % WEEK) + 11 * HOUR]
+    assert in_window(SUNDAY + 12 * HOUR, cadence, 3 * HOUR)
+    assert not in_window(SUNDAY + 2 * DAY, cadence, 3 * HOUR)
+
+
+def test_not_enough_history_uses_default_interval():
+    settings = PollSettings()
+    cadence = learn_cadence([SUNDAY])
+    assert cadence.gap is None
+    assert poll_interval(SUNDAY, cadence, settings) == settings.default_interval
+
+
+def test_quiet_feed_polled_rarely_but_tightly_in_its_window():
+    settings = PollSettings()
+    cadence = learn_cadence(weekly_sermons())
+    # Midweek: capped at max_interval
+    assert poll_interval(SUNDAY + 3 * DAY, cadence, settings) == settings.max_interval
+    # An hour before the usual slot: wake up for the window rather than sleeping through it
+    assert poll_interval(SUNDAY + 10 * HOUR, cadence, settings) == HOUR
+    # Inside the window: every few minutes
+    assert poll_interval(SUNDAY + 11 * HOUR + 600, cadence, settings) == settings.window_interval
+
+
+def test_daily_feed_interval_and_overdue_tightening():
+    settings = PollSettings(max_interval=24 * HOUR)
+    ts = [SUNDAY - d * DAY + 6 * HOUR for d in range(10)]
+    cadence = learn_cadence(ts)
+    assert cadence.period == DAY
+    now = SUNDAY + 16 * HOUR  # outside the 06:00 window, not yet overdue
+    assert poll_interval(now, cadence, settings) == DAY / settings.polls_per_gap
+    overdue = SUNDAY + DAY + 16 * HOUR
+    assert poll_interval(overdue, cadence, settings) == DAY / settings.polls_per_gap / 2
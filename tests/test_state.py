@@ -0,0 +1,93 @@
+import os
+import sys
+import threading
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.state import StateStore, open_state
+from src.utils import read_json, write_json
+
+
+def test_mark_processed_and_lookup_by_id_or_guid(tmp_path):
+    with StateStore(str(tmp_path / "state.db")) as store:
+        assert "ep-1" not in store
+        store.mark_processed("ep-1", guid="urn:1", feed_url="https://example.org/feed.xml")
+        assert "ep-1" in store
+        assert store.is_processed(guid="urn:1")
+        assert not store.is_processed(guid="urn:2")
+        # Re-marking is idempotent
+        store.mark_processed("ep-1")
+        assert store.processed_ids() == ["ep-1"]
+        assert store.is_processed(guid="urn:1")
+
+
+def test_feed_cache_round_trip(tmp_path):
+    path = str(tmp_path / "state.db")
+    cache = {
+        "https://example.org/feed.xml": {
+            "etag": '"abc"',
+            "modified": "Mon, 10 Nov 2025 15:43:10 GMT",
+            "limit": 3,
+            "episodes": [{"guid": "urn:9", "id": "urn-9"}],
+            "last_status": 200,
+            "last_poll": 1700000000,
+        }
+    }
+    with StateStore(path) as store:
+        store.save_feed_cache(cache)
+    with StateStore(path) as store:
+        assert store.load_feed_cache() == cache
+        assert [f["last_guid"] for f in store.feeds()] == ["urn:9"]
+    assert not os.path.exists(path + "-wal") or os.path.getsize(path + "-wal") == 0
+
+
+def test_open_state_migrates_legacy_json_once(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    write_json(state_file, {"processed_ids": ["a", "b", "a"]})
+    storage = {"data_dir": str(tmp_path), "state_file": state_file}
+
+    store = open_state(storage)
+    assert store.processed_ids() == ["a", "b"]
+    store.close()
+    assert not os.path.exists(state_file)
+    assert read_json(state_file + ".migrated", {})["processed_ids"] == ["a", "b", "a"]
+
+    # A stale state.json reappearing later is not imported again
+    write_json(state_file, {"processed_ids": ["z"]})
+    with open_state(storage) as store:
+        assert "z" not in store
+
+
+def test_concurrent_marks_from_threads(tmp_path):
+    with StateStore(str(tmp_path / "state.db")) as store:
+        def worker(n):
+            for i in range(50):
+                store.mark_processed(f"ep-{n}-{i}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(store) == 200
+
+
+def test_job_stages_failures_and_pending(tmp_path):
+    with StateStore(str(tmp_path / "state.db")) as store:
+        ep = {"id": "ep-1", "guid": "urn:1", "title": "T"}
+        assert store.start_job(ep) == "discovered"
+        store.advance("ep-1", "downloaded")
+        store.job_failed("ep-1", "RuntimeError: API error")
+        # Rediscovering does not reset progress
+        assert store.start_job(ep) == "downloaded"
+        assert store.job("ep-1")["attempts"] == 1
+        assert store.job("ep-1")["error"] == "RuntimeError: API error"
+        assert store.pending_jobs() == [ep]
+        assert store.pending_jobs(max_attempts=1) == []
+
+        store.advance("ep-1", "summarised")
+        assert store.job("ep-1")["error"] is None
+        assert store.pending_jobs() == []
+        assert store.mark_published() == 1
+        assert store.job("ep-1")["stage"] == "published"
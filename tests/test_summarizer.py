@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.openai_pool import OpenAIPool
+from src.summarizer import count_tokens, extract_key_info, split_transcript
+
+
+class FakeCompletions:
+    """Stands in for `client.chat.completions`: one JSON answer per section, merged on the reduce call."""
+
+    def __init__(self, fail_first=None):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_first = fail_first
+
+    def create(self, model, messages, temperature, **kwargs):
+        body = messages[-1]["content"]
+        with self.lock:
+            self.requests.append(body)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.fail_first is not None and self.fail_first in body
+            if fail:
+                self.fail_first = None
+        try:
+            time.sleep(0.05)
+            if fail:
+                raise TimeoutError("timed out")
+            if body.startswith("Section extractions:"):
+                partials = json.loads(body.split("\n\n", 1)[1])
+                answer = {
+                    "overall_theme": " / ".join(p["overall_theme"] for p in partials),
+                    "quotes": [q for p in partials for q in p["quotes"]],
+                    "bible_passages": sorted({b for p in partials for b in p["bible_passages"]}),
+                }
+            else:
+                text = body.split("\n\n", 1)[1]
+                answer = {"overall_theme": text.split()[0], "quotes": [text.split(".")[0]], "bible_passages": ["John 3:16"]}
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(answer)))])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def fake_client(**kwargs):
+    fake = FakeCompletions(**kwargs)
+    pool = OpenAIPool(client=SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+    pool.wait = lambda retry_state: 0
+    return fake, pool
+
+
+def make_transcript(sections, sentences=20):
+    return " ".join(f"Part{s} sentence {i} about grace." for s in range(sections) for i in range(sentences))
+
+
+def test_split_transcript_respects_token_budget_and_keeps_order():
+    text = make_transcript(3)
+    sections = split_transcript(text, 60)
+    assert len(sections) > 1
+    assert all(count_tokens(s) <= 60 for s in sections)
+    assert " ".join(sections) == text
+    # A run-on "sentence" longer than the budget is split between words
+    long = "word " * 500
+    assert all(count_tokens(s) <= 60 for s in split_transcript(long, 60))
+
+
+def test_short_transcript_uses_a_single_request():
+    fake, client = fake_client()
+    data = extract_key_info("Short sermon. About hope.", "prompt", "m", map_reduce_tokens=1000, pool=client)
+    assert len(fake.requests) == 1
+    assert data["overall_theme"] == "Short"
+    assert data["follow_on_questions"] == [] and data["further_bible_passages"] == []
+
+
+def test_long_transcript_is_mapped_in_parallel_then_reduced():
+    text = make_transcript(4)
+    fake, client = fake_client(fail_first="Part2 sentence 0")
+    data = extract_key_info(text, "prompt", "m", map_reduce_tokens=100, section_tokens=len(text) // 16,
+                            max_in_flight=3, pool=client)
+    sections = split_transcript(text, len(text) // 16)
+    # One request per section, one retry for the section that timed out, and the reduce call
+    assert len(fake.requests) == len(sections) + 2
+    assert sum("Part2 sentence 0" in r for r in fake.requests) == 2
+    assert fake.max_in_flight == 3
+    assert data["overall_theme"].split(" / ") == [s.split()[0] for s in sections]
+    assert data["bible_passages"] == ["John 3:16"]
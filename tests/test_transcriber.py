@@ -0,0 +1,268 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+# Ensure project root is on sys.path so `from src...` imports work
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src import local_whisper, metrics, transcriber
+from src.cache import ChunkCache
+from src.transcriber import (OpenAIBackend, TranscriptionBackend, backend_from_config, detect_silences, have_ffmpeg,
+                             plan_segments, segment_audio, segment_on_silence, stream_segments, transcribe_chunks)
+
+
+class FakeTranscriptions:
+    """Stands in for `client.audio.transcriptions`; later chunks answer first."""
+
+    def __init__(self, fail_first=()):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = {}
+        self.fail_first = set(fail_first)
+
+    def create(self, model, file, **kwargs):
+        name = os.path.basename(file.name)
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            attempt = self.calls[name]
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            idx = int(name[6:9])
+            time.sleep(0.05 * (5 - idx))
+            if name in self.fail_first and attempt == 1:
+                raise RuntimeError("transient")
+            return SimpleNamespace(text=f" text {idx} ")
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def make_chunks(tmp_path, n):
+    paths = []
+    for i in range(n):
+        p = tmp_path / f"chunk_{i:03d}.mp3"
+        p.write_bytes(bytes([i]) * 10)
+        paths.append(str(p))
+    return paths
+
+
+def test_transcribe_chunks_parallel_and_ordered(tmp_path):
+    fake = FakeTranscriptions()
+    client = SimpleNamespace(audio=SimpleNamespace(transcriptions=fake))
+    texts = transcribe_chunks(client, "m", make_chunks(tmp_path, 5), "en", max_in_flight=3)
+    assert texts == [f"text {i}" for i in range(5)]
+    assert fake.max_in_flight == 3
+
+
+def test_transcribe_chunks_retries_only_failed_chunk(tmp_path):
+    fake = FakeTranscriptions(fail_first={"chunk_001.mp3"})
+    client = SimpleNamespace(audio=SimpleNamespace(transcriptions=fake))
+    texts = transcribe_chunks(client, "m", make_chunks(tmp_path, 3), None, max_in_flight=3)
+    assert texts == ["text 0", "text 1", "text 2"]
+    assert fake.calls == {"chunk_000.mp3": 1, "chunk_001.mp3": 2, "chunk_002.mp3": 1}
+
+
+def test_transcribe_chunks_reuses_cached_chunks(tmp_path):
+    cache = ChunkCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    chunks = make_chunks(tmp_path, 3)
+    fake = FakeTranscriptions()
+    client = SimpleNamespace(audio=SimpleNamespace(transcriptions=fake))
+    first = transcribe_chunks(client, "m", chunks, "en", cache=cache)
+
+    # Identical audio bytes: every chunk is served from the cache, nothing is uploaded
+    fake.calls.clear()
+    assert transcribe_chunks(client, "m", chunks, "en", cache=cache) == first
+    assert fake.calls == {}
+
+
+class EchoBackend(TranscriptionBackend):
+    """A local backend stand-in: answers with the chunk's file name."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def transcribe(self, path, language_hint):
+        self.calls += 1
+        return os.path.basename(path)
+
+
+def test_backends_are_selected_by_config_and_cached_apart(tmp_path):
+    backend = backend_from_config({"openai": {"transcription_model": "whisper-1"}})
+    assert isinstance(backend, OpenAIBackend) and backend.name == "whisper-1"
+    with pytest.raises(ValueError):
+        backend_from_config({"openai": {}, "transcription": {"backend": "nope"}})
+    if local_whisper.faster_whisper is None:
+        with pytest.raises(RuntimeError, match="not installed"):
+            backend_from_config({"openai": {}, "transcription": {"backend": "faster-whisper"}})
+    assert local_whisper.settings({"cpu_threads": 2, "workers": 3})["workers"] == 3
+
+    cache = ChunkCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    chunks = make_chunks(tmp_path, 2)
+    local = EchoBackend("faster-whisper/small.en/int8")
+    assert transcribe_chunks(local, "ignored", chunks, "en", cache=cache) == ["chunk_000.mp3", "chunk_001.mp3"]
+    transcribe_chunks(local, "ignored", chunks, "en", cache=cache)
+    assert local.calls == 2
+    # Same audio, different engine: not answered from the other backend's cache entries
+    other = EchoBackend("whisper-1")
+    transcribe_chunks(other, "ignored", chunks, "en", cache=cache)
+    assert other.calls == 2
+    with pytest.raises(TypeError):
+        TranscriptionBackend()
+
+
+class FakeWhisperModel:
+    """Stands in for `faster_whisper.WhisperModel` (and the batched pipeline wrapping it)."""
+
+    def __init__(self, model=None, **kwargs):
+        self.model = model
+        self.kwargs = kwargs
+        self.calls = []
+
+    def transcribe(self, path, **kwargs):
+        self.calls.append((path, kwargs))
+        segments = iter([SimpleNamespace(text=" Grace and "), SimpleNamespace(text="peace. ")])
+        return segments, SimpleNamespace(duration=12.5)
+
+
+def test_local_whisper_worker_loads_the_model_and_transcribes(monkeypatch):
+    fake = SimpleNamespace(WhisperModel=FakeWhisperModel, BatchedInferencePipeline=FakeWhisperModel)
+    monkeypatch.setattr(local_whisper, "faster_whisper", fake)
+    monkeypatch.setattr(local_whisper, "_model", None)
+    monkeypatch.setattr(local_whisper, "_batch_size", 1)
+
+    local_whisper._init_worker("small.en", "int8", 2, 8, "")
+    pipeline = local_whisper._model
+    # Batched: the pipeline wraps the CPU model
+    assert isinstance(pipeline.model, FakeWhisperModel) and pipeline.model.model == "small.en"
+    assert pipeline.model.kwargs == {"device": "cpu", "compute_type": "int8", "cpu_threads": 2, "download_root": None}
+    assert local_whisper._transcribe_file("a.mp3", "en", 5) == ("Grace and peace.", 12.5)
+    assert pipeline.calls == [("a.mp3", {"language": "en", "beam_size": 5, "vad_filter": True, "batch_size": 8})]
+
+    local_whisper._init_worker("small.en", "int8", 2, 1, "/models")
+    model = local_whisper._model
+    assert model.model == "small.en" and model.kwargs["download_root"] == "/models"
+    assert local_whisper._transcribe_file("b.mp3", None, 1) == ("Grace and peace.", 12.5)
+    assert model.calls == [("b.mp3", {"language": None, "beam_size": 1, "vad_filter": True})]
+
+
+def test_stream_segments_yields_chunks_before_download_finishes(tmp_path):
+    if not have_ffmpeg():
+        pytest.skip("ffmpeg not installed")
+    src = tmp_path / "in.mp3"
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i",
+                    "sine=frequency=440:duration=40", "-b:a", "64k", str(src)], check=True)
+    body = src.read_bytes()
+    done = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            step = len(body) // 8
+            for i in range(0, len(body), step):
+                self.wfile.write(body[i:i + step])
+                self.wfile.flush()
+                time.sleep(0.1)
+            done["at"] = time.monotonic()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        seen = []
+        for path in stream_segments(f"http://127.0.0.1:{server.server_address[1]}/a.mp3",
+                                    str(tmp_path / "chunks"), segment_seconds=10):
+            seen.append((path, time.monotonic()))
+            assert os.path.getsize(path) > 0
+    finally:
+        server.shutdown()
+    names = [os.path.basename(p) for p, _ in seen]
+    assert len(names) >= 4
+    assert names == [f"chunk_{i:03d}.mp3" for i in range(len(names))]
+    assert seen[0][1] < done["at"]
+
+
+def test_segment_audio_preprocess_shrinks_chunks(tmp_path):
+    if not have_ffmpeg():
+        pytest.skip("ffmpeg not installed")
+    src = tmp_path / "in.mp3"
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i",
+                    "sine=frequency=300:duration=30", "-ac", "2", "-b:a", "192k", str(src)], check=True)
+
+    plain = segment_audio(str(src), str(tmp_path / "plain"), 20)
+    small = segment_audio(str(src), str(tmp_path / "small"), 20,
+                          preprocess={"enabled": True, "format": "opus", "bitrate": "16k", "trim_silence": True})
+    assert all(p.endswith(".ogg") for p in small)
+    assert sum(map(os.path.getsize, small)) * 4 < sum(map(os.path.getsize, plain))
+
+
+def test_plan_segments_cuts_in_pauses_near_target():
+    silences = [(100, 101), (290, 291), (330, 331), (640, 642), (1190, 1191)]
+    plan = plan_segments(silences, 1200, target=300, min_seconds=200, max_seconds=400)
+    # 290.5 is closer to 300 than 330.5; 640-642 is within range of the next target (590.5)
+    assert plan == [(0, 290.5), (290.5, 641.0), (641.0, 941.0), (941.0, 1200)]
+    assert all(200 <= end - start <= 400 for start, end in plan)
+
+    # Nothing left that would make a tiny final chunk: the pause at 1190.5 is never chosen
+    assert all(end != 1190.5 for _, end in plan)
+
+    # No pause at all: the fallback cut never leaves a short final chunk either
+    assert plan_segments([], 790, 600, 420, 780) == [(0, 395.0), (395.0, 790)]
+    assert plan_segments([], 1500, 600, 420, 780) == [(0, 600), (600, 1050.0), (1050.0, 1500)]
+
+
+def test_segment_on_silence_returns_offsets(tmp_path):
+    if not have_ffmpeg():
+        pytest.skip("ffmpeg not installed")
+    src = tmp_path / "in.mp3"
+    # A tone with a 1.2s pause every 23 seconds
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i",
+                    "sine=f=300:d=100,volume='if(between(mod(t,23),20,21.2),0,1)':eval=frame",
+                    "-b:a", "64k", str(src)], check=True)
+    chunks = list(segment_on_silence(str(src), str(tmp_path / "chunks"), 30, 15, 45))
+    assert [round(c["start"]) for c in chunks] == [0, 21, 44, 67]
+    assert all(os.path.getsize(c["path"]) > 0 for c in chunks)
+    assert chunks[-1]["end"] == pytest.approx(100, abs=0.2)
+
+
+def test_trim_silence_only_trims_chunk_ends_and_keeps_offsets(tmp_path, monkeypatch, caplog):
+    if not have_ffmpeg():
+        pytest.skip("ffmpeg not installed")
+    src = tmp_path / "in.mp3"
+    # 3s silence, 5s tone, 4s pause, 5s tone, 4s silence
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i",
+                    "sine=f=300:d=21,volume='if(lt(t,3)+between(t,8,12)+gt(t,17),0,1)':eval=frame",
+                    "-b:a", "64k", str(src)], check=True)
+    pre = {"enabled": True, "format": "opus", "bitrate": "24k", "trim_silence": True}
+
+    (chunk,) = segment_on_silence(str(src), str(tmp_path / "trimmed"), 60, 10, 90, preprocess=pre)
+    assert chunk["start"] == 0
+    silences, duration = detect_silences(chunk["path"])
+    # Both ends trimmed to about half a second; the pause in the middle survives
+    assert duration == pytest.approx(15, abs=0.6)
+    assert any(end - start > 3 for start, end in silences)
+
+    # A continuous segmenter stream is never trimmed: chunk i still starts at i * segment_seconds,
+    # and the ignored setting is warned about
+    monkeypatch.setattr(transcriber, "_trim_warned", False)
+    run = metrics.start_run("test")
+    with caplog.at_level(logging.WARNING, logger="transcriber"):
+        chunks = segment_audio(str(src), str(tmp_path / "fixed"), 7, preprocess=dict(pre, format="mp3"))
+    assert sum(detect_silences(c)[1] for c in chunks) == pytest.approx(21, abs=0.3)
+    assert "trim_silence is ignored" in caplog.text
+    # Bytes in and out of preprocessing go into the run report
+    assert run.counters["preprocess_bytes_in"] == os.path.getsize(src)
+    assert run.counters["preprocess_bytes_out"] == sum(os.path.getsize(c) for c in chunks)